@@ -0,0 +1,268 @@
+# import modules
+import sys
+import types
+
+import numpy as np
+
+
+class Vector:
+
+    def __init__(self, values):
+        """
+        Minimal stand-in for mathutils.Vector, backed by a float numpy array.
+        """
+        self.values = np.array(values, dtype=np.float64)
+
+    def __array__(self, dtype=None, copy=None):
+        # np.array of a mathutils object is a copy, the callers may modify it.
+        return self.values.astype(np.float64 if dtype is None else dtype)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __iter__(self):
+        return iter(self.values.tolist())
+
+    def __len__(self):
+        return len(self.values)
+
+    def __neg__(self):
+        return Vector(-self.values)
+
+    def __sub__(self, other):
+        return Vector(self.values - np.asarray(other))
+
+    def __add__(self, other):
+        return Vector(self.values + np.asarray(other))
+
+    @property
+    def x(self):
+        return float(self.values[0])
+
+    @property
+    def y(self):
+        return float(self.values[1])
+
+    @property
+    def z(self):
+        return float(self.values[2])
+
+
+class Matrix:
+
+    def __init__(self, rows):
+        """
+        Minimal stand-in for a 4x4 mathutils.Matrix, backed by a float numpy array.
+        """
+        self.values = np.array(rows, dtype=np.float64)
+
+    def __array__(self, dtype=None, copy=None):
+        # np.array of a mathutils object is a copy, the callers may modify it.
+        return self.values.astype(np.float64 if dtype is None else dtype)
+
+    def __getitem__(self, index):
+        return Vector(self.values[index])
+
+    def __iter__(self):
+        return (Vector(row) for row in self.values)
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self.values @ other.values)
+        values = np.asarray(other, dtype=np.float64)
+        if len(values) == 3:
+            return Vector(self.values[:3, :3] @ values + self.values[:3, 3])
+        return Vector(self.values @ values)
+
+    def normalized(self):
+        values = self.values.copy()
+        values[:3, :3] /= np.linalg.norm(values[:3, :3], axis=0)
+        return Matrix(values)
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self.values))
+
+    def decompose(self):
+        scale = np.linalg.norm(self.values[:3, :3], axis=0)
+        rotation = self.values[:3, :3] / scale
+        # Quaternion (w, x, y, z) of the rotation matrix.
+        w = np.sqrt(max(0.0, 1.0 + np.trace(rotation))) / 2
+        x = np.copysign(np.sqrt(max(0.0, 1.0 + rotation[0, 0] - rotation[1, 1] - rotation[2, 2])) / 2, rotation[2, 1] - rotation[1, 2])
+        y = np.copysign(np.sqrt(max(0.0, 1.0 - rotation[0, 0] + rotation[1, 1] - rotation[2, 2])) / 2, rotation[0, 2] - rotation[2, 0])
+        z = np.copysign(np.sqrt(max(0.0, 1.0 - rotation[0, 0] - rotation[1, 1] + rotation[2, 2])) / 2, rotation[1, 0] - rotation[0, 1])
+        return Vector(self.values[:3, 3]), Vector([w, x, y, z]), Vector(scale)
+
+    @property
+    def translation(self):
+        return Vector(self.values[:3, 3])
+
+
+class Stub:
+    """
+    Accepts any attribute access and call, for the parts of the blender api the benchmarks never reach.
+    """
+
+    def __getattr__(self, name):
+        return Stub()
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+
+class MeshVertices:
+
+    def __init__(self, coordinates):
+        self.coordinates = coordinates
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def foreach_get(self, attribute, array):
+        assert attribute == 'co'
+        array[:] = self.coordinates.ravel()
+
+
+class Mesh:
+
+    def __init__(self, coordinates):
+        self.vertices = MeshVertices(coordinates)
+
+
+class MeshObject:
+
+    def __init__(self, name, coordinates, matrix_world):
+        """
+        Mesh object with object local vertex coordinates, no modifiers and a fixed world matrix.
+        """
+        self.name = name
+        self.type = 'MESH'
+        self.data = Mesh(coordinates)
+        self.modifiers = []
+        self.matrix_world = Matrix(matrix_world)
+        self.location = self.matrix_world.translation
+        self.hide_render = False
+
+    def to_mesh(self, preserve_all_data_layers=False):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+
+class CameraData:
+
+    def __init__(self, lens=50.0, sensor_width=36.0):
+        self.type = 'PERSP'
+        self.lens = lens
+        self.sensor_width = sensor_width
+        self.dof = types.SimpleNamespace(use_dof=False, focus_distance=10.0)
+
+    def view_frame(self, scene=None):
+        # Corners of the frame at depth 1: top right, bottom right, bottom left, top left.
+        render = scene.render
+        half_x = self.sensor_width / (2 * self.lens)
+        half_y = half_x * render.resolution_y / render.resolution_x
+        return [Vector([half_x, half_y, -1.0]), Vector([half_x, -half_y, -1.0]),
+                Vector([-half_x, -half_y, -1.0]), Vector([-half_x, half_y, -1.0])]
+
+
+class CameraObject:
+
+    def __init__(self, name='Camera', location=(0.0, -3.0, 1.5), target=(0.0, 0.0, 0.0)):
+        """
+        Camera at location looking at target, the camera looks down its local -Z axis with Y up.
+        """
+        self.name = name
+        self.type = 'CAMERA'
+        self.data = CameraData()
+        self.modifiers = []
+        self.matrix_world = Matrix(get_look_at_matrix(location, target))
+        self.location = self.matrix_world.translation
+
+
+def get_look_at_matrix(location, target, up=(0.0, 0.0, 1.0)):
+    location = np.asarray(location, dtype=np.float64)
+    z_axis = location - np.asarray(target, dtype=np.float64)
+    z_axis /= np.linalg.norm(z_axis)
+    x_axis = np.cross(up, z_axis)
+    x_axis /= np.linalg.norm(x_axis)
+    y_axis = np.cross(z_axis, x_axis)
+    matrix = np.eye(4)
+    matrix[:3, 0], matrix[:3, 1], matrix[:3, 2], matrix[:3, 3] = x_axis, y_axis, z_axis, location
+    return matrix
+
+
+def make_mesh_object(name, num_vertices, seed=0, size=0.1):
+    """
+    Returns a mesh object with num_vertices points on an ellipsoid of about size meters, slightly rotated
+    and moved from the origin.
+    """
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(num_vertices, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    coordinates = (directions * np.array([1.0, 0.6, 0.3]) * size).astype(np.float32)
+
+    angle = 0.3
+    matrix_world = np.eye(4)
+    matrix_world[:3, :3] = [[np.cos(angle), -np.sin(angle), 0.0], [np.sin(angle), np.cos(angle), 0.0], [0.0, 0.0, 1.0]]
+    matrix_world[:3, 3] = [0.05, -0.02, 0.1]
+    return MeshObject(name, coordinates, matrix_world)
+
+
+def make_scene(res_x=640, res_y=480):
+    render = types.SimpleNamespace(resolution_x=res_x, resolution_y=res_y, resolution_percentage=100,
+                                   filepath='', pixel_aspect_x=1.0, pixel_aspect_y=1.0)
+    return types.SimpleNamespace(render=render, objects={}, frame_current=0)
+
+
+def install():
+    """
+    Registers the bpy, bpy_extras, bmesh and mathutils stand-ins in sys.modules and returns the bpy module.
+
+    The scene holds a camera named 'Camera', mesh objects are added with add_object.
+    """
+    if 'bpy' in sys.modules and getattr(sys.modules['bpy'], 'IS_FAKE', False):
+        return sys.modules['bpy']
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    mathutils.Euler = Vector
+    mathutils.Color = Vector
+
+    scene = make_scene()
+    camera = CameraObject()
+    scene.objects[camera.name] = camera
+
+    bpy = types.ModuleType('bpy')
+    bpy.IS_FAKE = True
+    bpy.context = types.SimpleNamespace(scene=scene, evaluated_depsgraph_get=lambda: None,
+                                        view_layer=types.SimpleNamespace(update=lambda: None))
+    bpy.data = types.SimpleNamespace(objects=scene.objects, cameras={camera.name: camera.data},
+                                     lights={'Sun': types.SimpleNamespace(energy=3.0)},
+                                     materials=Stub(), images=Stub(), node_groups=Stub())
+    bpy.ops = Stub()
+    bpy.types = Stub()
+    bpy.props = Stub()
+
+    bpy_extras = types.ModuleType('bpy_extras')
+    bpy_extras.object_utils = Stub()
+    bmesh = types.ModuleType('bmesh')
+    bmesh.new = Stub()
+    bmesh.ops = Stub()
+    bmesh.types = Stub()
+
+    sys.modules.update({'bpy': bpy, 'mathutils': mathutils, 'bpy_extras': bpy_extras,
+                        'bpy_extras.object_utils': bpy_extras.object_utils, 'bmesh': bmesh})
+    return bpy
+
+
+def add_object(obj):
+    """
+    Adds a mesh object to the fake scene.
+    """
+    sys.modules['bpy'].data.objects[obj.name] = obj
+    return obj
@@ -0,0 +1,334 @@
+# import modules
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# The benchmarks import the modules of src/ with the blender stand-ins, no blender install is needed.
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'src'))
+
+import fake_blender
+
+fake_blender.install()
+
+# import custom modules
+import mesh_utils
+import texture_utils
+from object_detection_bop import ObjectDetectionBop
+from dataset_helpers import Dataset_helper
+from io_utils import AsyncJsonWriter
+from regression_utils import RegressionDatasetGeneration
+from uncertainty_utils import get_uncertainty_table
+
+
+def run_benchmark(name, function, min_time=0.5, vertices=None):
+    """
+    Calls the function repeatedly for at least min_time seconds and measures the peak memory of one call.
+
+    returns: dict with the name, vertex count, calls per second, mean time and peak memory
+    """
+    # Warm up the caches the function relies on, eg: the compiled fuzzy tables.
+    function()
+
+    num_calls = 0
+    start_time = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        function()
+        num_calls += 1
+        elapsed = time.perf_counter() - start_time
+
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"name": name,
+            "vertices": vertices,
+            "ops_per_sec": round(num_calls / elapsed, 2),
+            "mean_us": round(1e6 * elapsed / num_calls, 2),
+            "peak_kb": round(peak_memory / 1024, 2)}
+
+
+def make_texture_dir(root_dir, num_textures):
+    """
+    Creates texture folders with empty PBR map files, eg: texture_0001/texture_0001_basecolor.jpg
+    """
+    texture_dir = os.path.join(root_dir, 'textures')
+    for i in range(num_textures):
+        folder = os.path.join(texture_dir, f'texture_{i:04d}')
+        os.makedirs(folder, exist_ok=True)
+        for map_name in ('basecolor', 'normal', 'roughness', 'height', 'ao', 'metallic'):
+            open(os.path.join(folder, f'texture_{i:04d}_{map_name}.jpg'), 'w').close()
+    return texture_dir
+
+
+def get_regression_annotations(rng):
+    # Same layout as the per image json file of the regression dataset.
+    return {"image_path": "/results/ycb_distance/crackerbox/images/000123.png",
+            "obj_name": "crackerbox",
+            "Total_num_classes": 21,
+            "objects_location": {"x": rng.random(), "y": rng.random(), "z": rng.random()},
+            "objects_rotation": {"x": rng.random(), "y": rng.random(), "z": rng.random()},
+            "light_value": rng.random(),
+            "cameras_location": {"x": rng.random(), "y": rng.random(), "z": rng.random()},
+            "cameras_rotation": {"w": rng.random(), "x": rng.random(), "y": rng.random(), "z": rng.random()},
+            "focal_length": 50.0,
+            "blur_value": 10.0,
+            "cam_distance_3d": -38.0,
+            "annotations": {"label": "1", "cx": str(rng.random()), "cy": str(rng.random()), "w": "0.1",
+                            "x": "0.2", "y": "0.3", "z": "0.4", "distance": "1.2"}}
+
+
+def run_mesh_benchmarks(vertex_counts, min_time):
+    regression_helper = RegressionDatasetGeneration()
+    camera = sys.modules['bpy'].data.objects['Camera']
+    results = []
+
+    for num_vertices in vertex_counts:
+        obj = fake_blender.add_object(fake_blender.make_mesh_object(f'mesh_{num_vertices}', num_vertices))
+        mesh_utils.clear_object_geometry()
+        mesh_utils.mesh_cache.clear()
+
+        def find_bounding_box_uncached():
+            mesh_utils.mesh_cache.clear()
+            regression_helper.find_bounding_box(obj, camera=camera)
+
+        results.append(run_benchmark('find_bounding_box (mesh cache miss)', find_bounding_box_uncached,
+                                     min_time=min_time, vertices=num_vertices))
+        results.append(run_benchmark('find_bounding_box (mesh cache hit)',
+                                     lambda: regression_helper.find_bounding_box(obj, camera=camera),
+                                     min_time=min_time, vertices=num_vertices))
+
+        def get_pca_uncached():
+            mesh_utils.mesh_cache.clear()
+            regression_helper.get_pca_direction_centroid_location(obj.name, return_vertices=True)
+
+        results.append(run_benchmark('get_pca_direction_centroid_location (no cache)', get_pca_uncached,
+                                     min_time=min_time, vertices=num_vertices))
+        mesh_utils.pca_cache.add_object(obj)
+        results.append(run_benchmark('get_pca_direction_centroid_location (pca cache)',
+                                     lambda: regression_helper.get_pca_direction_centroid_location(obj.name, return_vertices=False),
+                                     min_time=min_time, vertices=num_vertices))
+        # Constant cost per frame, the keypoints are sampled once per model.
+        mesh_utils.keypoint_cache.add_object(obj)
+        scene = sys.modules['bpy'].context.scene
+        results.append(run_benchmark('get_keypoint_annotations',
+                                     lambda: mesh_utils.get_keypoint_annotations(obj, camera, scene),
+                                     min_time=min_time, vertices=num_vertices))
+        mesh_utils.clear_object_geometry()
+
+        # One call per vertex, as the projection of a point cloud would.
+        points = mesh_utils.transform_vertices(mesh_utils.get_mesh_vertices(obj), np.array(obj.matrix_world))[:1000]
+        view_matrix = mesh_utils.get_world_to_camera_matrix(camera)
+        projection_matrix = np.array([[2.78, 0.0, 0.0, 0.0], [0.0, 3.70, 0.0, 0.0],
+                                      [0.0, 0.0, -1.0, -0.2], [0.0, 0.0, -1.0, 0.0]])
+
+        def project_points():
+            for point in points:
+                regression_helper.project_3d_to_2d(point, view_matrix, projection_matrix)
+
+        results.append(run_benchmark(f'project_3d_to_2d ({len(points)} points)', project_points,
+                                     min_time=min_time, vertices=num_vertices))
+        results.append(run_benchmark(f'mesh_utils.project_points ({len(points)} points)',
+                                     lambda: mesh_utils.project_points(points, view_matrix=view_matrix,
+                                                                       projection_matrix=projection_matrix),
+                                     min_time=min_time, vertices=num_vertices))
+        results.append(run_benchmark(f'mesh_utils.world_to_camera_view ({len(points)} points)',
+                                     lambda: mesh_utils.world_to_camera_view(points, camera, sys.modules['bpy'].context.scene),
+                                     min_time=min_time, vertices=num_vertices))
+    return results
+
+
+def run_bop_benchmarks(num_objects, num_vertices, min_time):
+    """
+    Annotations of a BOP frame with num_objects objects, per object and batched.
+    """
+    bpy = sys.modules['bpy']
+    camera = bpy.data.objects['Camera']
+    camera.data.sensor_height = 24.0
+    camera.data.sensor_fit = 'AUTO'
+    rng = np.random.default_rng(0)
+
+    object_names = []
+    for i in range(num_objects):
+        obj = fake_blender.make_mesh_object(f'bop_{i}', num_vertices, seed=i)
+        obj.matrix_world.values[:3, 3] = rng.uniform(-0.5, 0.5, 3)
+        fake_blender.add_object(obj)
+        mesh_utils.hull_cache.hulls[obj.name] = obj.data.vertices.coordinates
+        object_names.append(obj.name)
+    mesh2class = {obj_name: i + 1 for i, obj_name in enumerate(object_names)}
+
+    detection_helper = ObjectDetectionBop.__new__(ObjectDetectionBop)
+    detection_helper.scene = bpy.context.scene
+
+    def annotate_per_object():
+        detection_helper.get_scene_camera_parameters(camera_object=camera)
+        detection_helper.get_scene_gt_parameters(object_names=object_names, camera_object=camera, mesh2class=mesh2class)
+        with contextlib.redirect_stdout(io.StringIO()):
+            detection_helper.get_scene_gt_info_parameters(object_names=object_names, camera=camera, mesh2class=mesh2class)
+
+    results = [run_benchmark(f'BOP frame annotations per object ({num_objects} objects)', annotate_per_object,
+                             min_time=min_time, vertices=num_vertices),
+               run_benchmark(f'BOP frame annotations batched ({num_objects} objects)',
+                             lambda: detection_helper.get_frame_annotations(object_names=object_names, camera_object=camera,
+                                                                            mesh2class=mesh2class),
+                             min_time=min_time, vertices=num_vertices)]
+    mesh_utils.clear_object_geometry()
+    return results
+
+
+def run_texture_benchmarks(num_textures, min_time):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        texture_dir = make_texture_dir(temp_dir, num_textures)
+        manifest_path = os.path.join(texture_dir, texture_utils.TextureIndex.MANIFEST_NAME)
+
+        def build_index():
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            texture_utils.TextureIndex(texture_dir)
+
+        results.append(run_benchmark(f'TextureIndex scan ({num_textures} folders)', build_index, min_time=min_time))
+        results.append(run_benchmark(f'TextureIndex manifest load ({num_textures} folders)',
+                                     lambda: texture_utils.TextureIndex(texture_dir), min_time=min_time))
+
+        texture_paths = texture_utils.get_texture_index(texture_dir).texture_paths
+        results.append(run_benchmark('get_texture_map_paths',
+                                     lambda: texture_utils.get_texture_map_paths(texture_paths[len(texture_paths) // 2]),
+                                     min_time=min_time))
+    return results
+
+
+def run_uncertainty_benchmarks(min_time):
+    dataset_helper = Dataset_helper()
+    rng = np.random.default_rng(0)
+    focal_lengths = rng.uniform(40, 110, 1000)
+    light_values = rng.uniform(0, 20, 1000)
+    results = []
+
+    results.append(run_benchmark('compute_uncertianty_distance',
+                                 lambda: dataset_helper.compute_uncertianty_distance(focal_lengths[rng.integers(1000)]),
+                                 min_time=min_time))
+    results.append(run_benchmark('compute_uncertianty_lighting',
+                                 lambda: dataset_helper.compute_uncertianty_lighting(light_values[rng.integers(1000)]),
+                                 min_time=min_time))
+    # The fuzzy simulation the lookup tables are compiled from, as a reference.
+    results.append(run_benchmark('skfuzzy simulation (distance)',
+                                 lambda: get_uncertainty_table('distance').simulate(focal_lengths[rng.integers(1000)]),
+                                 min_time=min_time))
+    return results
+
+
+def run_json_benchmarks(min_time, file_latency=0.005, render_time=0.02):
+    rng = np.random.default_rng(0)
+    annotations = get_regression_annotations(rng)
+    results = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_file_path = os.path.join(temp_dir, 'json_files', '000123.json')
+        os.makedirs(os.path.dirname(json_file_path))
+
+        def write_json():
+            with open(json_file_path, 'w') as json_file:
+                json.dump(annotations, json_file, indent=4)
+
+        results.append(run_benchmark('json.dump annotations', write_json, min_time=min_time))
+
+        writer = AsyncJsonWriter()
+        results.append(run_benchmark('AsyncJsonWriter.write (queue only)',
+                                     lambda: writer.write(json_file_path, annotations), min_time=min_time))
+        writer.flush()
+
+        def write_and_flush():
+            writer.write(json_file_path, annotations)
+            writer.flush()
+
+        results.append(run_benchmark('AsyncJsonWriter.write + flush', write_and_flush, min_time=min_time))
+        writer.close()
+
+        results += run_slow_filesystem_benchmarks(json_file_path, annotations, min_time, file_latency, render_time)
+    return results
+
+
+class SlowFilesystemJsonWriter(AsyncJsonWriter):
+
+    def __init__(self, file_latency):
+        """
+        AsyncJsonWriter whose files take file_latency seconds to open and close, like a network filesystem.
+        """
+        super().__init__()
+        self.file_latency = file_latency
+
+    def write_file(self, file_path, text, encoding=None):
+        time.sleep(self.file_latency)
+        super().write_file(file_path, text, encoding=encoding)
+
+
+def run_slow_filesystem_benchmarks(json_file_path, annotations, min_time, file_latency, render_time):
+    """
+    Time of one frame (a render of render_time seconds, which releases the GIL, and its json file) when every
+    file takes file_latency seconds to open and close, eg: on NFS. The writer thread hides the file latency,
+    the json encoding still runs on the render thread.
+    """
+    results = []
+    label = f'{1e3 * file_latency:g} ms file latency, {1e3 * render_time:g} ms render'
+
+    def render_and_dump():
+        time.sleep(render_time)
+        time.sleep(file_latency)
+        with open(json_file_path, 'w') as json_file:
+            json.dump(annotations, json_file, indent=4)
+
+    results.append(run_benchmark(f'frame + json.dump ({label})', render_and_dump, min_time=min_time))
+
+    writer = SlowFilesystemJsonWriter(file_latency)
+
+    def render_and_queue():
+        time.sleep(render_time)
+        writer.write(json_file_path, annotations)
+
+    results.append(run_benchmark(f'frame + AsyncJsonWriter.write ({label})', render_and_queue, min_time=min_time))
+    writer.close()
+    return results
+
+
+def print_results(results):
+    print(f"\n{'benchmark':<52} {'vertices':>9} {'ops/sec':>12} {'mean us':>12} {'peak KB':>10}")
+    print('--'*50)
+    for result in results:
+        vertices = '' if result['vertices'] is None else result['vertices']
+        print(f"{result['name']:<52} {vertices:>9} {result['ops_per_sec']:>12.1f} {result['mean_us']:>12.1f} {result['peak_kb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the annotation hot paths without blender.")
+    parser.add_argument('--vertices', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="vertex counts of the synthetic meshes")
+    parser.add_argument('--num_textures', type=int, default=200)
+    parser.add_argument('--min_time', type=float, default=0.5, help="seconds per benchmark")
+    parser.add_argument('--file_latency', type=float, default=0.005,
+                        help="seconds to open and close a json file in the slow filesystem benchmarks")
+    parser.add_argument('--render_time', type=float, default=0.02, help="seconds per frame in the slow filesystem benchmarks")
+    parser.add_argument('--output', default=None, help="path of a json file for saving the results")
+    args = parser.parse_args()
+
+    results = []
+    results += run_mesh_benchmarks(args.vertices, args.min_time)
+    results += run_bop_benchmarks(21, 1000, args.min_time)
+    results += run_texture_benchmarks(args.num_textures, args.min_time)
+    results += run_uncertainty_benchmarks(args.min_time)
+    results += run_json_benchmarks(args.min_time, args.file_latency, args.render_time)
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump({"python": sys.version, "numpy": np.__version__, "results": results}, json_file, indent=4)
@@ -0,0 +1,228 @@
+# import modules
+import json
+import os
+
+import numpy as np
+
+# Formats of the consolidated annotation files, "json" keeps one json file per image.
+ANNOTATION_FORMATS = ('json', 'jsonl', 'npz')
+
+
+def flatten_record(record, prefix=''):
+    """
+    Flattens the nested dicts of an annotation record into dotted keys, eg: objects_location.x
+    """
+    flat_record = {}
+    for key, value in record.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat_record.update(flatten_record(value, prefix=f'{name}.'))
+        elif isinstance(value, (list, tuple)):
+            # Nested lists are flattened as well, eg: annotations.keypoints_2d.0.1
+            flat_record.update(flatten_record({str(i): item for i, item in enumerate(value)}, prefix=f'{name}.'))
+        elif value == '':
+            # Objects which are not in view have no annotations.
+            continue
+        else:
+            flat_record[name] = value
+    return flat_record
+
+
+def get_column_array(values):
+    """
+    Returns a float array for numeric columns, with NaN for the missing values, else a str array with ''.
+    """
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, (bool, int, float, np.number)) for value in present):
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=float)
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+
+class AnnotationGroup:
+
+    def __init__(self, file_path, store_format):
+        """
+        Annotations of one json_files folder, written to a single jsonl or npz file.
+
+        The jsonl file gets one line per image and is flushed after every line. The npz file holds one
+        column per flattened field and is rewritten by save. Existing files are continued, so a resumed
+        render appends to them.
+
+        Keyword arguments:
+            file_path -- path of the annotation file without the extension: str
+            store_format -- 'jsonl' or 'npz': str
+        """
+        self.store_format = store_format
+        self.file_path = f'{file_path}.{store_format}'
+        self.index_path = f'{file_path}_index.json'
+        # image path -> row
+        self.index = {}
+        self.records = []
+        self.file = None
+
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        if store_format == 'jsonl':
+            self.load_jsonl()
+        else:
+            self.load_npz()
+
+    def load_jsonl(self):
+        valid_size = 0
+        self.num_rows = 0
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'rb') as annotation_file:
+                for line in annotation_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Last line of a file written during a crash.
+                        break
+                    self.index[record['image_path']] = self.num_rows
+                    self.num_rows += 1
+                    valid_size += len(line)
+        self.file = open(self.file_path, 'ab')
+        self.file.truncate(valid_size)
+
+    def load_npz(self):
+        if not os.path.exists(self.file_path):
+            return
+        with np.load(self.file_path) as data:
+            columns = {name: data[name] for name in data.files}
+        for row in range(len(columns['image_path'])):
+            record = {}
+            for name, values in columns.items():
+                value = values[row]
+                if (values.dtype.kind == 'f' and np.isnan(value)) or (values.dtype.kind == 'U' and value == ''):
+                    continue
+                record[name] = value.item()
+            self.records.append(record)
+            self.index[record['image_path']] = row
+
+    def add(self, record):
+        """
+        Adds the annotation record of an image, returns its row.
+        """
+        image_path = str(record['image_path'])
+        if self.store_format == 'jsonl':
+            self.file.write((json.dumps(record) + '\n').encode('utf-8'))
+            self.file.flush()
+            row = self.num_rows
+            self.num_rows += 1
+        else:
+            row = self.index.get(image_path, len(self.records))
+            if row == len(self.records):
+                self.records.append(flatten_record(record))
+            else:
+                # A render repeated after a crash replaces its row.
+                self.records[row] = flatten_record(record)
+        self.index[image_path] = row
+        return row
+
+    def save(self):
+        """
+        Writes the npz file and the index, the files are written to a temporary file first.
+        """
+        if self.store_format == 'npz' and self.records:
+            names = sorted(set().union(*self.records))
+            columns = {name: get_column_array([record.get(name) for record in self.records]) for name in names}
+            temp_path = self.file_path + '.tmp.npz'
+            np.savez(temp_path, **columns)
+            os.replace(temp_path, self.file_path)
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self.index, index_file, indent=4)
+        os.replace(temp_path, self.index_path)
+
+    def close(self):
+        self.save()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class AnnotationStore:
+
+    def __init__(self, store_format='jsonl', shard_index=None):
+        """
+        Writes the annotations of a json_files folder into one file instead of one json file per image.
+
+        The annotations of output_dir/<test case>/<object>/json_files/ are written to
+        output_dir/<test case>/<object>/json_files.jsonl (or .npz), along with json_files_index.json
+        which maps the image path to the row in the file. The records have the same fields as the per-image
+        json files, the npz columns are the fields flattened to dotted names, eg: annotations.cx
+
+        Keyword arguments:
+            store_format -- 'jsonl' or 'npz': str
+            shard_index -- every shard writes to its own files: int
+        """
+        assert store_format in ('jsonl', 'npz'), f"Unknown annotation format : {store_format}"
+        self.store_format = store_format
+        self.suffix = '' if shard_index is None else f'_shard_{shard_index}'
+        self.groups = {}
+        self.pending = []
+
+    def add(self, json_file_path, record, on_written=None):
+        """
+        Adds the record which would be written to json_file_path.
+
+        The npz file of a folder is only written when the next folder starts or the store is flushed,
+        on_written is called once the record is on disk, eg: recording the render in the journal.
+
+        Keyword arguments:
+            json_file_path -- path of the per-image json file: str
+            record -- annotations of the image, the dict must contain image_path
+            on_written -- function called after the record is written
+        """
+        json_folder = os.path.dirname(str(json_file_path))
+        if json_folder not in self.groups:
+            # The renders go through the folders one after another, the finished folder is saved.
+            self.flush()
+            self.close_groups()
+            self.groups[json_folder] = AnnotationGroup(json_folder + self.suffix, self.store_format)
+        self.groups[json_folder].add(record)
+
+        if on_written is not None:
+            if self.store_format == 'jsonl':
+                on_written()
+            else:
+                self.pending.append(on_written)
+
+    def journal_paths(self, image_path):
+        """
+        Returns the paths recorded in the journal for a render, the consolidated files grow with every image.
+        """
+        return [image_path]
+
+    def flush(self):
+        for group in self.groups.values():
+            group.save()
+        pending, self.pending = self.pending, []
+        for on_written in pending:
+            on_written()
+
+    def close_groups(self):
+        for group in self.groups.values():
+            group.close()
+        self.groups = {}
+
+    def close(self):
+        self.flush()
+        self.close_groups()
+
+
+def get_annotation_store(json_object, shard_index=0, num_shards=1):
+    """
+    Returns the annotation store for the "annotation_format" of the requirements file, or None for "json"
+    which writes one json file per image.
+
+    Keyword arguments:
+        json_object -- json object which contains the data from requirements file: dict
+        shard_index -- index of the shard: int
+        num_shards -- number of shards rendering the dataset: int
+    """
+    store_format = str(json_object.get('annotation_format', 'json'))
+    assert store_format in ANNOTATION_FORMATS, f"annotation_format should be one of {ANNOTATION_FORMATS}"
+    if store_format == 'json':
+        return None
+    return AnnotationStore(store_format=store_format, shard_index=shard_index if num_shards > 1 else None)
@@ -0,0 +1,259 @@
+# import modules
+import glob
+import hashlib
+import json
+import os
+
+import bpy
+import numpy as np
+
+# import custom modules
+import mesh_utils
+
+# Bump when the normalization of the imported models changes, old cache entries are ignored then.
+ASSET_CACHE_VERSION = 1
+
+
+def find_obj_files(models_dir):
+    """
+    Returns the sorted paths of all the .obj files below the models directory.
+    """
+    obj_files = []
+    # Iterate through all subdirectories in the base path
+    for root, dirs, files in os.walk(models_dir):
+        for file in files:
+            # Check if the file is an OBJ file
+            if file.endswith(".obj"):
+                obj_files.append(os.path.join(root, file))
+    return sorted(obj_files)
+
+
+def get_obj_name(object_file, dataset_name):
+    """
+    Returns the object name for the model file, eg: 'crackerbox' for ycb models.
+
+    Keyword arguments:
+        object_file -- path of the .obj file: str
+        dataset_name -- 'ycb' or 'robocup': str
+    """
+    if dataset_name == 'robocup':
+        return object_file.split('/')[-1].split('.')[0]
+    elif dataset_name == 'ycb':
+        return "".join(object_file.split('/')[-3].split('_')[1::])
+    raise NameError("Provide valid dataset name -- ycb or robocup")
+
+
+def get_model_hash(object_file, **parameters):
+    """
+    Returns a content hash for the OBJ model and the parameters used to normalize it.
+
+    The .mtl files next to the model are part of the hash since they define its materials.
+
+    Keyword arguments:
+        object_file -- path of the .obj file: str
+        parameters -- normalization parameters, eg: target_object_size
+    """
+    digest = hashlib.sha1()
+    digest.update(str(ASSET_CACHE_VERSION).encode('utf-8'))
+    digest.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+    model_files = [object_file] + sorted(glob.glob(os.path.join(os.path.dirname(object_file), '*.mtl')))
+    for model_file in model_files:
+        with open(model_file, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def import_obj_file(object_file, obj_name):
+    """
+    Imports the OBJ file and returns the imported object renamed to obj_name, or None.
+    """
+    bpy.ops.import_scene.obj(filepath=object_file)
+
+    # Set the active object to the imported object
+    imported_object = bpy.context.selected_objects[-1]
+    if imported_object is None:
+        return None
+    # Rename the new object
+    imported_object.name = str(obj_name)
+    return imported_object
+
+
+def set_origin_to_bounds_center(obj):
+    """
+    Sets the origin of the object to the center of its bounds and resets its transform.
+    """
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_VOLUME', center='BOUNDS')
+    obj.location = (0.0, 0.0, 0.0)
+    obj.rotation_euler = (0.0, 0.0, 0.0)
+
+
+def import_obj_model(object_file, obj_name, target_object_size):
+    """
+    Imports a single OBJ model, scales it to the target size and sets its origin to the center of the bounds.
+
+    Keyword arguments:
+        object_file -- path of the .obj file: str
+        obj_name -- name for the imported object: str
+        target_object_size -- size of the largest dimension of the object: float
+    """
+    imported_object = import_obj_file(object_file, obj_name)
+    if imported_object is None:
+        return None
+
+    # Calculate the scale factor to achieve the target size
+    scale_factor = target_object_size / max(imported_object.dimensions)
+    imported_object.scale = (scale_factor, scale_factor, scale_factor)
+
+    set_origin_to_bounds_center(imported_object)
+    return imported_object
+
+
+def import_obj_model_with_dimensions(object_file, obj_name, dimensions, lift_distance=0.001):
+    """
+    Imports a single OBJ model with the given dimensions, origin at the center of the bounds,
+    placed lift_distance above the background plane.
+
+    Keyword arguments:
+        object_file -- path of the .obj file: str
+        obj_name -- name for the imported object: str
+        dimensions -- size of the object in meters: (float,float,float)
+        lift_distance -- gap between the object and the background plane: float
+    """
+    imported_object = import_obj_file(object_file, obj_name)
+    if imported_object is None:
+        return None
+
+    imported_object.dimensions = tuple(dimensions)
+    set_origin_to_bounds_center(imported_object)
+    imported_object.location.z = (np.max(imported_object.dimensions) / 2) + lift_distance
+    return imported_object
+
+
+def get_model_metadata(obj):
+    """
+    Returns the per model metadata: vertex count, local bounds, dimensions, convex hull and keypoints.
+
+    Keyword arguments:
+        obj -- normalized blender mesh object
+    """
+    vertices = mesh_utils.get_mesh_vertices(obj)
+    hull = mesh_utils.compute_convex_hull(obj)
+    return {
+        "obj_name": obj.name,
+        "vertex_count": int(len(vertices)),
+        "bounds_min": vertices.min(axis=0).tolist(),
+        "bounds_max": vertices.max(axis=0).tolist(),
+        "dimensions": list(obj.dimensions),
+        "hull": hull.tolist(),
+        "keypoints": mesh_utils.compute_keypoints(vertices, hull_vertices=hull).tolist(),
+    }
+
+
+class AssetCache:
+
+    def __init__(self, cache_dir):
+        """
+        Cache of normalized models stored as one .blend library per model.
+
+        The first run imports the OBJ file, normalizes it and writes the object with its mesh
+        and materials to the cache, along with a json file of the model metadata. Later runs
+        append the datablocks from the library instead of parsing the OBJ file again.
+
+        Keyword arguments:
+            cache_dir -- directory for the .blend files: str
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_blend_path(self, obj_name, model_hash):
+        return os.path.join(self.cache_dir, f'{obj_name}_{model_hash[:16]}.blend')
+
+    def get_metadata_path(self, obj_name, model_hash):
+        return os.path.join(self.cache_dir, f'{obj_name}_{model_hash[:16]}.json')
+
+    def load_object(self, obj_name, model_hash):
+        """
+        Appends the cached object to the scene, returns None if the model is not cached.
+
+        Keyword arguments:
+            obj_name -- name of the object: str
+            model_hash -- hash from get_model_hash: str
+        """
+        blend_path = self.get_blend_path(obj_name, model_hash)
+        if not os.path.exists(blend_path):
+            return None
+
+        with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
+            data_to.objects = list(data_from.objects)
+
+        if not data_to.objects:
+            return None
+        cached_object = data_to.objects[0]
+        bpy.context.scene.collection.objects.link(cached_object)
+        cached_object.name = str(obj_name)
+        return cached_object
+
+    def load_metadata(self, obj_name, model_hash):
+        """
+        Returns the metadata dict of the cached model or None.
+        """
+        metadata_path = self.get_metadata_path(obj_name, model_hash)
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path, 'r') as json_file:
+            return json.load(json_file)
+
+    def save_object(self, obj, model_hash, metadata=None):
+        """
+        Writes the object along with its mesh and materials to the cache.
+
+        Keyword arguments:
+            obj -- normalized blender object
+            model_hash -- hash from get_model_hash: str
+            metadata -- model metadata, computed with get_model_metadata if not given: dict
+
+        returns: metadata dict
+        """
+        blend_path = self.get_blend_path(obj.name, model_hash)
+        # Write to a temporary file first so parallel jobs never read a partial library.
+        temp_path = blend_path.replace('.blend', f'.{os.getpid()}.tmp.blend')
+        bpy.data.libraries.write(temp_path, {obj}, path_remap='ABSOLUTE')
+        os.replace(temp_path, blend_path)
+
+        if metadata is None:
+            metadata = get_model_metadata(obj)
+        metadata['model_hash'] = model_hash
+        metadata['blend_path'] = blend_path
+
+        metadata_path = self.get_metadata_path(obj.name, model_hash)
+        temp_path = metadata_path + f'.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as json_file:
+            json.dump(metadata, json_file)
+        os.replace(temp_path, metadata_path)
+        return metadata
+
+    def load_or_import(self, object_file, obj_name, import_function, **parameters):
+        """
+        Returns the normalized object from the cache, importing and caching it on a miss.
+
+        Keyword arguments:
+            object_file -- path of the .obj file: str
+            obj_name -- name of the object: str
+            import_function -- import_obj_model or import_obj_model_with_dimensions
+            parameters -- normalization parameters passed to the import function
+
+        returns: (object, metadata)
+        """
+        model_hash = get_model_hash(object_file, **parameters)
+        cached_object = self.load_object(obj_name=obj_name, model_hash=model_hash)
+        if cached_object is not None:
+            return cached_object, self.load_metadata(obj_name=obj_name, model_hash=model_hash)
+
+        imported_object = import_function(object_file, obj_name, **parameters)
+        if imported_object is None:
+            return None, None
+        metadata = self.save_object(imported_object, model_hash=model_hash)
+        return imported_object, metadata
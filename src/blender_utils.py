@@ -8,6 +8,12 @@ from mathutils import Color, Euler, Vector
 import numpy as np
 from math import radians,tan,cos,sin
 
+import texture_utils
+import trajectory_utils
+from asset_utils import AssetCache, find_obj_files, get_obj_name, import_obj_model
+from mesh_utils import cache_object_geometry, clear_object_geometry, invalidate_object_geometry
+from profiling_utils import stage_timer
+
 class Blender_helper:
 
     def __init__(self) -> None:
@@ -232,7 +238,12 @@ class Blender_helper:
             bpy.context.scene.objects[name].hide_render = hide
 
 
-    def random_placement(self,obj, camera, min_distance_factor):
+    def random_placement(self,obj, camera, min_distance_factor, distance_fraction=None, angle=None):
+        """
+        Places the object at a random distance and angle from the center of the camera view.
+
+        distance_fraction and angle are drawn here unless given, eg: from a render plan.
+        """
         scene = bpy.context.scene
         # Get the current camera field of view in degrees if not provided
     
@@ -259,10 +270,12 @@ class Blender_helper:
         
         # Calculate random distance within the range
         print(f'Maximum distance is {max_distance}, Minimum distance is : {min_distance}')
-        random_distance = random.uniform(min_distance, max_distance)
+        if distance_fraction is None:
+            distance_fraction = random.random()
+        random_distance = min_distance + (max_distance - min_distance) * distance_fraction
         
         # Calculate random angle (azimuth) around the camera
-        random_angle = random.uniform(0, 2 * np.pi)
+        random_angle = random.uniform(0, 2 * np.pi) if angle is None else angle
         
         # Calculate the object position relative to the camera
         random_x = random_distance * cos(random_angle)
@@ -274,70 +287,63 @@ class Blender_helper:
         obj.location.x = random_x
         obj.location.y = random_y
 
-    def import_objects_obj_format(self, models_dir, target_object_size, dataset_name):
+    def import_objects_obj_format(self, models_dir, target_object_size, dataset_name, asset_cache_dir=None):
         """
         adds objects from cad format(.obj format) along with their materials.
 
         models_dir: path for the models
         target_size: controls the size of the objects
         dataset_name: Name of the dataset, Robocup or YCB
+        asset_cache_dir: directory of the normalized .blend models, if None every model is imported from the OBJ file.
         """
 
         object_names = []
-        obj_files = []
-        # Iterate through all subdirectories in the base path
-        for root, dirs, files in os.walk(models_dir):
-            # Iterate through all files in the current directory
-            for file in files:
-                # Check if the file is an OBJ file
-                if file.endswith(".obj"):
-                    # Construct the full path to the OBJ file
-                    object_file = os.path.join(root, file)
-                    obj_files.append(object_file)
+        obj_files = find_obj_files(models_dir)
 
         # Clear the scene
         bpy.ops.wm.read_factory_settings()
         self.clear_scene()
+        clear_object_geometry()
 
-        for idx, object_file in enumerate(obj_files):
+        asset_cache = None
+        if asset_cache_dir is not None:
+            asset_cache = AssetCache(cache_dir=asset_cache_dir)
 
-            if dataset_name == 'robocup':
-                obj_name = object_file.split('/')[-1].split('.')[0]
-            elif dataset_name == 'ycb':
-                obj_name = "".join(object_file.split('/')[-3].split('_')[1::])
+        for idx, object_file in enumerate(obj_files):
 
-            # Import the OBJ file
-            bpy.ops.import_scene.obj(filepath=object_file)
+            obj_name = get_obj_name(object_file, dataset_name)
 
-            # Set the active object to the imported object
-            imported_object = bpy.context.selected_objects[-1]
-            # Rename the new object
-            imported_object.name = str(obj_name)
-            object_names.append(imported_object.name)
+            metadata = None
+            if asset_cache is not None:
+                # Append the normalized model from the cache, import and cache it on the first run.
+                imported_object, metadata = asset_cache.load_or_import(object_file, obj_name,
+                                                                       import_function=import_obj_model,
+                                                                       target_object_size=target_object_size)
+            else:
+                imported_object = self.import_obj_model(object_file, obj_name, target_object_size)
 
             if imported_object is not None:
-                # Get the maximum dimension of the object
-                max_dimension = max(imported_object.dimensions)
-
-                # Calculate the scale factor to achieve the target size
-                scale_factor = target_object_size / max_dimension
-
-                # Apply scale transformation to the object
-                imported_object.scale = (
-                    scale_factor, scale_factor, scale_factor)
-
-                # Set the origin of the object to its center
-                imported_object.select_set(True)
-                bpy.context.view_layer.objects.active = imported_object
-                bpy.ops.object.origin_set(
-                    type='ORIGIN_CENTER_OF_VOLUME', center='BOUNDS')
-                imported_object.location = (0.0, 0.0, 0.0)
-                imported_object.rotation_euler = (0.0, 0.0, 0.0)
+                object_names.append(imported_object.name)
+                # Cache the convex hull, principal axes and keypoints for the annotations.
+                hull_vertices = metadata['hull'] if metadata is not None else None
+                # The metadata of models cached before the keypoints were added has none, they are sampled on import.
+                keypoints = metadata.get('keypoints') if metadata is not None else None
+                cache_object_geometry(imported_object, hull_vertices=hull_vertices, keypoints=keypoints)
             else:
                 print("Error: Object is None")
 
         return None
 
+    def import_obj_model(self, object_file, obj_name, target_object_size):
+        """
+        Imports a single OBJ model, scales it to the target size and sets its origin to the center of the bounds.
+
+        object_file: path of the .obj file
+        obj_name: name for the imported object
+        target_object_size: size of the largest dimension of the object
+        """
+        return import_obj_model(object_file, obj_name, target_object_size)
+
     def get_object(self, obj_name):
         """
         Returns the object present in the scene.
@@ -373,21 +379,23 @@ class Blender_helper:
         value = random.randint(min_value, max_value)
         bpy.data.cameras[str(camera_name)].lens = float(value)
 
-    def set_random_background_color(self, obj_name):
+    def set_random_background_color(self, obj_name, hue=None):
         """Applies Materials randomly to the object, Changes specially the Principled BSDf Base color values for the given object's material.
 
         Keyword arguments:
         obj_name: str
+        hue: hue of the color, random if not given
         """
         material_to_change = bpy.data.objects[str(obj_name)].active_material
         # bpy.data.materials[material_name]
         color = Color()
-        hue = random.random()  # Random hue between 0 and 1
+        if hue is None:
+            hue = random.random()  # Random hue between 0 and 1
         color.hsv = (hue, 0.85, 0.85)
         rgba = [color.r, color.g, color.b, 1]
         material_to_change.node_tree.nodes['Principled BSDF'].inputs[0].default_value = rgba
 
-    def set_render_parameters(self, device, render_engine, res_x, res_y, num_samples):
+    def set_render_parameters(self, device, render_engine, res_x, res_y, num_samples, persistent_data=False):
         """Sets the active scene with the specified render parameters.
 
         Keyword arguments:
@@ -395,6 +403,7 @@ class Blender_helper:
         res_x-- resolution width of the image to render: int
         res_y-- resolution height of the image to render: int
         num_samples-- number of render samples 
+        persistent_data-- keep the render data (BVH, images) between renders, only useful when the geometry of consecutive frames is the same: bool
         """
         scene = bpy.context.scene
         scene.render.engine = str(render_engine)
@@ -404,6 +413,7 @@ class Blender_helper:
         scene.render.resolution_percentage = 100
         scene.cycles.samples = num_samples
         scene.render.image_settings.file_format = "PNG"
+        scene.render.use_persistent_data = bool(persistent_data)
 
     def get_texture_map_paths(self, texture_folder):
         """Returns paths for the images which can be used for image textures.
@@ -411,45 +421,7 @@ class Blender_helper:
         Keyword arguments:
         texture_folder-- Path for the folder containing the images.
         """
-        texture_dict = {
-            "normal_map": None,
-            "base_color": None,
-            "disp_map": None,
-            "metal_map": None,
-            "roughness_map": None
-        }
-
-        files = os.listdir(path=texture_folder)
-        for file in files:
-            # Match the files and seperate
-            nrm_match = re.search(r'\wnormal', file) or re.search(
-                r'\wNRM', file) or re.search(r'\wnor', file)
-            base_match = re.search(r'\wbasecolor', file) or re.search(
-                r'\wCOL_VAR1', file) or re.search(r'\wdiff', file) or re.search(r'\wcol', file)
-            disp_match = re.search(r'\wDISP_4K', file) or re.search(
-                r'\wheight', file) or re.search(r'\wdisplacement', file) or re.search(r'\wdisp', file)
-            metal_match = re.search(r'\wmetallic', file) or re.search(
-                r'\wREFL', file) or re.search(r'\wmetal', file)
-            rough_match = re.search(r'\wroughness', file) or re.search(
-                r'\wGLOSS', file) or re.search(r'\wrough', file)
-
-            if nrm_match:
-                normal_map = os.path.join(texture_folder, file)
-                texture_dict['normal_map'] = normal_map
-
-            if base_match:
-                base_color = os.path.join(texture_folder, file)
-                texture_dict['base_color'] = base_color
-            if disp_match:
-                disp_map = os.path.join(texture_folder, file)
-                texture_dict['disp_map'] = disp_map
-            if metal_match:
-                metal_map = os.path.join(texture_folder, file)
-                texture_dict['metal_map'] = metal_map
-            if rough_match:
-                roughness_map = os.path.join(texture_folder, file)
-                texture_dict['roughness_map'] = roughness_map
-        return texture_dict
+        return texture_utils.get_texture_map_paths(texture_folder=texture_folder)
 
     def get_texture_paths(self, texture_dir):
         """Gets the paths for all the texture_folders from the main textures folder and returns them as a list
@@ -457,16 +429,8 @@ class Blender_helper:
         Keyword arguments:
         texture_dir-- path for the directory containig the textures.
         """
-        bnames = os.listdir(texture_dir)
-        for i, cs in enumerate(zip(*bnames)):
-            if len(set(cs)) != 1:
-                break
-        for _i, cs in enumerate(zip(*[b[::-1] for b in bnames])):
-            if len(set(cs)) != 1:
-                break
-        texture_paths = [os.path.join(texture_dir, bname+'/')
-                         for bname in bnames if not bname.endswith('.md')]
-        return texture_paths
+        # The directory is scanned once, see texture_utils.TextureIndex
+        return texture_utils.get_texture_index(texture_dir).texture_paths
 
     def set_random_pbr_img_textures(self, textures_path, obj_name, scale):
         """Applies image textures randomly from the available images to the specified object.
@@ -476,119 +440,52 @@ class Blender_helper:
         obj_name-- name of the object to change the materail/texture
         """
 
-        texture_paths = self.get_texture_paths(textures_path)
-        # print("Texture paths : ",texture_paths)
-        texture_path = random.choice(texture_paths)
-
-        material_name = str(texture_path.split('/')[-2])
-        texture_dict = self.get_texture_map_paths(texture_folder=texture_path)
-
-        # create a new material with the name.
-        material = bpy.data.materials.new(
-            name=material_name)  # Change name everytime
-        material.use_nodes = True
-
-        # Create the nodes for the material
-
-        # Nodes for controlling the texture
-        texture_coordinate = material.node_tree.nodes.new(
-            type="ShaderNodeTexCoord")
-        mapping_node = material.node_tree.nodes.new(type="ShaderNodeMapping")
-        mapping_node.inputs['Scale'].default_value = (
-            scale, scale, scale)  # Control the scale of the texture
-
-        # Create vector nodes
-        normal_map = material.node_tree.nodes.new(type="ShaderNodeNormalMap")
-        displacement_map = material.node_tree.nodes.new(
-            type="ShaderNodeDisplacement")
-        bump_map = material.node_tree.nodes.new(type="ShaderNodeBump")
-        invert_node = material.node_tree.nodes.new(type="ShaderNodeInvert")
-
-        # Nodes for principled bsdf and output
-        principled_bsdf = material.node_tree.nodes['Principled BSDF']
-        material_output = material.node_tree.nodes['Material Output']
-
-        # Connect the nodes
-        material.node_tree.links.new(
-            texture_coordinate.outputs['UV'], mapping_node.inputs['Vector'])
-        # Nodes for image textures
-        # Base color
-        if texture_dict['base_color'] != None:
-            base_color_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            base_color_img.image = bpy.data.images.load(
-                texture_dict['base_color'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], base_color_img.inputs['Vector'])
-            material.node_tree.links.new(
-                base_color_img.outputs['Color'], principled_bsdf.inputs['Base Color'])
-
-        # Normal map
-        if texture_dict['normal_map'] != None:
-            normal_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            normal_img.image = bpy.data.images.load(texture_dict['normal_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], normal_img.inputs['Vector'])
-            material.node_tree.links.new(
-                normal_img.outputs['Color'], normal_map.inputs['Color'])
-            material.node_tree.links.new(
-                normal_map.outputs['Normal'], principled_bsdf.inputs['Normal'])
-
-        # Displacement map
-        if texture_dict['disp_map'] != None:
-            displacement_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            displacement_img.image = bpy.data.images.load(
-                texture_dict['disp_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], displacement_img.inputs['Vector'])
-            material.node_tree.links.new(
-                displacement_img.outputs['Color'], displacement_map.inputs['Height'])
-            material.node_tree.links.new(
-                displacement_map.outputs['Displacement'], material_output.inputs['Displacement'])
-
-        # Roughness map
-        if texture_dict['roughness_map'] != None:
-            roughness_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            roughness_img.image = bpy.data.images.load(
-                texture_dict['roughness_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], roughness_img.inputs['Vector'])
-            material.node_tree.links.new(
-                roughness_img.outputs['Color'], invert_node.inputs['Color'])
-            material.node_tree.links.new(
-                invert_node.outputs['Color'], principled_bsdf.inputs['Roughness'])
-
-        # Metal map
-        if texture_dict['metal_map'] != None:
-            metallic_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            metallic_img.image = bpy.data.images.load(
-                texture_dict['metal_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], metallic_img.inputs['Vector'])
-            material.node_tree.links.new(
-                metallic_img.outputs['Color'], principled_bsdf.inputs['Metallic'])
-
-        # Set material final output
-        material.node_tree.links.new(
-            principled_bsdf.outputs['BSDF'], material_output.inputs['Surface'])
+        texture_path = texture_utils.get_texture_index(textures_path).random_texture_path()
+
+        # Materials are built once per texture folder and reused afterwards.
+        material = texture_utils.material_pool.get_material(texture_path=texture_path, scale=scale)
 
         # Set the material to the object
         obj = bpy.data.objects[obj_name]
+        texture_utils.assign_material(obj, material)
 
-        if obj.data.materials:
-            obj.data.materials.append(material)
-            obj.active_material = bpy.data.materials[material_name]
-        else:
-            obj.data.materials.append(material)
-            obj.active_material = material
+        return material
 
-        # print("List of materials : ", bpy.data.materials.keys())
+    def apply_render_plan_row(self, row, obj, camera, background_plane_name, texture_path=None, scale=2.5):
+        """Sets the scene parameters of one frame of a render plan, see render_plan.RenderPlan.
 
-        return material
+        Keyword arguments:
+        row: dict of column name to value from RenderPlan.get_row
+        obj: blender object to render
+        camera: camera object following the path
+        background_plane_name: name of the background plane
+        texture_path: texture folder for the background, the texture is kept if None
+        scale: scale of the background texture
+        """
+        bpy.data.lights['Sun'].energy = float(row['light_energy'])
+        if 'camera_location' in row:
+            # Precomputed pose of the camera trajectory, the path constraints are muted.
+            trajectory_utils.set_camera_pose(camera, row['camera_location'], row['camera_rotation'])
+        else:
+            self.set_camera_postion_on_path(camera_name=camera.name, distance_value=float(row['path_offset']))
+        if np.isnan(row['dof_distance']):
+            camera.data.dof.use_dof = False
+        else:
+            self.add_blur_dof(blur_value=float(row['dof_distance']), focus_background_name=background_plane_name)
+
+        obj.rotation_euler = Euler(tuple(row['rotation_euler']), 'XYZ')
+        if not np.isnan(row['placement'][0]):
+            # The placement depends on the camera height, update the camera on the path first.
+            bpy.context.view_layer.update()
+            self.random_placement(obj=obj, camera=camera, min_distance_factor=0.1,
+                                  distance_fraction=float(row['placement'][0]), angle=float(row['placement'][1]))
+
+        if texture_path is not None:
+            with stage_timer.stage('texture'):
+                material = texture_utils.material_pool.get_material(texture_path=texture_path, scale=scale)
+                texture_utils.assign_material(bpy.data.objects[background_plane_name], material)
+        if not np.isnan(row['background_hue']):
+            self.set_random_background_color(obj_name=background_plane_name, hue=float(row['background_hue']))
 
     def add_blur_dof(self, blur_value,focus_background_name):
         """Adds blur effect to the images using depth of field parameter of the camera.
@@ -616,6 +513,8 @@ class Blender_helper:
         else:
             deform_modifier = obj_to_deform.modifiers['simple_deform']
         deform_modifier.deform_method = 'BEND'
+        # The cached hull and principal axes no longer match the deformed mesh.
+        invalidate_object_geometry(obj_to_deform.name)
 
         deform_modifier.deform_axis = 'Z'
         deform_modifier.angle = random.uniform(-0.523, -3.14)
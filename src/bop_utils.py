@@ -0,0 +1,196 @@
+# import modules
+import json
+import os
+
+import numpy as np
+
+
+def get_visibility_annotations(object_masks, index_map, pass_indices, valid_depth):
+    """
+    Returns the BOP visibility annotations of every object from its full mask and the rendered object index pass.
+
+    The visible mask of an object is the part of its full mask where the index pass shows the object. px_count_valid
+    counts the pixels of the full mask with a valid depth value, as in BOP. All the objects are handled in one
+    vectorized pass over the (N,H,W) masks.
+
+    Keyword arguments:
+        object_masks -- silhouettes of the objects without occlusion: np.ndarray (N,H,W) bool
+        index_map -- object pass index of every pixel, 0 for the background: np.ndarray (H,W) int
+        pass_indices -- pass index of every object: list(int)
+        valid_depth -- pixels of the depth image with a depth between 0 and the clip end: np.ndarray (H,W) bool
+
+    returns: (list of dict with px_count_all, px_count_valid, px_count_visib, visib_fract and bbox_visib,
+              visible masks np.ndarray (N,H,W) bool)
+    """
+    pass_indices = np.asarray(pass_indices).reshape(-1, 1, 1)
+    visible_masks = object_masks & (index_map[None] == pass_indices)
+
+    px_count_all = object_masks.sum(axis=(1, 2))
+    px_count_valid = (object_masks & valid_depth[None]).sum(axis=(1, 2))
+    px_count_visib = visible_masks.sum(axis=(1, 2))
+    visib_fract = np.divide(px_count_visib, px_count_all, out=np.zeros(len(px_count_all)), where=px_count_all > 0)
+
+    # Bounding boxes of the visible masks, [-1, -1, -1, -1] for hidden objects as in BOP.
+    rows = visible_masks.any(axis=2)
+    columns = visible_masks.any(axis=1)
+    y_min = rows.argmax(axis=1)
+    y_max = rows.shape[1] - 1 - rows[:, ::-1].argmax(axis=1)
+    x_min = columns.argmax(axis=1)
+    x_max = columns.shape[1] - 1 - columns[:, ::-1].argmax(axis=1)
+
+    annotations = []
+    for i in range(len(pass_indices)):
+        bbox_visib = [-1, -1, -1, -1]
+        if px_count_visib[i] > 0:
+            bbox_visib = [int(x_min[i]), int(y_min[i]), int(x_max[i] - x_min[i] + 1), int(y_max[i] - y_min[i] + 1)]
+        annotations.append({"px_count_all": int(px_count_all[i]),
+                            "px_count_valid": int(px_count_valid[i]),
+                            "px_count_visib": int(px_count_visib[i]),
+                            "visib_fract": float(visib_fract[i]),
+                            "bbox_visib": bbox_visib})
+    return annotations, visible_masks
+
+
+class StreamingJsonDict:
+
+    def __init__(self, file_path, checkpoint_interval=10):
+        """
+        Json object file which is written one key at a time.
+
+        The file is a valid json object after every added key. The file is flushed after every key and
+        fsynced every checkpoint_interval keys.
+
+        Keyword arguments:
+            file_path -- path of the json file: str
+            checkpoint_interval -- number of keys between two fsync calls: int
+        """
+        self.file_path = file_path
+        self.checkpoint_interval = int(checkpoint_interval)
+
+        self.file = open(file_path, 'wb')
+        self.num_entries = 0
+        self.num_unsynced = 0
+        self.file.write(b'{\n}')
+        self.checkpoint()
+
+    def write_entry(self, key, value):
+        separator = ',' if self.num_entries > 0 else ''
+        self.file.write(f'{separator}\n{json.dumps(str(key))}: {json.dumps(value)}'.encode('utf-8'))
+        self.num_entries += 1
+        self.num_unsynced += 1
+
+    def add(self, key, value):
+        """
+        Appends the key to the json object, overwriting the closing brace.
+        """
+        self.file.seek(self.file.tell() - 2)
+        self.write_entry(key, value)
+        self.file.write(b'\n}')
+        self.file.truncate()
+        self.file.flush()
+        if self.num_unsynced >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.num_unsynced = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+
+class BopWriter:
+
+    ANNOTATION_FILES = ('scene_camera', 'scene_gt', 'scene_gt_info')
+
+    def __init__(self, output_dir, images_per_scene=None, checkpoint_interval=10, image_dirs=('rgb', 'depth')):
+        """
+        Writes the BOP annotations of every frame as soon as it is rendered.
+
+        With images_per_scene the frames are split into BOP scene folders output_dir/000000/, output_dir/000001/, ...
+        of images_per_scene images each, the image ids start at 0 in every scene. Without it all the frames
+        are written to output_dir.
+
+        Keyword arguments:
+            output_dir -- output folder of the dataset: str
+            images_per_scene -- number of images per scene folder: int
+            checkpoint_interval -- number of frames between two fsync calls: int
+            image_dirs -- image folders created in every scene folder: tuple(str)
+        """
+        self.output_dir = output_dir
+        self.images_per_scene = images_per_scene
+        self.checkpoint_interval = checkpoint_interval
+        self.image_dirs = image_dirs
+
+        self.scene_id = None
+        self.annotation_files = {}
+
+    def get_scene_id(self, idx):
+        return 0 if self.images_per_scene is None else int(idx) // int(self.images_per_scene)
+
+    def get_image_id(self, idx):
+        return int(idx) if self.images_per_scene is None else int(idx) % int(self.images_per_scene)
+
+    def get_scene_dir(self, idx):
+        if self.images_per_scene is None:
+            return self.output_dir
+        return os.path.join(self.output_dir, f'{self.get_scene_id(idx):06d}')
+
+    def get_image_path(self, idx, image_dir, extension='.png'):
+        """
+        Returns the path of a frame's image, eg: output_dir/000001/rgb/000004.png
+        """
+        return os.path.join(self.get_scene_dir(idx), image_dir, f'{self.get_image_id(idx):06d}{extension}')
+
+    def get_mask_path(self, idx, mask_dir, gt_id):
+        """
+        Returns the path of the mask of an object in a frame, eg: output_dir/mask_visib/000004_000002.png
+
+        Keyword arguments:
+            idx -- index of the frame in the dataset: int
+            mask_dir -- 'mask' or 'mask_visib': str
+            gt_id -- index of the object in the scene_gt list of the frame: int
+        """
+        return os.path.join(self.get_scene_dir(idx), mask_dir, f'{self.get_image_id(idx):06d}_{int(gt_id):06d}.png')
+
+    def open_scene(self, idx):
+        """
+        Opens the annotation files of the frame's scene, the files of the previous scene are closed.
+        """
+        scene_id = self.get_scene_id(idx)
+        if scene_id == self.scene_id:
+            return
+        self.close()
+
+        scene_dir = self.get_scene_dir(idx)
+        for image_dir in self.image_dirs:
+            os.makedirs(os.path.join(scene_dir, image_dir), exist_ok=True)
+        self.annotation_files = {name: StreamingJsonDict(os.path.join(scene_dir, f'{name}.json'),
+                                                         checkpoint_interval=self.checkpoint_interval)
+                                 for name in self.ANNOTATION_FILES}
+        self.scene_id = scene_id
+
+    def write_frame(self, idx, scene_camera, scene_gt, scene_gt_info):
+        """
+        Appends the annotations of a frame to the scene_camera.json, scene_gt.json and scene_gt_info.json files.
+
+        Keyword arguments:
+            idx -- index of the frame in the dataset: int
+            scene_camera -- dict from ObjectDetectionBop.get_scene_camera_parameters
+            scene_gt -- list from ObjectDetectionBop.get_scene_gt_parameters
+            scene_gt_info -- list from ObjectDetectionBop.get_scene_gt_info_parameters
+        """
+        self.open_scene(idx)
+        image_id = self.get_image_id(idx)
+        self.annotation_files['scene_camera'].add(image_id, scene_camera)
+        self.annotation_files['scene_gt'].add(image_id, scene_gt)
+        self.annotation_files['scene_gt_info'].add(image_id, scene_gt_info)
+
+    def close(self):
+        for annotation_file in self.annotation_files.values():
+            annotation_file.close()
+        self.annotation_files = {}
+        self.scene_id = None
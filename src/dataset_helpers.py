@@ -8,13 +8,16 @@ from pathlib import Path
 import time
 import bpy
 import random
-import skfuzzy
-from skfuzzy import control as ctrl
+import functools
 
 
 # Refactor the code for changing the utilites to utils folder
 
 from blender_utils import Blender_helper
+from io_utils import annotation_writer
+from journal_utils import get_render_journal
+from profiling_utils import stage_timer
+from uncertainty_utils import get_uncertainty_table
 
 Blender_helper = Blender_helper()
 
@@ -78,89 +81,34 @@ class Dataset_helper():
 
 
     def compute_uncertianty_distance(self,focal_length):
-        uncertainty_value = 0.0
-        # Range of the domains
-        distance = ctrl.Antecedent(np.arange(40,110,1),'distance')
-        uncertainty = ctrl.Consequent(np.arange(0,2.7,0.01),'uncertainty')
-
-        # Membership function for Light
-        distance['far'] = skfuzzy.trimf(distance.universe, [40,40,55])
-        distance['little_far'] = skfuzzy.trimf(distance.universe,[50,55,60])
-        distance['normal'] = skfuzzy.trimf(distance.universe, [58,65,72])
-        distance['little_near'] = skfuzzy.trimf(distance.universe,[70,80,90])
-        distance['near'] = skfuzzy.trimf(distance.universe, [80, 110,110])
-
-
-         # Membership function for Uncertainty
-        # uncertainty['Low'] = fuzz.sigmf(uncertainty.universe, center, width_control)
-        # uncertainty['Low'] = skfuzzy.trimf(uncertainty.universe,[0,0,0.5])
-        uncertainty['Low']= skfuzzy.zmf(uncertainty.universe, 0,0.3)
-        uncertainty['Little_high']= skfuzzy.gaussmf(uncertainty.universe, 0.8,0.05)
-        # uncertainty['High'] = skfuzzy.trimf(uncertainty.universe,[0.6,1,1])
-        uncertainty['High'] = skfuzzy.smf(uncertainty.universe, 1.0, 2.7)
-        uncertainty['Medium'] = skfuzzy.gaussmf(uncertainty.universe, 0.5, 0.05)
-
-
-        # Defining the fuzzy rules
-        rule1 = ctrl.Rule(distance['far'] ,uncertainty['High'])
-        rule2 = ctrl.Rule(distance['normal'],uncertainty['Low'])
-        rule3 = ctrl.Rule(distance['little_far'] ,uncertainty['Little_high'])
-        rule4 = ctrl.Rule(distance['near'] ,uncertainty['High'])
-        rule5 = ctrl.Rule(distance['little_near'] ,uncertainty['Little_high'])
-
-        # Control system for calculating uncertainty
-        uncertainty_ctrl = ctrl.ControlSystem([rule1,rule2,rule3,rule4,rule5])
-        uncertainty_check = ctrl.ControlSystemSimulation(uncertainty_ctrl)
-        uncertainty_check.input['distance'] = focal_length
-        uncertainty_check.compute()
-        uncertainty_value = uncertainty_check.output['uncertainty']
-
-        return round(uncertainty_value,6)
+        """ computes uncertainty for the focal length values from blender
+
+        The fuzzy rule set is compiled once into a lookup table, see uncertainty_utils.
+        """
+        with stage_timer.stage('uncertainty'):
+            uncertainty_value = get_uncertainty_table('distance').evaluate(focal_length)
+
+        return round(float(uncertainty_value),6)
     
     def compute_uncertianty_lighting(self,light_value):
         """ computes uncertainty for the light values  from blender
+
+        The fuzzy rule set is compiled once into a lookup table, see uncertainty_utils.
         """
-        uncertainty_value = 0.0
-        # Range of the domains
-        light = ctrl.Antecedent(np.arange(0,25,0.1),'light')
-        uncertainty = ctrl.Consequent(np.arange(0,1.0,0.01),'uncertainty')
-
-        # Membership function for Light
-        light['dark'] = skfuzzy.trimf(light.universe, [0,0,2])
-        light['little_dark'] = skfuzzy.trimf(light.universe,[1.5,2.5,3.5])
-        light['normal'] = skfuzzy.trimf(light.universe, [2.8,6,8])
-        light['little_bright'] = skfuzzy.trimf(light.universe,[7.5,11,16])
-        light['bright'] = skfuzzy.trimf(light.universe, [15, 19, 25])
-
-        # Membership function for Uncertainty
-        # uncertainty['Low'] = fuzz.sigmf(uncertainty.universe, center, width_control)
-        uncertainty['Low'] = skfuzzy.trimf(uncertainty.universe,[0,0,0.5])
-        uncertainty['High'] = skfuzzy.trimf(uncertainty.universe,[0.6,1,1])
-        # uncertainty['High'] = fuzz.sigmf(uncertainty.universe, center, width_control)
-
-        # Defining the fuzzy rules
-        rule1 = ctrl.Rule(light['bright'] ,uncertainty['High'])
-        rule2 = ctrl.Rule(light['normal'],uncertainty['Low'])
-        rule3 = ctrl.Rule(light['little_bright'] ,uncertainty['High'])
-        rule4 = ctrl.Rule(light['dark'] ,uncertainty['High'])
-        rule5 = ctrl.Rule(light['little_dark'] ,uncertainty['High'])
-
-        # Control system for calculating uncertainty
-        uncertainty_ctrl = ctrl.ControlSystem([rule1,rule2,rule3,rule4,rule5])
-        uncertainty_check = ctrl.ControlSystemSimulation(uncertainty_ctrl)
-        uncertainty_check.input['light'] = light_value
-        uncertainty_check.compute()
-        uncertainty_value = uncertainty_check.output['uncertainty']
+        with stage_timer.stage('uncertainty'):
+            uncertainty_value = get_uncertainty_table('lighting').evaluate(light_value)
 
         # print("Light value : ",light_value , "uncertainty_value : ",round(uncertainty_value,2))
 
-        return uncertainty_value
+        return float(uncertainty_value)
 
 
-    def save_as_json_file(self,file_path,parameters_dict):
-        
-        with open(str(file_path),'w',encoding='utf-8') as f:
-            json.dump(parameters_dict, f, ensure_ascii=False, indent=4)
+    def save_as_json_file(self,file_path,parameters_dict,on_written=None):
+        """
+        Queues the json file in the background annotation writer, on_written is called once it is on disk.
+        """
+        annotation_writer.write(file_path, parameters_dict, on_written=on_written,
+                                ensure_ascii=False, encoding='utf-8')
 
         return None
 
@@ -222,6 +170,8 @@ class Dataset_helper():
         # Create start index for the images and starting time
         start_time = time.time()
         camera = bpy.data.objects['Camera']
+        # Renders completed by an earlier run are skipped.
+        journal = get_render_journal(json_object, output_path)
         # Loop through each split of the test cases for generating the test datasets.
         # test case == split name
         print("Rendering objects names",obj_names)
@@ -247,6 +197,12 @@ class Dataset_helper():
                 start_idx = 0
                 # Loop though number of images to render and render the images.
                 for i in range(start_idx,start_idx+renders_per_object):
+                    if journal is not None and journal.is_completed(test_case, obj_name, i):
+                        continue
+
+                    # The scene changes of the frame are timed as 'scene', see profiling_utils.
+                    stage_timer.set_group(test_case)
+                    stage_timer.start('scene')
                     
                     if distractor_obj_names != []:
                         # Unhide distractor objects randomly
@@ -276,7 +232,8 @@ class Dataset_helper():
                         # Debug this code later 'NoneType' object has no attribute 'node_tree' do you actually need this?
                         Blender_helper.set_random_background_color(obj_name='Floor')
                     elif str('random_textures') in parameters:
-                        material = Blender_helper.set_random_pbr_img_textures(textures_path=textures_path,obj_name='Floor')
+                        with stage_timer.stage('texture'):
+                            material = Blender_helper.set_random_pbr_img_textures(textures_path=textures_path,obj_name='Floor')
                     else:
                         pass
 
@@ -339,7 +296,8 @@ class Dataset_helper():
                         Blender_helper.set_random_background_color(material_name='Floor')
                         # Else condition will be taken care from setting up the scene in the top where a default floor color will be set.
                     elif test_case == 'random_background_textures':
-                        material = Blender_helper.set_random_pbr_img_textures(textures_path=textures_path,obj_name='Floor')
+                        with stage_timer.stage('texture'):
+                            material = Blender_helper.set_random_pbr_img_textures(textures_path=textures_path,obj_name='Floor')
 
                     elif test_case == 'blur_images': # After completing the rendering process set depth of field to false/disable.
                         Blender_helper.add_blur_dof(focus_background_name='Floor')
@@ -375,7 +333,7 @@ class Dataset_helper():
                         else:
                             Blender_helper.set_random_lighting(light_source_name='Sun',min_value=4,max_value=8)
                             Blender_helper.set_random_focal_length(camera_name='Camera',min_value=50,max_value=70)
-                        
+                    stage_timer.stop()
                 
                     print(f'Rendering image {i +1} of {total_render_count}')
                     seconds_per_render = (time.time() - start_time) / (i+1)
@@ -385,7 +343,8 @@ class Dataset_helper():
                     folder_name = str(dataset_name)+str(test_case)
                     # Update file path and render
                     bpy.context.scene.render.filepath = str(output_path / folder_name / obj_name / f'{str(i).zfill(6)}.png')
-                    bpy.ops.render.render(write_still = True)
+                    with stage_timer.stage('render'):
+                        bpy.ops.render.render(write_still = True)
                     
                     # Save the uncertainty labels as json file
                     # uncertainty_distribution = self.compute_uncertainty(obj_name=obj_name,material_threshold_dict=material_threshold_dict,light_value=10,obj_names=obj_names)
@@ -401,22 +360,28 @@ class Dataset_helper():
                      
                     uncertainty_labels_file_path = str(output_path / folder_name  / obj_name/ f'{str(i).zfill(6)}.json')
          
-                    self.save_as_json_file(file_path=uncertainty_labels_file_path,parameters_dict=parameters_dict)
+                    on_written = None
+                    if journal is not None:
+                        on_written = functools.partial(journal.record, test_case, obj_name, i,
+                                                       paths=[bpy.context.scene.render.filepath, uncertainty_labels_file_path])
+                    with stage_timer.stage('write'):
+                        self.save_as_json_file(file_path=uncertainty_labels_file_path,parameters_dict=parameters_dict,on_written=on_written)
                     
-                    # Remove the material again from the scene so that it won't cause problem.
-                    if material != None:
-                        bpy.data.materials.remove(material)
-                    else:
-                        pass
-
                     if distractor_obj!=None:
                         # distractor_obj.location = (obj_to_render.location[0]-1,obj_to_render.location[1],obj_to_render.location[2])
                         distractor_obj.hide_render = True
 
                     # Set the blur value back to normal ie, turn off depth of field
                     camera.data.dof.use_dof = False
+                    stage_timer.frame_done()
                 
                 # Hide the object again so that it will not appear in the next iteration.
                 obj_to_render.hide_render = True
                 # Update the starting index 
                 start_idx += renders_per_object
+
+        # Wait for the pending label files, write errors are raised here.
+        with stage_timer.stage('write'):
+            annotation_writer.flush()
+        stage_timer.print_summary()
+        stage_timer.write_report(output_path)
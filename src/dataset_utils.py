@@ -5,7 +5,7 @@ from math import radians,tan,cos,sin
 import random
 import numpy as np
 
-from blender_utils import Blender_helper
+from io_utils import annotation_writer
 
 
 class Dataset_helper:
@@ -69,10 +69,12 @@ class Dataset_helper:
             obj_render_list.append((condition, num_images_per_class))
         return obj_render_list
 
-    def save_as_json_file(self, file_path, parameters_dict):
-
-        with open(str(file_path), 'w', encoding='utf-8') as f:
-            json.dump(parameters_dict, f, ensure_ascii=False, indent=4)
+    def save_as_json_file(self, file_path, parameters_dict, on_written=None):
+        """
+        Queues the json file in the background annotation writer, on_written is called once it is on disk.
+        """
+        annotation_writer.write(file_path, parameters_dict, on_written=on_written,
+                                ensure_ascii=False, encoding='utf-8')
 
         return None
 
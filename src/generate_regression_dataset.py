@@ -1,5 +1,6 @@
 # import modules
 import os
+import argparse
 import json
 import sys
 from pathlib import Path
@@ -12,9 +13,11 @@ from regression_utils import RegressionDatasetGeneration
 print('\nAll modules are sucessfully imported')
 
 
-def main(parent_dir,models_dir,textures_dir,constraint_textures_dir,arguments_file):
+def main(parent_dir,models_dir,textures_dir,arguments_file,asset_cache_dir=None,shard_index=0,num_shards=1,seed=None,confirm=True):
     """
     Main rendering code for regression dataset
+
+    With num_shards > 1 only the part of the dataset of shard_index is rendered, see render_shards.py
     """
     json_file = open(arguments_file,'r')
     json_data = json_file.read()
@@ -47,7 +50,10 @@ def main(parent_dir,models_dir,textures_dir,constraint_textures_dir,arguments_fi
     print("\n*********************************************************************")
     
     try:
-        user_input = input("\nEnter \"y\" to continue rendering or \"n\" to abort the process: ").strip().lower()
+        if confirm:
+            user_input = input("\nEnter \"y\" to continue rendering or \"n\" to abort the process: ").strip().lower()
+        else:
+            user_input = "y"
 
         if user_input == "y":
             if trajectories == "True":
@@ -56,15 +62,22 @@ def main(parent_dir,models_dir,textures_dir,constraint_textures_dir,arguments_fi
                                                                                        textures_dir=textures_dir,
                                                                                        num_trajectories=num_trajectories,
                                                                                        output_dir=OUTPUT_DIR,
-                                                                                       dataset_name=dataset_name
+                                                                                       dataset_name=dataset_name,
+                                                                                       asset_cache_dir=asset_cache_dir,
+                                                                                       shard_index=shard_index,
+                                                                                       num_shards=num_shards,
+                                                                                       seed=seed
                                                                                        )
             elif trajectories=="False":
                 RegressionDatasetGeneration().generate_regression_dataset(json_object=json_object,
                                                               models_dir=models_dir,
                                                               textures_dir=textures_dir,
-                                                              constraint_textures_dir=constraint_textures_dir,
                                                               output_dir = OUTPUT_DIR,
-                                                              dataset_name=dataset_name
+                                                              dataset_name=dataset_name,
+                                                              asset_cache_dir=asset_cache_dir,
+                                                              shard_index=shard_index,
+                                                              num_shards=num_shards,
+                                                              seed=seed
                                                               )
         else:
             print("Aborted the process.")
@@ -82,9 +95,19 @@ if __name__ == '__main__':
     PARENT_DIR = os.path.normpath(os.getcwd()+os.sep+os.pardir)
     MODELS_DIR = os.path.join(PARENT_DIR,'blender_files/models/ycb_models/')
     TEXTURES_DIR = os.path.join(PARENT_DIR,'blender_files/textures/')
-    CONSTRAINT_TEXTURES_DIR = os.path.join(PARENT_DIR,'blender_files/constraint_textures/')
     ARGS_FILE = os.path.join(PARENT_DIR,'argument_files/requirements_regression.json')
+    # Normalized .blend copies of the models, created on the first run.
+    ASSET_CACHE_DIR = os.path.join(PARENT_DIR,'blender_files/asset_cache/')
+
 
+    # Shard arguments after '--', passed by render_shards.py
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shard_index', type=int, default=0)
+    parser.add_argument('--num_shards', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None, help="seed of the render plan")
+    parser.add_argument('--arguments_file', default=ARGS_FILE)
+    parser.add_argument('--yes', action='store_true', help="render without asking for confirmation")
+    args = parser.parse_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
 
     print("Models dir is : ", MODELS_DIR)
     print("Textures dir is : ", TEXTURES_DIR)
@@ -92,6 +115,10 @@ if __name__ == '__main__':
     main(parent_dir=PARENT_DIR,
          models_dir=MODELS_DIR,
          textures_dir=TEXTURES_DIR,
-         constraint_textures_dir=CONSTRAINT_TEXTURES_DIR,
-         arguments_file=ARGS_FILE,
+         arguments_file=args.arguments_file,
+         asset_cache_dir=ASSET_CACHE_DIR,
+         shard_index=args.shard_index,
+         num_shards=args.num_shards,
+         seed=args.seed,
+         confirm=not args.yes,
          )
@@ -0,0 +1,102 @@
+# import modules
+import atexit
+import json
+import os
+import queue
+import threading
+
+
+class AsyncJsonWriter:
+
+    def __init__(self, max_queue_size=64):
+        """
+        Writes json files on a background thread, so the render loop does not wait on the disk.
+
+        json.dump holds the GIL, serializing on the writer thread would take the same time away from the
+        render loop. The data is serialized by the caller instead, which also takes a snapshot of it, and only
+        the filesystem work (creating the folders, opening, writing and closing the files) runs on the writer
+        thread. This saves the render loop the latency of slow or network filesystems, not the json encoding.
+
+        The queue is bounded, write blocks once max_queue_size files are pending. The first error of the
+        writer thread is raised again in the main thread by the next call of write, flush or close.
+
+        Keyword arguments:
+            max_queue_size -- maximum number of pending files: int
+        """
+        self.max_queue_size = int(max_queue_size)
+        self.queue = None
+        self.thread = None
+        self.error = None
+        self.created_dirs = set()
+
+    def start(self):
+        self.queue = queue.Queue(maxsize=self.max_queue_size)
+        self.thread = threading.Thread(target=self.run, name='AsyncJsonWriter', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                file_path, text, on_written, encoding = item
+                if self.error is None:
+                    self.write_file(file_path, text, encoding=encoding)
+                    if on_written is not None:
+                        on_written()
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def write_file(self, file_path, text, encoding=None):
+        folder = os.path.dirname(file_path)
+        if folder not in self.created_dirs:
+            os.makedirs(folder, exist_ok=True)
+            self.created_dirs.add(folder)
+        with open(file_path, 'w', encoding=encoding) as json_file:
+            json_file.write(text)
+
+    def check_errors(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Writing the annotations failed : {error}") from error
+
+    def write(self, file_path, data, indent=4, on_written=None, ensure_ascii=True, encoding=None):
+        """
+        Serializes the data and queues the json file, the data can be modified after the call.
+
+        Keyword arguments:
+            file_path -- path of the json file, the folder is created if needed: str
+            data -- json serializable object
+            indent -- indent of the json file: int
+            on_written -- function called by the writer thread after the file is written, eg: recording the render in the journal
+            ensure_ascii -- escape the non-ASCII characters, as json.dump: bool
+            encoding -- encoding of the file, the locale encoding if None: str
+        """
+        self.check_errors()
+        text = json.dumps(data, indent=indent, ensure_ascii=ensure_ascii)
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        self.queue.put((str(file_path), text, on_written, encoding))
+
+    def flush(self):
+        """
+        Waits until all the queued files are written.
+        """
+        if self.queue is not None:
+            self.queue.join()
+        self.check_errors()
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+        self.check_errors()
+
+
+# Shared writer for the annotation files, the pending files are written before the interpreter exits.
+annotation_writer = AsyncJsonWriter()
+atexit.register(annotation_writer.close)
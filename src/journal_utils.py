@@ -0,0 +1,169 @@
+# import modules
+import glob
+import json
+import os
+import threading
+
+
+def is_file_complete(file_path, file_size=None):
+    """
+    Checks that the rendered file exists and is not truncated.
+
+    PNG files must end with the IEND chunk and json files must parse, other files are only checked
+    against the size recorded in the journal.
+
+    Keyword arguments:
+        file_path -- path of the file: str
+        file_size -- size in bytes recorded when the file was written: int
+    """
+    if not os.path.isfile(file_path):
+        return False
+    size = os.path.getsize(file_path)
+    if size == 0 or (file_size is not None and size != file_size):
+        return False
+
+    if file_path.endswith('.png'):
+        if size < 12:
+            return False
+        with open(file_path, 'rb') as file:
+            file.seek(-12, os.SEEK_END)
+            return file.read(12)[4:8] == b'IEND'
+    if file_path.endswith('.json'):
+        try:
+            with open(file_path, 'r') as json_file:
+                json.load(json_file)
+        except ValueError:
+            return False
+    return True
+
+
+class RenderJournal:
+
+    JOURNAL_NAME = 'render_journal'
+
+    def __init__(self, output_dir, shard_index=None):
+        """
+        Append-only journal of the completed renders of a dataset.
+
+        Every completed (test_case, object, trajectory, index) is written as one json line along with the seed
+        and the output paths, after the image and the annotations are on disk. On restart the journals of
+        all the shards in the output folder are read and the completed work is skipped.
+
+        Keyword arguments:
+            output_dir -- output folder of the dataset: str
+            shard_index -- every shard appends to its own journal file: int
+
+        The annotation writer records renders from its thread, the entries and the journal file are guarded
+        by a lock.
+        """
+        self.output_dir = str(output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        suffix = '' if shard_index is None else f'_shard_{shard_index}'
+        self.journal_path = os.path.join(self.output_dir, f'{self.JOURNAL_NAME}{suffix}.jsonl')
+
+        # (test_case, obj_name, trajectory, index) -> journal entry
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def get_key(test_case, obj_name, index, trajectory=None):
+        return (str(test_case), str(obj_name), trajectory, int(index))
+
+    def get_journal_paths(self):
+        return sorted(glob.glob(os.path.join(self.output_dir, f'{self.JOURNAL_NAME}*.jsonl')))
+
+    def load(self):
+        for journal_path in self.get_journal_paths():
+            with open(journal_path, 'r') as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line of a journal written during a crash.
+                        continue
+                    key = self.get_key(entry['test_case'], entry['obj_name'], entry['index'], entry.get('trajectory'))
+                    self.entries[key] = entry
+        print(f"Render journal : {len(self.entries)} completed renders in {self.output_dir}")
+
+    def is_completed(self, test_case, obj_name, index, trajectory=None):
+        with self.lock:
+            return self.get_key(test_case, obj_name, index, trajectory) in self.entries
+
+    def record(self, test_case, obj_name, index, paths, trajectory=None, seed=None):
+        """
+        Appends a completed render to the journal.
+
+        Keyword arguments:
+            test_case -- name of the test case: str
+            obj_name -- name of the rendered object: str
+            index -- image index: int
+            paths -- paths of the files written for the render: list(str)
+            trajectory -- trajectory index for the trajectory datasets: int
+            seed -- seed of the shard which rendered the image: int
+        """
+        paths = [str(path) for path in paths]
+        entry = {
+            "test_case": str(test_case),
+            "obj_name": str(obj_name),
+            "trajectory": trajectory,
+            "index": int(index),
+            "seed": seed,
+            "paths": paths,
+            "sizes": [os.path.getsize(path) for path in paths],
+        }
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            with open(self.journal_path, 'a') as journal_file:
+                journal_file.write(line)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self.entries[self.get_key(test_case, obj_name, index, trajectory)] = entry
+
+    def verify(self):
+        """
+        Checks the files of all the journal entries, entries with missing or truncated files are removed so
+        they are rendered again. The journals are rewritten into the journal file of this process.
+
+        returns: list of the removed entries
+        """
+        with self.lock:
+            invalid_entries = []
+            for key, entry in list(self.entries.items()):
+                sizes = entry.get('sizes', [None] * len(entry['paths']))
+                if not all(is_file_complete(path, size) for path, size in zip(entry['paths'], sizes)):
+                    invalid_entries.append(entry)
+                    del self.entries[key]
+
+            journal_paths = self.get_journal_paths()
+            temp_path = self.journal_path + f'.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as journal_file:
+                for entry in self.entries.values():
+                    journal_file.write(json.dumps(entry) + '\n')
+            for journal_path in journal_paths:
+                os.remove(journal_path)
+            os.replace(temp_path, self.journal_path)
+
+        print(f"Render journal : {len(invalid_entries)} missing or truncated renders will be rendered again")
+        return invalid_entries
+
+
+def get_render_journal(json_object, output_dir, shard_index=0, num_shards=1):
+    """
+    Returns the render journal of the output folder, or None if resuming is turned off in the requirements file.
+
+    The files are verified when "verify_journal" is "True", for sharded runs this is done once by the
+    launcher before the shards start.
+
+    Keyword arguments:
+        json_object -- json object which contains the data from requirements file: dict
+        output_dir -- output folder of the dataset: str
+        shard_index -- index of the shard: int
+        num_shards -- number of shards rendering the dataset: int
+    """
+    if str(json_object.get('resume', 'True')) != 'True':
+        return None
+    journal = RenderJournal(output_dir, shard_index=shard_index if num_shards > 1 else None)
+    if str(json_object.get('verify_journal', 'False')) == 'True' and num_shards == 1:
+        journal.verify()
+    return journal
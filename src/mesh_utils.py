@@ -0,0 +1,774 @@
+# import modules
+import hashlib
+import itertools
+from collections import OrderedDict
+
+import bmesh
+import bpy
+import numpy as np
+
+
+def get_mesh_vertices(obj):
+    """
+    Returns the vertex coordinates of the mesh object in object local space.
+
+    The coordinates are copied with foreach_get and the temporary mesh is released again.
+
+    Keyword arguments:
+        obj -- blender mesh object
+
+    returns: np.ndarray (N,3) float32
+    """
+    mesh = obj.to_mesh(preserve_all_data_layers=True)
+    try:
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', vertices)
+    finally:
+        obj.to_mesh_clear()
+    return vertices.reshape(-1, 3)
+
+
+def get_world_to_camera_matrix(camera):
+    """
+    Returns the inverse of the normalized camera world matrix as a 4x4 numpy array.
+
+    Keyword arguments:
+        camera -- blender camera object
+    """
+    return np.array(camera.matrix_world.normalized().inverted())
+
+
+def transform_vertices(vertices, matrix):
+    """
+    Applies a 4x4 transformation matrix to a (N,3) array of points.
+
+    Keyword arguments:
+        vertices -- np.ndarray (N,3)
+        matrix -- np.ndarray (4,4)
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return vertices @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def get_camera_frame(camera, scene):
+    """
+    Returns the first three corners of the camera view frame, negated as in find_bounding_box.
+
+    Keyword arguments:
+        camera -- blender camera object
+        scene -- blender scene
+
+    returns: np.ndarray (3,3)
+    """
+    return np.array([list(-v) for v in camera.data.view_frame(scene=scene)[:3]])
+
+
+def get_projection_matrix(camera, scene):
+    """
+    Returns the 4x4 projection matrix of the camera for the render resolution of the scene.
+
+    Keyword arguments:
+        camera -- blender camera object
+        scene -- blender scene
+    """
+    render = scene.render
+    scale = render.resolution_percentage / 100
+    return np.array(camera.calc_matrix_camera(bpy.context.evaluated_depsgraph_get(),
+                                              x=int(render.resolution_x * scale), y=int(render.resolution_y * scale),
+                                              scale_x=render.pixel_aspect_x, scale_y=render.pixel_aspect_y))
+
+
+def project_points(points, view_matrix=None, projection_matrix=None, K=None, R=None, t=None, width=None, height=None):
+    """
+    Projects a batch of 3D points to the image in one pass.
+
+    The points are projected either with the view and projection matrices of the blender camera (OpenGL
+    convention, the camera looks down -Z) or with the camera matrix K and the world to camera pose (R, t) in
+    the OpenCV convention of BOP (the camera looks down +Z, y down).
+
+    Keyword arguments:
+        points -- world coordinates: np.ndarray (N,3)
+        view_matrix -- 4x4 world to camera matrix, eg: get_world_to_camera_matrix: np.ndarray (4,4)
+        projection_matrix -- 4x4 projection matrix, eg: get_projection_matrix: np.ndarray (4,4)
+        K -- camera matrix: np.ndarray (3,3)
+        R, t -- world to camera rotation (3,3) and translation (3,), in the units of the points
+        width, height -- image size in pixels, None gives normalized image coordinates for the view and
+                         projection matrices and skips the image bounds of the in_frustum test for K
+
+    returns: (pixel coordinates np.ndarray (N,2) with y down, depth along the view axis np.ndarray (N,),
+              in_frustum np.ndarray (N,) bool)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+    if K is not None:
+        camera_points = points @ np.asarray(R, dtype=np.float64).T + np.asarray(t, dtype=np.float64).reshape(3)
+        depth = camera_points[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pixels = (camera_points @ np.asarray(K, dtype=np.float64).T)[:, :2] / depth[:, None]
+        in_frustum = depth > 0
+        if width is not None and height is not None:
+            in_frustum &= (pixels[:, 0] >= 0) & (pixels[:, 0] <= width) & (pixels[:, 1] >= 0) & (pixels[:, 1] <= height)
+        return pixels, depth, in_frustum
+
+    assert view_matrix is not None and projection_matrix is not None, "Give the view and projection matrices or K, R and t"
+    homogeneous = np.hstack([points, np.ones((len(points), 1))])
+    view_points = homogeneous @ np.asarray(view_matrix, dtype=np.float64).T
+    clip = view_points @ np.asarray(projection_matrix, dtype=np.float64).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndc = clip[:, :3] / clip[:, 3:]
+    # Same as project_3d_to_2d of the regression dataset, (0, 0) is the top left corner of the image.
+    pixels = np.column_stack([(ndc[:, 0] + 1) / 2 * (1 if width is None else width),
+                              (1 - ndc[:, 1]) / 2 * (1 if height is None else height)])
+    in_frustum = (clip[:, 3] > 0) & np.all(np.abs(ndc) <= 1, axis=1)
+    return pixels, -view_points[:, 2], in_frustum
+
+
+def world_to_camera_view(points, camera, scene):
+    """
+    Batched bpy_extras.object_utils.world_to_camera_view, the camera matrix and the view frame are read once.
+
+    Keyword arguments:
+        points -- world coordinates: np.ndarray (N,3)
+        camera -- blender camera object
+        scene -- blender scene
+
+    returns: np.ndarray (N,3) of the normalized image x, y (0, 0 at the bottom left) and the depth z
+    """
+    camera_points = transform_vertices(np.asarray(points, dtype=np.float64).reshape(-1, 3), get_world_to_camera_matrix(camera))
+    z = -camera_points[:, 2]
+    frame = -get_camera_frame(camera, scene)
+    if camera.data.type == 'ORTHO':
+        scale = np.ones_like(z)
+    else:
+        # The frame is scaled to the depth of every point, as blender does per point.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = -z / frame[0, 2]
+    min_x, max_x = frame[2, 0] * scale, frame[1, 0] * scale
+    min_y, max_y = frame[1, 1] * scale, frame[0, 1] * scale
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (camera_points[:, 0] - min_x) / (max_x - min_x)
+        y = (camera_points[:, 1] - min_y) / (max_y - min_y)
+    if camera.data.type != 'ORTHO':
+        # blender returns the image center for points in the camera plane.
+        x[z == 0.0], y[z == 0.0] = 0.5, 0.5
+    return np.column_stack([x, y, z])
+
+
+def get_camera_space_bounding_box(camera_vertices, frame):
+    """
+    Returns the normalized (min, max) bounding box of vertices given in camera space.
+
+    Vertices behind the camera are ignored. Each vertex is compared against the camera frame
+    scaled to its own depth, the coordinates are clipped to the image. Returns None if the
+    mesh is not in view.
+
+    Keyword arguments:
+        camera_vertices -- np.ndarray (N,3) in camera space
+        frame -- np.ndarray (3,3) from get_camera_frame
+
+    returns: ((min_x, min_y), (max_x, max_y)) or None
+    """
+    z = -camera_vertices[:, 2]
+    in_front = z > 0.0
+    """ Image is not in view if all the mesh verts were ignored """
+    if not np.any(in_front):
+        return None
+
+    co = camera_vertices[in_front]
+    z = z[in_front]
+
+    """ Perspective division of the frame to the depth of every vertex """
+    min_x = frame[1, 0] * z / frame[1, 2]
+    max_x = frame[2, 0] * z / frame[2, 2]
+    min_y = frame[0, 1] * z / frame[0, 2]
+    max_y = frame[1, 1] * z / frame[1, 2]
+
+    x = (co[:, 0] - min_x) / (max_x - min_x)
+    y = (co[:, 1] - min_y) / (max_y - min_y)
+
+    min_x = np.clip(np.min(x), 0.0, 1.0)
+    min_y = np.clip(np.min(y), 0.0, 1.0)
+    max_x = np.clip(np.max(x), 0.0, 1.0)
+    max_y = np.clip(np.max(y), 0.0, 1.0)
+
+    """ Image is not in view if both bounding points exist on the same side """
+    if min_x == max_x or min_y == max_y:
+        return None
+
+    return (min_x, min_y), (max_x, max_y)
+
+
+def compute_convex_hull(obj):
+    """
+    Returns the convex hull vertices of the mesh object in object local space.
+
+    Falls back to all the vertices if no hull can be built, eg: for flat meshes.
+
+    Keyword arguments:
+        obj -- blender mesh object
+
+    returns: np.ndarray (M,3) float32
+    """
+    bm = bmesh.new()
+    try:
+        bm.from_mesh(obj.data)
+        hull = bmesh.ops.convex_hull(bm, input=bm.verts[:], use_existing_faces=False)
+        hull_vertices = [element.co[:] for element in hull['geom'] if isinstance(element, bmesh.types.BMVert)]
+    finally:
+        bm.free()
+
+    if len(hull_vertices) < 4:
+        return get_mesh_vertices(obj)
+    return np.array(hull_vertices, dtype=np.float32)
+
+
+def has_active_modifiers(obj):
+    """
+    Returns True if any modifier of the object is enabled for rendering.
+    """
+    return any(modifier.show_render for modifier in obj.modifiers)
+
+
+class ConvexHullCache:
+
+    def __init__(self):
+        """
+        Keeps the object local convex hull of every imported object in memory.
+
+        The projected bounding box of a mesh is the bounding box of its projected hull vertices,
+        so per frame annotation only has to transform the hull. Entries are dropped as soon as
+        the object has an active modifier, eg: the simple_deform bend, since the local hull no
+        longer describes the rendered mesh.
+        """
+        self.hulls = {}
+
+    def add_object(self, obj):
+        """
+        Computes and stores the convex hull of the object.
+
+        Keyword arguments:
+            obj -- blender mesh object
+        """
+        self.hulls[obj.name] = compute_convex_hull(obj)
+
+    def invalidate(self, obj_name):
+        """
+        Removes the cached hull of the object.
+
+        Keyword arguments:
+            obj_name -- name of the object: str
+        """
+        self.hulls.pop(str(obj_name), None)
+
+    def clear(self):
+        self.hulls.clear()
+
+    def get_vertices(self, obj):
+        """
+        Returns the cached hull vertices or None if the object has no valid hull.
+
+        Keyword arguments:
+            obj -- blender mesh object
+        """
+        if obj.name not in self.hulls:
+            return None
+        if has_active_modifiers(obj):
+            self.invalidate(obj.name)
+            return None
+        return self.hulls[obj.name]
+
+
+# Shared hull cache for the imported objects.
+hull_cache = ConvexHullCache()
+
+
+class PrincipalAxesCache:
+
+    def __init__(self):
+        """
+        Keeps the object local centroid and vertex covariance of every imported object.
+
+        For an affine transform x -> A x + t the centroid maps to A c + t and the covariance to
+        A C A^T, so the camera frame principal axes follow from a 3x3 eigen decomposition instead
+        of np.cov over all the transformed vertices. Entries are dropped when the object has an
+        active modifier.
+        """
+        self.entries = {}
+
+    def add_object(self, obj, vertices=None):
+        """
+        Computes and stores the local centroid and covariance of the object.
+
+        Keyword arguments:
+            obj -- blender mesh object
+            vertices -- object local vertices, read from the mesh if not given: np.ndarray (N,3)
+        """
+        if vertices is None:
+            vertices = get_mesh_vertices(obj)
+        vertices = np.asarray(vertices, dtype=np.float64)
+        self.entries[obj.name] = (np.mean(vertices, axis=0), np.cov(vertices.T))
+
+    def invalidate(self, obj_name):
+        self.entries.pop(str(obj_name), None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_camera_axes(self, obj, camera):
+        """
+        Returns the camera frame centroid and the direction of the largest principal axis.
+
+        Keyword arguments:
+            obj -- blender mesh object
+            camera -- blender camera object
+
+        returns: (centroid, direction) or None if the object has no valid entry.
+        """
+        if obj.name not in self.entries:
+            return None
+        if has_active_modifiers(obj):
+            self.invalidate(obj.name)
+            return None
+
+        centroid, covariance = self.entries[obj.name]
+        matrix = get_world_to_camera_matrix(camera) @ np.array(obj.matrix_world)
+        linear = matrix[:3, :3]
+
+        camera_centroid = linear @ centroid + matrix[:3, 3]
+        eigen_values, eigen_vectors = np.linalg.eigh(linear @ covariance @ linear.T)
+        direction = eigen_vectors[:, np.argmax(eigen_values)]
+
+        return camera_centroid, direction
+
+
+# Shared principal axes cache for the imported objects.
+pca_cache = PrincipalAxesCache()
+
+# Number of farthest point sampled surface keypoints per model.
+NUM_SURFACE_KEYPOINTS = 16
+
+
+def farthest_point_sampling(points, num_samples):
+    """
+    Returns the indices of num_samples points which are spread over the point set, each one farthest from the
+    points picked before it. The first point is the one farthest from the centroid, so the result is deterministic.
+
+    Keyword arguments:
+        points -- np.ndarray (N,3)
+        num_samples -- number of points to pick, at most N: int
+
+    returns: np.ndarray (num_samples,) int
+    """
+    points = np.asarray(points, dtype=np.float64)
+    num_samples = min(int(num_samples), len(points))
+    indices = np.empty(num_samples, dtype=np.intp)
+    if num_samples == 0:
+        return indices
+    indices[0] = np.argmax(np.linalg.norm(points - points.mean(axis=0), axis=1))
+    distances = np.linalg.norm(points - points[indices[0]], axis=1)
+    for i in range(1, num_samples):
+        indices[i] = np.argmax(distances)
+        distances = np.minimum(distances, np.linalg.norm(points - points[indices[i]], axis=1))
+    return indices
+
+
+def compute_keypoints(vertices, hull_vertices=None, num_surface_points=NUM_SURFACE_KEYPOINTS):
+    """
+    Returns the object local keypoints of a model, in this order:
+        8 bounding box corners (x, y, z from min to max, z changing fastest),
+        6 hull extremes (the hull vertices with the lowest and highest x, y and z),
+        num_surface_points farthest point sampled vertices (fewer for meshes with less vertices).
+
+    Keyword arguments:
+        vertices -- object local vertices: np.ndarray (N,3)
+        hull_vertices -- object local convex hull, the vertices are used if None: np.ndarray (M,3)
+        num_surface_points -- number of farthest point sampled keypoints: int
+
+    returns: np.ndarray (K,3) float32
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    hull_vertices = vertices if hull_vertices is None else np.asarray(hull_vertices, dtype=np.float64)
+
+    corners = np.array(list(itertools.product(*zip(vertices.min(axis=0), vertices.max(axis=0)))))
+    extremes = hull_vertices[np.stack([hull_vertices.argmin(axis=0), hull_vertices.argmax(axis=0)], axis=1).ravel()]
+    surface_points = vertices[farthest_point_sampling(vertices, num_surface_points)]
+    return np.concatenate([corners, extremes, surface_points]).astype(np.float32)
+
+
+class KeypointCache:
+
+    def __init__(self):
+        """
+        Keeps the object local keypoints of every imported object, see compute_keypoints.
+
+        The keypoints are sampled once per model (and stored in the asset cache metadata), every frame only
+        transforms and projects the K keypoints, however dense the mesh is. Entries are dropped when the object
+        has an active modifier.
+        """
+        self.keypoints = {}
+
+    def add_object(self, obj, vertices=None, keypoints=None):
+        """
+        Stores the keypoints of the object, they are sampled from its vertices and cached hull if not given.
+
+        Keyword arguments:
+            obj -- blender mesh object
+            vertices -- object local vertices, read from the mesh if not given: np.ndarray (N,3)
+            keypoints -- precomputed keypoints, eg: from the asset cache metadata: np.ndarray (K,3)
+        """
+        if keypoints is None:
+            if vertices is None:
+                vertices = get_mesh_vertices(obj)
+            keypoints = compute_keypoints(vertices, hull_vertices=hull_cache.hulls.get(obj.name))
+        self.keypoints[obj.name] = np.asarray(keypoints, dtype=np.float32)
+
+    def invalidate(self, obj_name):
+        self.keypoints.pop(str(obj_name), None)
+
+    def clear(self):
+        self.keypoints.clear()
+
+    def get_keypoints(self, obj):
+        """
+        Returns the object local keypoints or None if the object has no valid entry.
+        """
+        if obj.name not in self.keypoints:
+            return None
+        if has_active_modifiers(obj):
+            self.invalidate(obj.name)
+            return None
+        return self.keypoints[obj.name]
+
+
+# Shared keypoint cache for the imported objects.
+keypoint_cache = KeypointCache()
+
+
+def get_keypoint_annotations(obj, camera, scene):
+    """
+    Returns the keypoints of the object in the current frame, or None if the object has no cached keypoints.
+
+    keypoints_2d are the pixel coordinates with (0, 0) at the top left of the image, keypoints_3d the camera
+    frame coordinates in meters (x right, y down, z forward as in BOP) and keypoints_visib tells which
+    keypoints are in front of the camera and inside the image.
+
+    Keyword arguments:
+        obj -- blender mesh object
+        camera -- blender camera object
+        scene -- blender scene
+
+    returns: dict with keypoints_2d (K,2), keypoints_3d (K,3) and keypoints_visib (K,) lists
+    """
+    keypoints = keypoint_cache.get_keypoints(obj)
+    if keypoints is None:
+        return None
+    world_points = transform_vertices(keypoints, np.array(obj.matrix_world))
+    camera_points = transform_vertices(world_points, get_world_to_camera_matrix(camera)) * np.array([1.0, -1.0, -1.0])
+
+    co_2d = world_to_camera_view(world_points, camera, scene)
+    scale = scene.render.resolution_percentage / 100
+    width, height = int(scene.render.resolution_x * scale), int(scene.render.resolution_y * scale)
+    pixels = np.column_stack([co_2d[:, 0] * width, height - co_2d[:, 1] * height])
+    visible = (co_2d[:, 2] > 0) & np.all((co_2d[:, :2] >= 0) & (co_2d[:, :2] <= 1), axis=1)
+    return {"keypoints_2d": pixels.tolist(),
+            "keypoints_3d": camera_points.tolist(),
+            "keypoints_visib": visible.tolist()}
+
+
+def cache_object_geometry(obj, hull_vertices=None, keypoints=None):
+    """
+    Fills the per object caches (convex hull, principal axes, keypoints) after an object is imported.
+
+    Keyword arguments:
+        obj -- blender mesh object, with its final origin
+        hull_vertices -- precomputed object local hull, eg: from the asset cache metadata: np.ndarray (M,3)
+        keypoints -- precomputed object local keypoints, eg: from the asset cache metadata: np.ndarray (K,3)
+    """
+    vertices = get_mesh_vertices(obj)
+    if hull_vertices is not None:
+        hull_cache.hulls[obj.name] = np.asarray(hull_vertices, dtype=np.float32)
+    else:
+        hull_cache.add_object(obj)
+    pca_cache.add_object(obj, vertices=vertices)
+    keypoint_cache.add_object(obj, vertices=vertices, keypoints=keypoints)
+
+
+def invalidate_object_geometry(obj_name):
+    """
+    Removes the object from the per object caches, eg: after a deform modifier is added.
+    """
+    hull_cache.invalidate(obj_name)
+    pca_cache.invalidate(obj_name)
+    keypoint_cache.invalidate(obj_name)
+
+
+def clear_object_geometry():
+    hull_cache.clear()
+    pca_cache.clear()
+    keypoint_cache.clear()
+
+
+def get_modifier_state(obj):
+    """
+    Returns a hashable description of the modifier stack of the object.
+
+    Keyword arguments:
+        obj -- blender object
+    """
+    state = []
+    for modifier in obj.modifiers:
+        values = []
+        for prop in modifier.bl_rna.properties:
+            if prop.identifier == 'rna_type' or prop.type in ('POINTER', 'COLLECTION'):
+                continue
+            value = getattr(modifier, prop.identifier)
+            if not isinstance(value, str) and hasattr(value, '__len__'):
+                value = tuple(value)
+            values.append((prop.identifier, value))
+        state.append(tuple(values))
+    return tuple(state)
+
+
+class EvaluatedMeshCache:
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        LRU cache of evaluated world space vertex arrays with a byte budget.
+
+        Entries are keyed by the object name and a hash of its world matrix and modifier stack,
+        so an unchanged object (eg: a static object seen from a moving camera) is only evaluated
+        once. The temporary blender mesh is released right after the vertices are copied.
+
+        Keyword arguments:
+            max_bytes -- maximum size of all cached arrays: int
+        """
+        self.max_bytes = int(max_bytes)
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, obj):
+        """
+        Returns the cache key (name, hash of world matrix and modifiers) of an evaluated object.
+        """
+        digest = hashlib.sha1(np.array(obj.matrix_world, dtype=np.float64).tobytes())
+        digest.update(repr(get_modifier_state(obj)).encode('utf-8'))
+        return obj.name, digest.hexdigest()
+
+    def get_world_vertices(self, obj):
+        """
+        Returns the evaluated vertices of the object in world space, modifiers applied.
+
+        Keyword arguments:
+            obj -- blender mesh object
+
+        returns: np.ndarray (N,3) float32
+        """
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        obj_eval = obj.evaluated_get(depsgraph)
+        key = self.get_key(obj_eval)
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        mesh = obj_eval.to_mesh()
+        try:
+            vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', vertices)
+        finally:
+            obj_eval.to_mesh_clear()
+
+        vertices = transform_vertices(vertices.reshape(-1, 3), np.array(obj_eval.matrix_world))
+        vertices = vertices.astype(np.float32)
+        self.add_entry(key, vertices)
+        return vertices
+
+    def add_entry(self, key, vertices):
+        """
+        Stores the array and evicts the least recently used entries above the byte budget.
+        """
+        # Older poses of the same object are never requested again.
+        for stale_key in [k for k in self.entries if k[0] == key[0]]:
+            self.current_bytes -= self.entries.pop(stale_key).nbytes
+
+        if vertices.nbytes > self.max_bytes:
+            return
+        self.entries[key] = vertices
+        self.current_bytes += vertices.nbytes
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+
+# Shared evaluated mesh cache for the annotation functions.
+mesh_cache = EvaluatedMeshCache()
+
+
+def get_annotation_world_vertices(obj):
+    """
+    Returns the world space vertices used for the projection based annotations.
+
+    The cached convex hull is used when available, otherwise the evaluated mesh.
+
+    Keyword arguments:
+        obj -- blender mesh object
+    """
+    vertices = hull_cache.get_vertices(obj)
+    if vertices is None:
+        return mesh_cache.get_world_vertices(obj)
+    return transform_vertices(vertices, np.array(obj.matrix_world))
+
+
+def find_bounding_box(obj, camera, scene):
+    """
+    Returns the camera space bounding box of the mesh object, see get_camera_space_bounding_box.
+
+    Keyword arguments:
+        obj -- blender mesh object
+        camera -- blender camera object
+        scene -- blender scene
+    """
+    camera_vertices = transform_vertices(get_annotation_world_vertices(obj), get_world_to_camera_matrix(camera))
+    frame = get_camera_frame(camera, scene)
+    return get_camera_space_bounding_box(camera_vertices, frame)
+
+
+def get_camera_space_bounding_boxes(camera_vertices, num_vertices, frame):
+    """
+    Returns the bounding boxes of several meshes at once, see get_camera_space_bounding_box.
+
+    The vertices of the meshes are stacked, every vertex is normalized against the camera frame in one pass
+    and the min/max per mesh are reduced with reduceat. The boxes are the same as get_camera_space_bounding_box
+    gives for every mesh on its own.
+
+    Keyword arguments:
+        camera_vertices -- stacked vertices of all the meshes in camera space: np.ndarray (N,3)
+        num_vertices -- number of vertices of every mesh, all above zero: list(int)
+        frame -- np.ndarray (3,3) from get_camera_frame
+
+    returns: list of ((min_x, min_y), (max_x, max_y)) or None per mesh
+    """
+    starts = np.concatenate([[0], np.cumsum(num_vertices)[:-1]]).astype(np.intp)
+    z = -camera_vertices[:, 2]
+    in_front = z > 0.0
+
+    # Same operations as get_camera_space_bounding_box, the vertices behind the camera are masked afterwards.
+    min_x = frame[1, 0] * z / frame[1, 2]
+    max_x = frame[2, 0] * z / frame[2, 2]
+    min_y = frame[0, 1] * z / frame[0, 2]
+    max_y = frame[1, 1] * z / frame[1, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (camera_vertices[:, 0] - min_x) / (max_x - min_x)
+        y = (camera_vertices[:, 1] - min_y) / (max_y - min_y)
+
+    visible_count = np.add.reduceat(in_front.astype(np.intp), starts)
+    min_xs = np.clip(np.minimum.reduceat(np.where(in_front, x, np.inf), starts), 0.0, 1.0)
+    max_xs = np.clip(np.maximum.reduceat(np.where(in_front, x, -np.inf), starts), 0.0, 1.0)
+    min_ys = np.clip(np.minimum.reduceat(np.where(in_front, y, np.inf), starts), 0.0, 1.0)
+    max_ys = np.clip(np.maximum.reduceat(np.where(in_front, y, -np.inf), starts), 0.0, 1.0)
+
+    boxes = []
+    for i in range(len(starts)):
+        if visible_count[i] == 0 or min_xs[i] == max_xs[i] or min_ys[i] == max_ys[i]:
+            boxes.append(None)
+        else:
+            boxes.append(((min_xs[i], min_ys[i]), (max_xs[i], max_ys[i])))
+    return boxes
+
+
+def find_bounding_boxes(objects, camera, scene):
+    """
+    Returns the camera space bounding boxes of several mesh objects, see find_bounding_box.
+
+    The camera matrix and frame are computed once and all the vertices are transformed with a single matrix
+    operation.
+
+    Keyword arguments:
+        objects -- blender mesh objects
+        camera -- blender camera object
+        scene -- blender scene
+    """
+    if not objects:
+        return []
+    world_vertices = [get_annotation_world_vertices(obj) for obj in objects]
+    camera_vertices = transform_vertices(np.concatenate(world_vertices), get_world_to_camera_matrix(camera))
+    frame = get_camera_frame(camera, scene)
+    return get_camera_space_bounding_boxes(camera_vertices, [len(vertices) for vertices in world_vertices], frame)
+
+
+def get_mesh_triangles(obj):
+    """
+    Returns the object local vertices and the triangles of the mesh object.
+
+    Keyword arguments:
+        obj -- blender mesh object
+
+    returns: (np.ndarray (N,3) float32, np.ndarray (T,3) int32 vertex indices)
+    """
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', triangles)
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', vertices)
+    return vertices.reshape(-1, 3), triangles.reshape(-1, 3)
+
+
+def rasterize_triangles(points, triangles, width, height, max_samples=1 << 22):
+    """
+    Returns the mask of the image pixels whose center lies in any of the 2D triangles.
+
+    Every triangle is tested against the pixel centers of its bounding box, the tests of all the triangles are
+    done in chunks of about max_samples pixels.
+
+    Keyword arguments:
+        points -- pixel coordinates of the vertices: np.ndarray (N,2)
+        triangles -- vertex indices of the triangles: np.ndarray (T,3)
+        width, height -- size of the image in pixels: int
+        max_samples -- number of pixel tests per chunk: int
+
+    returns: np.ndarray (height, width) bool
+    """
+    mask = np.zeros((height, width), dtype=bool)
+    corners = points[triangles]
+
+    # Pixel ranges of the triangle bounding boxes, pixel i has its center at i + 0.5
+    x0 = np.maximum(np.ceil(corners[:, :, 0].min(axis=1) - 0.5), 0).astype(np.int64)
+    x1 = np.minimum(np.floor(corners[:, :, 0].max(axis=1) - 0.5), width - 1).astype(np.int64)
+    y0 = np.maximum(np.ceil(corners[:, :, 1].min(axis=1) - 0.5), 0).astype(np.int64)
+    y1 = np.minimum(np.floor(corners[:, :, 1].max(axis=1) - 0.5), height - 1).astype(np.int64)
+    keep = (x1 >= x0) & (y1 >= y0)
+    corners, x0, x1, y0, y1 = corners[keep], x0[keep], x1[keep], y0[keep], y1[keep]
+    if len(corners) == 0:
+        return mask
+
+    box_widths = x1 - x0 + 1
+    num_samples = box_widths * (y1 - y0 + 1)
+    chunk_ends = np.searchsorted(np.cumsum(num_samples), np.arange(max_samples, num_samples.sum(), max_samples))
+    for chunk in np.split(np.arange(len(corners)), np.unique(chunk_ends + 1)):
+        if len(chunk) == 0:
+            continue
+        counts = num_samples[chunk]
+        sample_triangles = np.repeat(chunk, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        px = x0[sample_triangles] + offsets % box_widths[sample_triangles]
+        py = y0[sample_triangles] + offsets // box_widths[sample_triangles]
+
+        # Signed edge functions of the pixel center, inside if all have the same sign.
+        a, b, c = (corners[sample_triangles, k] for k in range(3))
+        cx, cy = px + 0.5, py + 0.5
+        e0 = (b[:, 0] - a[:, 0]) * (cy - a[:, 1]) - (b[:, 1] - a[:, 1]) * (cx - a[:, 0])
+        e1 = (c[:, 0] - b[:, 0]) * (cy - b[:, 1]) - (c[:, 1] - b[:, 1]) * (cx - b[:, 0])
+        e2 = (a[:, 0] - c[:, 0]) * (cy - c[:, 1]) - (a[:, 1] - c[:, 1]) * (cx - c[:, 0])
+        inside = ((e0 >= 0) & (e1 >= 0) & (e2 >= 0)) | ((e0 <= 0) & (e1 <= 0) & (e2 <= 0))
+        mask[py[inside], px[inside]] = True
+    return mask
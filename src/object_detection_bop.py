@@ -15,8 +15,54 @@ import json
 import numpy as np
 from pathlib import Path
 
+# import custom modules
+import asset_utils
+from bop_utils import BopWriter, get_visibility_annotations
+from tar_utils import TarShardWriter
+import mesh_utils
+import trajectory_utils
+import texture_utils
+
 #sys.path.append(os.getcwd())
 
+# Object ids of the YCB models in models_info.json
+YCB_DATASET_INFO = {'1': 'masterchefcan',
+                    '2': 'crackerbox',
+                    '3': 'sugarbox',
+                    '4': 'tomatosoupcan',
+                    '5': 'mustardbottle',
+                    '6': 'tunafishcan',
+                    '7': 'puddingbox',
+                    '8': 'gelatinbox',
+                    '9': 'pottedmeatcan',
+                    '10': 'banana',
+                    '11': 'pitcherbase',
+                    '12': 'bleachcleanser',
+                    '13': 'bowl',
+                    '14': 'mug',
+                    '15': 'powerdrill',
+                    '16': 'woodblock',
+                    '17': 'scissors',
+                    '18': 'largemarker',
+                    '19': 'largeclamp',
+                    '20': 'extralargeclamp',
+                    '21': 'foambrick'}
+
+
+def get_model_dimensions(dimensions_dict, obj_key):
+    """
+    Returns the size of the model in meters from the models_info.json entry.
+
+    Keyword arguments:
+        dimensions_dict -- json object for models dimensions
+        obj_key -- object id in the json object: str
+    """
+    # Convert mm to meters
+    return [float(dimensions_dict[obj_key]["size_x"])*0.001,
+            float(dimensions_dict[obj_key]["size_y"])*0.001,
+            float(dimensions_dict[obj_key]["size_z"])*0.001]
+
+
 class ObjectDetectionBop:
     
     def __init__(self,background_plane_name,camera_name,light_name,empty_name):
@@ -38,10 +84,9 @@ class ObjectDetectionBop:
         self.scene = bpy.data.scenes['Scene']
 
 
-        # For depth images
+        # For depth images, see setup_render_outputs
         self.scene.use_gravity = True
         self.scene.view_layers['ViewLayer'].use_pass_z= True
-        self.scene.view_layers['ViewLayer'].use_pass_mist = True
 
 
     def add_empty_axis(self,name:str):
@@ -179,14 +224,6 @@ class ObjectDetectionBop:
 
         return background_plane,light_source,camera,axis
     
-    def get_circle_points(self,radius,location,num_points):
-    
-        center_point = np.array(location)
-        theta_values = np.linspace(0, 2*np.pi, num_points)  # Angle values between 0 and 2*pi
-        circle_points = center_point + radius * np.column_stack((np.cos(theta_values), np.sin(theta_values), np.zeros(num_points)))
-
-        return circle_points
-    
     def get_texture_map_paths(self,texture_folder):
         """
         Returns paths for the images which can be used for image textures.
@@ -194,45 +231,7 @@ class ObjectDetectionBop:
         Keyword arguments:
             texture_folder-- Path for the folder containing the images.
         """
-        texture_dict = {
-            "normal_map": None,
-            "base_color": None,
-            "disp_map": None,
-            "metal_map": None,
-            "roughness_map": None
-        }
-
-        files = os.listdir(path=texture_folder)
-        for file in files:
-            # Match the files and seperate
-            nrm_match = re.search(r'\wnormal', file) or re.search(
-                r'\wNRM', file) or re.search(r'\wnor', file)
-            base_match = re.search(r'\wbasecolor', file) or re.search(
-                r'\wCOL_VAR1', file) or re.search(r'\wdiff', file) or re.search(r'\wcol', file)
-            disp_match = re.search(r'\wDISP_4K', file) or re.search(
-                r'\wheight', file) or re.search(r'\wdisplacement', file) or re.search(r'\wdisp', file)
-            metal_match = re.search(r'\wmetallic', file) or re.search(
-                r'\wREFL', file) or re.search(r'\wmetal', file)
-            rough_match = re.search(r'\wroughness', file) or re.search(
-                r'\wGLOSS', file) or re.search(r'\wrough', file)
-
-            if nrm_match:
-                normal_map = os.path.join(texture_folder, file)
-                texture_dict['normal_map'] = normal_map
-
-            if base_match:
-                base_color = os.path.join(texture_folder, file)
-                texture_dict['base_color'] = base_color
-            if disp_match:
-                disp_map = os.path.join(texture_folder, file)
-                texture_dict['disp_map'] = disp_map
-            if metal_match:
-                metal_map = os.path.join(texture_folder, file)
-                texture_dict['metal_map'] = metal_map
-            if rough_match:
-                roughness_map = os.path.join(texture_folder, file)
-                texture_dict['roughness_map'] = roughness_map
-        return texture_dict
+        return texture_utils.get_texture_map_paths(texture_folder=texture_folder)
 
     def get_texture_paths(self,texture_dir):
         """
@@ -241,16 +240,8 @@ class ObjectDetectionBop:
         Keyword arguments:
             texture_dir-- path for the directory containig the textures.
         """
-        bnames = os.listdir(texture_dir)
-        for i, cs in enumerate(zip(*bnames)):
-            if len(set(cs)) != 1:
-                break
-        for _i, cs in enumerate(zip(*[b[::-1] for b in bnames])):
-            if len(set(cs)) != 1:
-                break
-        texture_paths = [os.path.join(texture_dir, bname+'/')
-                            for bname in bnames if not bname.endswith('.md')]
-        return texture_paths
+        # The directory is scanned once, see texture_utils.TextureIndex
+        return texture_utils.get_texture_index(texture_dir).texture_paths
 
     def set_random_pbr_img_textures(self,textures_path, obj_name, scale):
         """
@@ -261,115 +252,14 @@ class ObjectDetectionBop:
             obj_name-- name of the object to change the materail/texture
         """
 
-        texture_paths = self.get_texture_paths(textures_path)
-        # print("Texture paths : ",texture_paths)
-        texture_path = random.choice(texture_paths)
-
-        material_name = str(texture_path.split('/')[-2])
-        texture_dict = self.get_texture_map_paths(texture_folder=texture_path)
-
-        # create a new material with the name.
-        material = bpy.data.materials.new(
-            name=material_name)  # Change name everytime
-        material.use_nodes = True
-
-        # Create the nodes for the material
-
-        # Nodes for controlling the texture
-        texture_coordinate = material.node_tree.nodes.new(
-            type="ShaderNodeTexCoord")
-        mapping_node = material.node_tree.nodes.new(type="ShaderNodeMapping")
-        mapping_node.inputs['Scale'].default_value = (
-            scale, scale, scale)  # Control the scale of the texture
-
-        # Create vector nodes
-        normal_map = material.node_tree.nodes.new(type="ShaderNodeNormalMap")
-        displacement_map = material.node_tree.nodes.new(
-            type="ShaderNodeDisplacement")
-        bump_map = material.node_tree.nodes.new(type="ShaderNodeBump")
-        invert_node = material.node_tree.nodes.new(type="ShaderNodeInvert")
-
-        # Nodes for principled bsdf and output
-        principled_bsdf = material.node_tree.nodes['Principled BSDF']
-        material_output = material.node_tree.nodes['Material Output']
-
-        # Connect the nodes
-        material.node_tree.links.new(
-            texture_coordinate.outputs['UV'], mapping_node.inputs['Vector'])
-        # Nodes for image textures
-        # Base color
-        if texture_dict['base_color'] != None:
-            base_color_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            base_color_img.image = bpy.data.images.load(
-                texture_dict['base_color'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], base_color_img.inputs['Vector'])
-            material.node_tree.links.new(
-                base_color_img.outputs['Color'], principled_bsdf.inputs['Base Color'])
-
-        # Normal map
-        if texture_dict['normal_map'] != None:
-            normal_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            normal_img.image = bpy.data.images.load(texture_dict['normal_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], normal_img.inputs['Vector'])
-            material.node_tree.links.new(
-                normal_img.outputs['Color'], normal_map.inputs['Color'])
-            material.node_tree.links.new(
-                normal_map.outputs['Normal'], principled_bsdf.inputs['Normal'])
-
-        # Displacement map
-        if texture_dict['disp_map'] != None:
-            displacement_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            displacement_img.image = bpy.data.images.load(
-                texture_dict['disp_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], displacement_img.inputs['Vector'])
-            material.node_tree.links.new(
-                displacement_img.outputs['Color'], displacement_map.inputs['Height'])
-            material.node_tree.links.new(
-                displacement_map.outputs['Displacement'], material_output.inputs['Displacement'])
-
-        # Roughness map
-        if texture_dict['roughness_map'] != None:
-            roughness_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            roughness_img.image = bpy.data.images.load(
-                texture_dict['roughness_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], roughness_img.inputs['Vector'])
-            material.node_tree.links.new(
-                roughness_img.outputs['Color'], invert_node.inputs['Color'])
-            material.node_tree.links.new(
-                invert_node.outputs['Color'], principled_bsdf.inputs['Roughness'])
-
-        # Metal map
-        if texture_dict['metal_map'] != None:
-            metallic_img = material.node_tree.nodes.new(
-                type="ShaderNodeTexImage")
-            metallic_img.image = bpy.data.images.load(
-                texture_dict['metal_map'])
-            material.node_tree.links.new(
-                mapping_node.outputs['Vector'], metallic_img.inputs['Vector'])
-            material.node_tree.links.new(
-                metallic_img.outputs['Color'], principled_bsdf.inputs['Metallic'])
-
-        # Set material final output
-        material.node_tree.links.new(
-            principled_bsdf.outputs['BSDF'], material_output.inputs['Surface'])
+        texture_path = texture_utils.get_texture_index(textures_path).random_texture_path()
+
+        # Materials are built once per texture folder and reused afterwards.
+        material = texture_utils.material_pool.get_material(texture_path=texture_path, scale=scale)
 
         # Set the material to the object
         obj = self.scene.objects[obj_name]
-
-        if obj.data.materials:
-            obj.data.materials.append(material)
-            obj.active_material = bpy.data.materials[material_name]
-        else:
-            obj.data.materials.append(material)
-            obj.active_material = material
+        texture_utils.assign_material(obj, material)
 
         return material
     
@@ -422,7 +312,7 @@ class ObjectDetectionBop:
         # Take picture of current visible scene
         bpy.ops.render.render(write_still=True)
 
-    def import_ycb_objects_with_dimensions(self,models_dir,dimensions_dict,class_to_index):
+    def import_ycb_objects_with_dimensions(self,models_dir,dimensions_dict,class_to_index,asset_cache_dir=None):
         """
         adds objects from cad format(.obj format) along with their materials.
 
@@ -430,56 +320,37 @@ class ObjectDetectionBop:
             models_dir: path for the models
             dimensions_dict: json object for models dimensions
             class_to_index: dict {class names:idx}, eg: {'cracker_box':2,etc...}
+            asset_cache_dir: directory of the normalized .blend models, eg: from preprocess_models.py.
+                             If None every model is imported from the OBJ file.
         """
-        scene = self.scene
         object_names = []
-        obj_files = []
-        # Iterate through all subdirectories in the base path
-        for root, dirs, files in os.walk(models_dir):
-            # Iterate through all files in the current directory
-            for file in files:
-                # Check if the file is an OBJ file
-                if file.endswith(".obj"):
-                    # Construct the full path to the OBJ file
-                    object_file = os.path.join(root, file)
-                    obj_files.append(object_file)
-
-        # Clear the scene
-        # bpy.ops.wm.read_factory_settings()
-        # self.clear_scene()
-        for idx, object_file in enumerate(obj_files):
+        obj_files = asset_utils.find_obj_files(models_dir)
+
+        asset_cache = None
+        if asset_cache_dir is not None:
+            asset_cache = asset_utils.AssetCache(cache_dir=asset_cache_dir)
 
-            obj_name = "".join(object_file.split('/')[-3].split('_')[1::])
-            obj_key = class_to_index[obj_name]
+        for idx, object_file in enumerate(obj_files):
 
-            # Import the OBJ file
-            bpy.ops.import_scene.obj(filepath=object_file)
+            obj_name = asset_utils.get_obj_name(object_file, dataset_name='ycb')
+            dimensions = get_model_dimensions(dimensions_dict, class_to_index[obj_name])
 
-            # Set the active object to the imported object
-            imported_object = bpy.context.selected_objects[-1]
-            # Rename the new object
-            imported_object.name = str(obj_name)
-            object_names.append(imported_object.name)
+            metadata = None
+            if asset_cache is not None:
+                # Append the normalized model from the cache, import and cache it on the first run.
+                imported_object, metadata = asset_cache.load_or_import(object_file, obj_name,
+                                                                       import_function=asset_utils.import_obj_model_with_dimensions,
+                                                                       dimensions=dimensions)
+            else:
+                imported_object = asset_utils.import_obj_model_with_dimensions(object_file, obj_name, dimensions=dimensions)
 
             if imported_object is not None:
-                # Get the maximum dimension of the object
-                imported_object.dimensions.x = float(dimensions_dict[obj_key]["size_x"])*0.001 # Convert mm to meters
-                imported_object.dimensions.y = float(dimensions_dict[obj_key]["size_y"])*0.001
-                imported_object.dimensions.z = float(dimensions_dict[obj_key]["size_z"])*0.001
-                # Rotate the objects so that they appear in standing pose
-                # imported_object.rotation_euler = (-90,0,0)
-
-                # Set the origin of the object to its center
-                imported_object.select_set(True)
-                bpy.context.view_layer.objects.active = imported_object
-                
-                bpy.ops.object.origin_set(
-                    type='ORIGIN_CENTER_OF_VOLUME', center='BOUNDS')
-                
-                imported_object.location = (0,0,0)
-                imported_object.rotation_euler = (0,0,0)
-                
-                self.adjust_object_position(obj=imported_object,target_size=0.001)
+                object_names.append(imported_object.name)
+                # Cache the convex hull, principal axes and keypoints for the annotations.
+                hull_vertices = metadata['hull'] if metadata is not None else None
+                # The metadata of models cached before the keypoints were added has none, they are sampled on import.
+                keypoints = metadata.get('keypoints') if metadata is not None else None
+                mesh_utils.cache_object_geometry(imported_object, hull_vertices=hull_vertices, keypoints=keypoints)
             else:
                 print("Error: Object is None")
 
@@ -589,12 +460,13 @@ class ObjectDetectionBop:
         cam_K = K.flatten().tolist()
         return cam_K
 
-    def get_scene_camera_parameters(self,camera_object):
+    def get_scene_camera_parameters(self,camera_object,depth_scale=10):
         """
         Creates the scene parameters for the BOP annotations
 
         Keyword argument:
             camera_object: blender's camera object
+            depth_scale: depth in mm = depth image value * depth_scale
         """
             
         # transformation of camera with respect to world.
@@ -617,7 +489,7 @@ class ObjectDetectionBop:
         scene_parameters = {"cam_K": self.get_k_matrix(camera_object), 
                             "cam_R_w2c": cam_R_w2c, 
                             "cam_t_w2c": cam_t_w2c,  
-                            "depth_scale": 10}
+                            "depth_scale": depth_scale}
 
         return scene_parameters
 
@@ -687,6 +559,93 @@ class ObjectDetectionBop:
 
         return annotations
 
+    def get_frame_annotations(self,object_names,camera_object,mesh2class,depth_scale=10):
+        """
+        Returns the scene_camera, scene_gt and scene_gt_info annotations of a frame for all the objects at once.
+
+        Same content as get_scene_camera_parameters, get_scene_gt_parameters and get_scene_gt_info_parameters, but
+        the camera inverse is computed once, the object poses come from one (N,4,4) matrix product and the
+        bounding boxes of all the objects from one projection, see mesh_utils.find_bounding_boxes.
+
+        Keyword arguments:
+            object_names -- list of object names : [str,str, etc..,]
+            camera_object -- blender's camera object
+            mesh2class -- dict of mesh names to index eg: {'cracker_box':2,etc..,}
+            depth_scale -- depth in mm = depth image value * depth_scale
+
+        returns: (scene_camera, scene_gt, scene_gt_info)
+        """
+        # transformation of camera with respect to world, rotated 180 degrees in x axis as in get_scene_camera_parameters.
+        T_c2w = np.array(camera_object.matrix_world)
+        rot_x = np.array([[1, 0, 0],
+                          [0, -1, 0],
+                          [0, 0, -1]])
+        T_c2w[:3,:3] = T_c2w[:3,:3] @ rot_x
+        T_w2c = np.linalg.inv(T_c2w)
+
+        scene_camera = {"cam_K": self.get_k_matrix(camera_object),
+                        "cam_R_w2c": T_w2c[:3, :3].flatten().tolist(),
+                        "cam_t_w2c": (T_w2c[:3,3]*1000).flatten().tolist(),
+                        "depth_scale": depth_scale}
+
+        objects = [self.scene.objects[obj_name] for obj_name in object_names]
+        if not objects:
+            return scene_camera, [], []
+
+        # (N,4,4) model to camera transformations
+        T_m2w = np.stack([np.array(obj.matrix_world) for obj in objects])
+        T_m2c = T_w2c @ T_m2w
+        cam_R_m2c = T_m2c[:, :3, :3].reshape(len(objects), 9).tolist()
+        cam_t_m2c = (T_m2c[:, :3, 3]*1000).tolist()
+
+        scene_gt = [{"cam_R_m2c": cam_R_m2c[i],
+                     "cam_t_m2c": cam_t_m2c[i],
+                     "obj_id": int(mesh2class[obj_name]),
+                     "obj_name": obj_name} for i, obj_name in enumerate(object_names)]
+
+        b_boxes = mesh_utils.find_bounding_boxes(objects, camera=camera_object, scene=self.scene)
+        scene_gt_info = [self.format_coordinates(b_box, obj_name, mesh2class) if b_box else ''
+                         for obj_name, b_box in zip(object_names, b_boxes)]
+
+        return scene_camera, scene_gt, scene_gt_info
+
+    def add_keypoint_annotations(self,scene_gt,camera_object):
+        """
+        Adds the keypoints of the objects to their scene_gt entries, as the extension fields keypoints_2d (pixels),
+        keypoints_3d (camera frame in mm, as cam_t_m2c) and keypoints_visib (in front of the camera and in the image).
+
+        The keypoints of all the objects are transformed with the scene_gt poses and projected with the camera
+        matrix in one call, objects without cached keypoints are skipped.
+
+        Keyword arguments:
+            scene_gt -- list from get_frame_annotations
+            camera_object -- blender's camera object
+        """
+        entries, camera_points = [], []
+        for gt in scene_gt:
+            keypoints = mesh_utils.keypoint_cache.get_keypoints(self.scene.objects[gt['obj_name']])
+            if keypoints is None:
+                continue
+            R = np.array(gt['cam_R_m2c']).reshape(3, 3)
+            camera_points.append(keypoints * 1000 @ R.T + np.array(gt['cam_t_m2c']))
+            entries.append(gt)
+        if not entries:
+            return scene_gt
+
+        scale = self.scene.render.resolution_percentage / 100
+        K = np.array(self.get_k_matrix(camera_object), dtype=np.float64).reshape(3, 3)
+        num_keypoints = np.cumsum([len(points) for points in camera_points])[:-1]
+        camera_points = np.concatenate(camera_points)
+        pixels, _, visible = mesh_utils.project_points(camera_points, K=K, R=np.eye(3), t=np.zeros(3),
+                                                       width=self.scene.render.resolution_x * scale,
+                                                       height=self.scene.render.resolution_y * scale)
+        for gt, gt_pixels, gt_points, gt_visible in zip(entries, np.split(pixels, num_keypoints),
+                                                        np.split(camera_points, num_keypoints), np.split(visible, num_keypoints)):
+            gt.update({"keypoints_2d": gt_pixels.tolist(),
+                       "keypoints_3d": gt_points.tolist(),
+                       "keypoints_visib": gt_visible.tolist()})
+        return scene_gt
+
     def format_coordinates(self,coordinates, mesh_name,mesh2class):
 
         """
@@ -730,71 +689,10 @@ class ObjectDetectionBop:
         """
         Returns camera space bounding box of the mesh object.
 
-        Gets the camera frame bounding box, which by default is returned without any transformations applied.
-        Create a new mesh object based on self.carre_bleu and undo any transformations so that it is in the same space as the
-        camera frame. Find the min/max vertex coordinates of the mesh visible in the frame, or None if the mesh is not in view.
+        The vertex coordinates are read with foreach_get and transformed into the camera frame with a single
+        matrix operation. Find the min/max vertex coordinates of the mesh visible in the frame, or None if the mesh is not in view.
         """
-
-        """ Get the inverse transformation matrix. """
-        matrix = camera.matrix_world.normalized().inverted()
-        """ Create a new mesh data block, using the inverse transform matrix to undo any transformations. """
-        mesh = obj.to_mesh(preserve_all_data_layers=True)
-        mesh.transform(obj.matrix_world)
-        mesh.transform(matrix)
-
-        """ Get the world coordinates for the camera frame bounding box, before any transformations. """
-        frame = [-v for v in camera.data.view_frame(scene=self.scene)[:3]]
-
-        lx = []
-        ly = []
-
-        for v in mesh.vertices:
-            co_local = v.co
-            z = -co_local.z
-
-            if z <= 0.0:
-                """ Vertex is behind the camera; ignore it. """
-                continue
-            else:
-                """ Perspective division """
-                frame = [(v / (v.z / z)) for v in frame]
-
-            min_x, max_x = frame[1].x, frame[2].x
-            min_y, max_y = frame[0].y, frame[1].y
-
-            x = (co_local.x - min_x) / (max_x - min_x)
-            y = (co_local.y - min_y) / (max_y - min_y)
-
-            lx.append(x)
-            ly.append(y)
-
-
-        """ Image is not in view if all the mesh verts were ignored """
-        if not lx or not ly:
-            return None
-
-        min_x = np.clip(min(lx), 0.0, 1.0)
-        min_y = np.clip(min(ly), 0.0, 1.0)
-        max_x = np.clip(max(lx), 0.0, 1.0)
-        max_y = np.clip(max(ly), 0.0, 1.0)
-
-        """ Image is not in view if both bounding points exist on the same side """
-        if min_x == max_x or min_y == max_y:
-            return None
-
-        """ Figure out the rendered image size """
-        render = self.scene.render
-        fac = render.resolution_percentage * 0.01
-        dim_x = render.resolution_x * fac
-        dim_y = render.resolution_y * fac
-        
-        ## Verify there's no coordinates equal to zero
-        coord_list = [min_x, min_y, max_x, max_y]
-        if min(coord_list) == 0.0:
-            indexmin = coord_list.index(min(coord_list))
-            coord_list[indexmin] = coord_list[indexmin] + 0.0000001
-
-        return (min_x, min_y), (max_x, max_y)
+        return mesh_utils.find_bounding_box(obj=obj, camera=camera, scene=self.scene)
 
     def get_all_coordinates(self,camera,mesh_name,mesh2class):
         """
@@ -812,17 +710,184 @@ class ObjectDetectionBop:
             with open(file_path,'w') as file:
                 json.dump(annotations_dict, file)
 
+    def setup_render_outputs(self,depth_dir,depth_format='PNG',depth_scale=10,mist_dir=None,index_dir=None):
+        """
+        Sets up File Output nodes in the compositor, so a single render writes the RGB image to the render
+        filepath and the depth (and mist, object index) images to their folders.
+
+        The depth is written in units of depth_scale millimeters as in the BOP format, pixels without any
+        surface are 0. PNG images are 16 bit, OPEN_EXR images are 32 bit float. PNG passes need the per node
+        color management of blender 4.0 and newer, older versions would apply the view transform of the scene
+        (Filmic by default) to the values, so the PNG passes are written as OPEN_EXR instead. The format used
+        for the depth images is stored in self.depth_format.
+
+        Keyword arguments:
+            depth_dir -- folder for the depth images: str
+            depth_format -- 'PNG' or 'OPEN_EXR': str
+            depth_scale -- depth in mm = image value * depth_scale: float
+            mist_dir -- folder for the mist images, in the format of the depth images, None to skip the mist pass: str
+            index_dir -- folder for the 32 bit object index images (see set_pass_indices), None to skip the pass: str
+
+        returns: list of the File Output nodes, in the order depth, mist, index
+        """
+        if depth_format != 'OPEN_EXR' and 'color_management' not in bpy.types.ImageFormatSettings.bl_rna.properties:
+            print(f"Warning: {depth_format} passes would be tone mapped by the view transform before blender 4.0, "
+                  "the depth and mist images are written as OPEN_EXR")
+            depth_format = 'OPEN_EXR'
+        self.depth_format = depth_format
+
+        view_layer = self.scene.view_layers['ViewLayer']
+        view_layer.use_pass_z = True
+        view_layer.use_pass_mist = mist_dir is not None
+        view_layer.use_pass_object_index = index_dir is not None
+
+        self.scene.use_nodes = True
+        tree = self.scene.node_tree
+        links = tree.links
+
+        render_layers_node = tree.nodes.get('Render Layers') or tree.nodes.new(type='CompositorNodeRLayers')
+        composite_node = tree.nodes.get('Composite') or tree.nodes.new(type='CompositorNodeComposite')
+        links.new(render_layers_node.outputs['Image'], composite_node.inputs['Image'])
+
+        def add_file_output(base_path, file_format, color_depth):
+            output_node = tree.nodes.new(type='CompositorNodeOutputFile')
+            output_node.base_path = base_path
+            output_node.format.file_format = file_format
+            output_node.format.color_mode = 'BW'
+            output_node.format.color_depth = color_depth
+            # The frame number is set to the image index before every render, see set_output_index
+            output_node.file_slots[0].path = '######'
+            if hasattr(output_node.format, 'color_management'):
+                # Store the values without the view transform of the scene (blender 4.0 and newer).
+                output_node.format.color_management = 'OVERRIDE'
+                output_node.format.view_settings.view_transform = 'Raw'
+            return output_node
+
+        # depth in meters -> depth in units of depth_scale mm, the background (z beyond clip end) is set to 0.
+        camera = self.scene.objects[self.camera_name]
+        to_depth_units = tree.nodes.new(type='CompositorNodeMath')
+        to_depth_units.operation = 'MULTIPLY'
+        to_depth_units.inputs[1].default_value = 1000.0 / depth_scale
+        if depth_format == 'PNG':
+            # 16 bit PNG maps [0,1] to [0,65535].
+            to_depth_units.inputs[1].default_value /= 65535.0
+        in_range = tree.nodes.new(type='CompositorNodeMath')
+        in_range.operation = 'LESS_THAN'
+        in_range.inputs[1].default_value = camera.data.clip_end
+        mask_background = tree.nodes.new(type='CompositorNodeMath')
+        mask_background.operation = 'MULTIPLY'
+
+        links.new(render_layers_node.outputs['Depth'], to_depth_units.inputs[0])
+        links.new(render_layers_node.outputs['Depth'], in_range.inputs[0])
+        links.new(to_depth_units.outputs[0], mask_background.inputs[0])
+        links.new(in_range.outputs[0], mask_background.inputs[1])
+
+        depth_output = add_file_output(depth_dir, depth_format, '16' if depth_format == 'PNG' else '32')
+        links.new(mask_background.outputs[0], depth_output.inputs[0])
+        output_nodes = [depth_output]
+
+        if mist_dir is not None:
+            mist_output = add_file_output(mist_dir, depth_format, '16' if depth_format == 'PNG' else '32')
+            links.new(render_layers_node.outputs['Mist'], mist_output.inputs[0])
+            output_nodes.append(mist_output)
+
+        if index_dir is not None:
+            index_output = add_file_output(index_dir, 'OPEN_EXR', '32')
+            links.new(render_layers_node.outputs['IndexOB'], index_output.inputs[0])
+            output_nodes.append(index_output)
+
+        return output_nodes
+
+    def set_pass_indices(self,object_names,mesh2class):
+        """
+        Sets the pass index of every object to its object id, the object index pass is 0 for the background.
+        """
+        for obj_name in object_names:
+            self.scene.objects[obj_name].pass_index = int(mesh2class[obj_name])
+
+    def read_pass_image(self,file_path):
+        """
+        Returns the values of a pass written by a File Output node as a (H,W) float array, row 0 at the top.
+        """
+        image = bpy.data.images.load(file_path, check_existing=False)
+        try:
+            # Read the stored values, PNG images would be converted from sRGB otherwise.
+            image.colorspace_settings.name = 'Non-Color'
+            width, height = image.size
+            pixels = np.empty(width * height * image.channels, dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+        finally:
+            bpy.data.images.remove(image)
+        # Blender stores the rows from the bottom.
+        return pixels.reshape(height, width, -1)[::-1, :, 0]
+
+    def read_index_map(self,file_path):
+        """
+        Returns the object index pass written by the index File Output node as a (H,W) int array, row 0 at the top.
+        """
+        return np.rint(self.read_pass_image(file_path)).astype(np.int32)
+
+    def get_object_masks(self,scene_gt,camera_object):
+        """
+        Returns the silhouettes of the objects without occlusion, by projecting their triangles with the scene_gt
+        poses and the camera matrix.
+
+        Keyword arguments:
+            scene_gt -- list from get_frame_annotations or get_scene_gt_parameters
+            camera_object -- blender's camera object
+
+        returns: np.ndarray (N,H,W) bool
+        """
+        scale = self.scene.render.resolution_percentage / 100
+        width = int(self.scene.render.resolution_x * scale)
+        height = int(self.scene.render.resolution_y * scale)
+        K = np.array(self.get_k_matrix(camera_object), dtype=np.float64).reshape(3, 3)
+        if not hasattr(self, 'mesh_triangles'):
+            self.mesh_triangles = {}
+
+        masks = np.zeros((len(scene_gt), height, width), dtype=bool)
+        for i, gt in enumerate(scene_gt):
+            obj_name = gt['obj_name']
+            if obj_name not in self.mesh_triangles:
+                # The meshes are not deformed, the triangles are read once per object.
+                self.mesh_triangles[obj_name] = mesh_utils.get_mesh_triangles(self.scene.objects[obj_name])
+            vertices, triangles = self.mesh_triangles[obj_name]
+
+            R = np.array(gt['cam_R_m2c']).reshape(3, 3)
+            t = np.array(gt['cam_t_m2c']) / 1000
+            camera_vertices = vertices @ R.T + t
+            # Triangles reaching behind the camera are not projected.
+            triangles = triangles[(camera_vertices[triangles, 2] > 1e-6).all(axis=1)]
+            points = camera_vertices[:, :2] / np.maximum(camera_vertices[:, 2:], 1e-6) * K[[0, 1], [0, 1]] + K[:2, 2]
+            masks[i] = mesh_utils.rasterize_triangles(points, triangles, width, height)
+        return masks
+
+    def save_mask(self,mask,file_path):
+        """
+        Saves a (H,W) bool mask as a PNG image, 255 for the object pixels.
+        """
+        height, width = mask.shape
+        image = bpy.data.images.get('bop_mask')
+        if image is None or tuple(image.size) != (width, height):
+            if image is not None:
+                bpy.data.images.remove(image)
+            image = bpy.data.images.new('bop_mask', width=width, height=height, alpha=False)
+        pixels = np.ones((height, width, 4), dtype=np.float32)
+        pixels[:, :, :3] = mask[::-1, :, None]
+        image.pixels.foreach_set(pixels.ravel())
+        image.filepath_raw = file_path
+        image.file_format = 'PNG'
+        image.save()
+
+    def set_output_index(self,idx):
+        """
+        Sets the index used in the file names of the File Output nodes, eg: 000012.png
+        """
+        self.scene.frame_current = int(idx)
+
     def get_rotation_values_z(self,num_points:int):
         return np.linspace(0, 360, int(num_points))
-    
-    def set_camera_rotation(self):
 
-        camera = self.scene.objects[self.camera_name]
-        target_location = bpy.data.objects[self.empty_name].location
-        direction = target_location - camera.location
-        rotation_matrix = direction.to_track_quat('-Z', 'Y')
-        camera.rotation_euler = rotation_matrix.to_euler()
-    
 
 if __name__ == '__main__':
 
@@ -838,37 +903,31 @@ if __name__ == '__main__':
     TEXTURES_DIR = os.path.join(PARENT_DIR,'blender_files/constraint_textures/')
     MODELS_DIR = os.path.join(PARENT_DIR,'blender_files/models/YCB_models/models/')
     MODELS_DIM_JSON = os.path.join(PARENT_DIR,'src/models_info.json')
+    # Normalized .blend copies of the models, see preprocess_models.py
+    ASSET_CACHE_DIR = os.path.join(PARENT_DIR,'blender_files/asset_cache/')
 
     SAVE_DIR = os.path.join(os.getcwd(),'results/scene1/')
 
-    RGB_DIR = SAVE_DIR+'rgb/'
-    DEPTH_DIR = SAVE_DIR+'depth/'
-    JSON_DIR = SAVE_DIR
+    # Write the mist pass to the mist/ folder as well.
+    WRITE_MIST = False
+    # Write the mask/ and mask_visib/ images and the visibility fields of scene_gt_info, from the object index pass.
+    WRITE_MASKS = True
+    # Add the keypoints of the objects (bbox corners, hull extremes, surface points) to scene_gt.json.
+    WRITE_KEYPOINTS = True
+    # Split the images into BOP scene folders 000000/, 000001/, ... of this many images, None for a single folder.
+    IMAGES_PER_SCENE = None
+    # Pack the rgb/depth images and the annotations of every frame into tar shards of this many MB, None to keep the files.
+    TAR_SHARD_SIZE_MB = None
     
     NUM_OF_IMAGES = 10
     RES_X = 1280
     RES_Y = 720
-    dataset_info = {'1': 'masterchefcan',
-                '2': 'crackerbox',
-                '3': 'sugarbox',
-                '4': 'tomatosoupcan',
-                '5': 'mustardbottle',
-                '6': 'tunafishcan',
-                '7': 'puddingbox',
-                '8': 'gelatinbox',
-                '9': 'pottedmeatcan',
-                '10': 'banana',
-                '11': 'pitcherbase',
-                '12': 'bleachcleanser',
-                '13': 'bowl',
-                '14': 'mug',
-                '15': 'powerdrill',
-                '16': 'woodblock',
-                '17': 'scissors',
-                '18': 'largemarker',
-                '19': 'largeclamp',
-                '20': 'extralargeclamp',
-                '21': 'foambrick'}
+    # 'PNG' (16 bit, BOP) or 'OPEN_EXR', the depth image value * DEPTH_SCALE is the depth in mm.
+    DEPTH_FORMAT = 'PNG'
+    DEPTH_SCALE = 10
+    # Camera poses of the frames, see trajectory_utils.get_camera_poses, eg: {"type": "fibonacci", "radius": [1.5, 2.0], "min_elevation": 20}
+    CAMERA_TRAJECTORY = {"type": "rings", "radius": 1.5, "heights": [1.6]}
+    dataset_info = YCB_DATASET_INFO
     
     # Dictionary for class names to index
     class_to_idx = {value: key for key, value in dataset_info.items()}
@@ -885,7 +944,8 @@ if __name__ == '__main__':
                                           empty_name='Main_axis')
 
     # import ycb objects with dimensions
-    detection_helper.import_ycb_objects_with_dimensions(models_dir=MODELS_DIR,dimensions_dict=dimensions_data,class_to_index=class_to_idx)
+    detection_helper.import_ycb_objects_with_dimensions(models_dir=MODELS_DIR,dimensions_dict=dimensions_data,class_to_index=class_to_idx,
+                                                        asset_cache_dir=ASSET_CACHE_DIR)
     
     # Add object detection scene.
     detection_helper.add_object_detection_scene(plane_size=5.0,camera_z_location=2.0,axis_x_rotation=45)
@@ -909,6 +969,8 @@ if __name__ == '__main__':
                                                      empty_name=detection_helper.empty_name
                                                      )
     print(f"\nObjects present in the scene are {len(object_names)} : {object_names}  ")
+    # The object index pass shows the obj_id of the object in front at every pixel.
+    detection_helper.set_pass_indices(object_names=object_names, mesh2class=class_to_idx)
     
     # Place the objects randomly in a circular arrangement.
     detection_helper.place_objects_randomly(radius=0.25)
@@ -917,69 +979,87 @@ if __name__ == '__main__':
     material = None
     material = detection_helper.set_random_pbr_img_textures(textures_path=TEXTURES_DIR,obj_name=detection_helper.background_plane_name,scale=1.0) 
 
-    # Setup compositor for depth images.
-    detection_helper.scene.use_gravity = True
-    detection_helper.scene.view_layers['ViewLayer'].use_pass_z= True
-    detection_helper.scene.view_layers['ViewLayer'].use_pass_mist = True
-
-    detection_helper.scene.use_nodes = True
-    tree = detection_helper.scene.node_tree
-
-    if not tree.nodes['Render Layers']:
-        render_layers_node = tree.nodes.new(type='CompositorNodeRLayers')
-    else:
-        render_layers_node = tree.nodes['Render Layers']
-
-    if not tree.nodes['Composite']:
-        output_node = tree.nodes.new(type='Composite')
-    else:
-        output_node = tree.nodes['Composite']
+    # The BOP annotations are written as soon as a frame is rendered.
+    image_dirs = ['rgb', 'depth'] + (['mist'] if WRITE_MIST else []) + (['mask', 'mask_visib'] if WRITE_MASKS else [])
+    bop_writer = BopWriter(output_dir=SAVE_DIR, images_per_scene=IMAGES_PER_SCENE, image_dirs=image_dirs)
+    tar_writer = None
+    if TAR_SHARD_SIZE_MB is not None:
+        tar_writer = TarShardWriter(output_dir=SAVE_DIR, prefix='bop', max_shard_size_mb=TAR_SHARD_SIZE_MB)
 
-    links = tree.links
-
-    # Create dictionaries to store BOP annotations.
-    scene_camera_params = {}
-    scene_gt_params = {}
-    scene_gt_info_params = {}   
+    # Setup compositor, the depth images are written by File Output nodes during the RGB render.
+    detection_helper.scene.use_gravity = True
+    output_nodes = detection_helper.setup_render_outputs(depth_dir=os.path.join(SAVE_DIR, 'depth'),
+                                                         depth_format=DEPTH_FORMAT,
+                                                         depth_scale=DEPTH_SCALE,
+                                                         mist_dir=os.path.join(SAVE_DIR, 'mist') if WRITE_MIST else None,
+                                                         index_dir=os.path.join(SAVE_DIR, 'instance') if WRITE_MASKS else None)
+    # OPEN_EXR if the blender version cannot write raw PNG passes.
+    depth_extension = '.png' if detection_helper.depth_format == 'PNG' else '.exr'
+    # Folders of the File Output nodes, the index images are removed once the masks are written.
+    output_dirs = ['depth'] + (['mist'] if WRITE_MIST else []) + (['instance'] if WRITE_MASKS else [])
 
     # Main rendering loop !!!!!!
-    # circle_points = detection_helper.get_rotation_values_z(num_points=NUM_OF_IMAGES)
-    circle_points = detection_helper.get_circle_points(radius=1.5,location=[0.0,0.0,1.6],num_points=NUM_OF_IMAGES) # Radius for the camera path.
+    # All the camera poses are computed up front, looking at the main axis.
+    target = tuple(detection_helper.scene.objects[detection_helper.empty_name].location)
+    camera_poses = trajectory_utils.get_camera_poses(dict(CAMERA_TRAJECTORY, target=target), num_points=NUM_OF_IMAGES)
+    assert camera_poses is not None, "The BOP scene has no camera path, use one of the camera_trajectory types but 'path'"
     
-    for idx,loc_value in enumerate(circle_points):
+    for idx in range(len(camera_poses)):
         
         scene = detection_helper.scene
         camera = detection_helper.scene.objects[detection_helper.camera_name]
         
-        # Set the rotation of the axis so that the camera will rotate in z axis.
-        # detection_helper.scene.objects[detection_helper.empty_name].rotation_euler.z = rot_value
-        detection_helper.scene.objects[detection_helper.camera_name].location = loc_value
-        detection_helper.set_camera_rotation()
-
-        # Update file path for rgb images and render the image.
-        detection_helper.scene.render.filepath = os.path.join(RGB_DIR, str(f"{str(idx).zfill(6)}.png"))
+        # The pose is set as the matrix_world of the camera, the annotations read it back without a depsgraph update.
+        trajectory_utils.set_camera_pose(camera, camera_poses.locations[idx], camera_poses.rotations[idx])
+
+        # Update file path for rgb images and render the image, the depth image is written in the same render.
+        bop_writer.open_scene(idx)
+        detection_helper.scene.render.filepath = bop_writer.get_image_path(idx, 'rgb')
+        for output_node, image_dir in zip(output_nodes, output_dirs):
+            output_node.base_path = os.path.join(bop_writer.get_scene_dir(idx), image_dir)
+        detection_helper.set_output_index(bop_writer.get_image_id(idx))
         print("File name of rgb image is  : ", detection_helper.scene.render.filepath)
-        links.new(render_layers_node.outputs["Image"], output_node.inputs['Image'])
         bpy.ops.render.render(write_still = True)
 
 
         # Store the json labels
-        scene_camera_params[str(idx)] = detection_helper.get_scene_camera_parameters(camera_object=camera) 
-        scene_gt_params[str(idx)] = detection_helper.get_scene_gt_parameters(object_names=object_names,camera_object=camera,mesh2class=class_to_idx)
-        scene_gt_info_params[str(idx)] = detection_helper.get_scene_gt_info_parameters(object_names=object_names,camera=camera,mesh2class=class_to_idx)
-
-        # Create depth images
-        detection_helper.scene.render.filepath = os.path.join(DEPTH_DIR, str(f"{str(idx).zfill(6)}.png"))
-        print("File name of depth image is  : ", detection_helper.scene.render.filepath)
-        links.new(render_layers_node.outputs["Depth"], output_node.inputs['Image'])
-        bpy.ops.render.render(write_still = True)
-
-    scene_cam_path = JSON_DIR + 'scene_camera.json'
-    scene_gt_path = JSON_DIR + 'scene_gt.json'
-    scene_gt_info_path = JSON_DIR + 'scene_gt_info.json'
-
-    detection_helper.save_as_json_file(annotations_dict=scene_camera_params,file_path=scene_cam_path)
-    detection_helper.save_as_json_file(annotations_dict=scene_gt_params,file_path=scene_gt_path)
-    detection_helper.save_as_json_file(annotations_dict=scene_gt_info_params,file_path=scene_gt_info_path)
+        scene_camera, scene_gt, scene_gt_info = detection_helper.get_frame_annotations(object_names=object_names,
+                                                                                      camera_object=camera,
+                                                                                      mesh2class=class_to_idx,
+                                                                                      depth_scale=DEPTH_SCALE)
+        if WRITE_KEYPOINTS:
+            detection_helper.add_keypoint_annotations(scene_gt=scene_gt, camera_object=camera)
+        mask_files = {}
+        if WRITE_MASKS:
+            # The visible masks come from the index pass of the render, the full masks from the object meshes.
+            index_path = bop_writer.get_image_path(idx, 'instance', extension='.exr')
+            index_map = detection_helper.read_index_map(index_path)
+            os.remove(index_path)
+            # The depth output is 0 where there is no surface closer than the clip end.
+            depth_map = detection_helper.read_pass_image(bop_writer.get_image_path(idx, 'depth', extension=depth_extension))
+            object_masks = detection_helper.get_object_masks(scene_gt=scene_gt, camera_object=camera)
+            visibility, visible_masks = get_visibility_annotations(object_masks, index_map, [gt['obj_id'] for gt in scene_gt],
+                                                                   valid_depth=depth_map > 0)
+            for gt_id, gt_info in enumerate(scene_gt_info):
+                if gt_info != '':
+                    # bbox_visib in pixels of the visible part, as in BOP.
+                    gt_info.update(visibility[gt_id])
+                for mask_dir, masks in (('mask', object_masks), ('mask_visib', visible_masks)):
+                    mask_path = bop_writer.get_mask_path(idx, mask_dir, gt_id)
+                    detection_helper.save_mask(masks[gt_id], mask_path)
+                    mask_files[f'{mask_dir}_{gt_id:06d}.png'] = mask_path
+        bop_writer.write_frame(idx, scene_camera=scene_camera, scene_gt=scene_gt, scene_gt_info=scene_gt_info)
+
+        # Pack the images of the frame with its labels, key: <scene id>/<image id>
+        if tar_writer is not None:
+            files = {'rgb.png': bop_writer.get_image_path(idx, 'rgb'),
+                     f'depth{depth_extension}': bop_writer.get_image_path(idx, 'depth', extension=depth_extension),
+                     **mask_files}
+            tar_writer.write_sample(f'{bop_writer.get_scene_id(idx):06d}/{bop_writer.get_image_id(idx):06d}', files=files,
+                                    data={'json': {'scene_camera': scene_camera, 'scene_gt': scene_gt, 'scene_gt_info': scene_gt_info}})
+
+    bop_writer.close()
+    if tar_writer is not None:
+        tar_writer.close()
 
     print("************************** Completed Rendering process **************************")
@@ -0,0 +1,160 @@
+# import modules
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_PATH = os.path.abspath(__file__)
+SCRIPT_DIR = os.path.dirname(SCRIPT_PATH)
+
+
+def get_worker_result_path(cache_dir, worker_index):
+    return os.path.join(cache_dir, f'preprocess_worker_{worker_index}.json')
+
+
+def run_worker(args):
+    """
+    Normalizes every num_workers-th model and writes it to the asset cache.
+
+    Runs inside blender: blender -b -P preprocess_models.py -- --worker_index i ...
+    """
+    sys.path.append(SCRIPT_DIR)
+    import bpy
+
+    # import custom modules
+    import asset_utils
+
+    obj_files = asset_utils.find_obj_files(args.models_dir)[args.worker_index::args.num_workers]
+    asset_cache = asset_utils.AssetCache(cache_dir=args.cache_dir)
+
+    if args.models_info is not None:
+        from object_detection_bop import YCB_DATASET_INFO, get_model_dimensions
+        class_to_idx = {value: key for key, value in YCB_DATASET_INFO.items()}
+        with open(args.models_info, 'r') as json_file:
+            dimensions_data = json.load(json_file)
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+    results = []
+    for object_file in obj_files:
+        obj_name = asset_utils.get_obj_name(object_file, args.dataset_name)
+
+        if args.models_info is not None:
+            import_function = asset_utils.import_obj_model_with_dimensions
+            parameters = {'dimensions': get_model_dimensions(dimensions_data, class_to_idx[obj_name])}
+        else:
+            import_function = asset_utils.import_obj_model
+            parameters = {'target_object_size': args.target_object_size}
+
+        model_hash = asset_utils.get_model_hash(object_file, **parameters)
+        metadata = asset_cache.load_metadata(obj_name=obj_name, model_hash=model_hash)
+        if metadata is None or not os.path.exists(asset_cache.get_blend_path(obj_name, model_hash)):
+            print(f"Worker {args.worker_index} : preprocessing {obj_name}")
+            imported_object = import_function(object_file, obj_name, **parameters)
+            if imported_object is None:
+                print(f"Error: Could not import {object_file}")
+                continue
+            metadata = asset_cache.save_object(imported_object, model_hash=model_hash)
+
+            # Keep the memory of the worker flat.
+            bpy.data.objects.remove(imported_object)
+            bpy.data.orphans_purge(do_recursive=True)
+
+        metadata['object_file'] = object_file
+        metadata['parameters'] = parameters
+        results.append(metadata)
+
+    with open(get_worker_result_path(args.cache_dir, args.worker_index), 'w') as json_file:
+        json.dump(results, json_file)
+
+
+def preprocess_models(models_dir, cache_dir, num_workers, blender_path, dataset_name,
+                      target_object_size, models_info=None, threads_per_worker=1):
+    """
+    Fans the models out over num_workers headless blender instances and merges their metadata.
+
+    Keyword arguments:
+        models_dir -- path for the models: str
+        cache_dir -- asset cache directory: str
+        num_workers -- number of blender processes: int
+        blender_path -- blender executable: str
+        dataset_name -- 'ycb' or 'robocup': str
+        target_object_size -- size of the largest dimension of the models: float
+        models_info -- path of models_info.json, the models are imported with these dimensions if given: str
+        threads_per_worker -- render/evaluation threads of every blender process: int
+
+    returns: dict of object name to metadata, also written to cache_dir/models_metadata.json
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    commands = []
+    for worker_index in range(num_workers):
+        command = [blender_path, '-b', '--factory-startup', '-t', str(threads_per_worker),
+                   '-P', SCRIPT_PATH, '--',
+                   '--worker_index', str(worker_index),
+                   '--num_workers', str(num_workers),
+                   '--models_dir', models_dir,
+                   '--cache_dir', cache_dir,
+                   '--dataset_name', dataset_name,
+                   '--target_object_size', str(target_object_size)]
+        if models_info is not None:
+            command += ['--models_info', models_info]
+        commands.append(command)
+
+    # Every thread waits on one blender process.
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        processes = list(executor.map(subprocess.run, commands))
+
+    failed = [idx for idx, process in enumerate(processes) if process.returncode != 0]
+    if failed:
+        raise RuntimeError(f"Preprocessing workers {failed} failed")
+
+    models_metadata = {}
+    for worker_result in sorted(glob.glob(os.path.join(cache_dir, 'preprocess_worker_*.json'))):
+        with open(worker_result, 'r') as json_file:
+            for metadata in json.load(json_file):
+                models_metadata[metadata['obj_name']] = metadata
+        os.remove(worker_result)
+
+    with open(os.path.join(cache_dir, 'models_metadata.json'), 'w') as json_file:
+        json.dump(models_metadata, json_file, indent=4)
+
+    return models_metadata
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Normalize the OBJ models into the .blend asset cache in parallel.")
+    parser.add_argument('--models_dir', required=True, help="path for the models")
+    parser.add_argument('--cache_dir', required=True, help="asset cache directory")
+    parser.add_argument('--dataset_name', default='ycb', help="ycb or robocup")
+    parser.add_argument('--target_object_size', type=float, default=0.5,
+                        help="size of the largest dimension, used by the regression datasets")
+    parser.add_argument('--models_info', default=None,
+                        help="models_info.json, import the models with these dimensions (object detection)")
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads_per_worker', type=int, default=1)
+    parser.add_argument('--blender', default='blender', help="blender executable")
+    parser.add_argument('--worker_index', type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    # Arguments after '--' when started by blender.
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    args = parse_arguments(argv)
+
+    if args.worker_index is not None:
+        run_worker(args)
+    else:
+        models_metadata = preprocess_models(models_dir=args.models_dir,
+                                            cache_dir=args.cache_dir,
+                                            num_workers=args.num_workers,
+                                            blender_path=args.blender,
+                                            dataset_name=args.dataset_name,
+                                            target_object_size=args.target_object_size,
+                                            models_info=args.models_info,
+                                            threads_per_worker=args.threads_per_worker)
+        print(f"Preprocessed {len(models_metadata)} models into {args.cache_dir}")
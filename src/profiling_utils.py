@@ -0,0 +1,109 @@
+# import modules
+import contextlib
+import csv
+import json
+import os
+import time
+
+
+class StageTimer:
+
+    # Columns of the timing report.
+    REPORT_FIELDS = ['group', 'stage', 'count', 'total_s', 'mean_ms', 'min_ms', 'max_ms', 'share']
+
+    def __init__(self, summary_interval=100):
+        """
+        Wall clock timers for the stages of the render loop, eg: scene, texture, render, annotation, write.
+
+        The times are aggregated per group (the test case). Stages can be nested, the time of a nested stage
+        is not counted in the stage around it, so the stages of a group add up to the timed wall clock time.
+
+        Keyword arguments:
+            summary_interval -- number of frames between two printed summaries, 0 to turn them off: int
+        """
+        self.summary_interval = int(summary_interval)
+        self.group = 'default'
+        # group -> stage -> [count, total, min, max]
+        self.stats = {}
+        # [stage, start time, time of the nested stages]
+        self.stack = []
+        self.num_frames = 0
+
+    def set_group(self, group):
+        self.group = str(group)
+
+    def start(self, stage):
+        self.stack.append([stage, time.perf_counter(), 0.0])
+
+    def stop(self):
+        stage, start_time, nested_time = self.stack.pop()
+        elapsed = time.perf_counter() - start_time
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        self.add(stage, elapsed - nested_time)
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """
+        Times the code in the with block, eg: with stage_timer.stage('render'): ...
+        """
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def add(self, stage, seconds):
+        stats = self.stats.setdefault(self.group, {}).setdefault(stage, [0, 0.0, float('inf'), 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = min(stats[2], seconds)
+        stats[3] = max(stats[3], seconds)
+
+    def frame_done(self):
+        """
+        Counts a rendered frame and prints the summary every summary_interval frames.
+        """
+        self.num_frames += 1
+        if self.summary_interval > 0 and self.num_frames % self.summary_interval == 0:
+            self.print_summary()
+
+    def get_rows(self):
+        rows = []
+        for group, stages in self.stats.items():
+            group_total = sum(stats[1] for stats in stages.values())
+            for stage, (count, total, min_time, max_time) in stages.items():
+                rows.append({"group": group,
+                             "stage": stage,
+                             "count": count,
+                             "total_s": round(total, 4),
+                             "mean_ms": round(1000 * total / count, 3),
+                             "min_ms": round(1000 * min_time, 3),
+                             "max_ms": round(1000 * max_time, 3),
+                             "share": round(total / group_total, 4) if group_total > 0 else 0.0})
+        return rows
+
+    def print_summary(self):
+        print(f"\nStage timings after {self.num_frames} frames")
+        print('--'*30)
+        for row in self.get_rows():
+            print(f"{row['group']:<24} {row['stage']:<12} {row['count']:>7} x {row['mean_ms']:>10.2f} ms"
+                  f" = {row['total_s']:>10.2f} s ({100 * row['share']:.1f} %)")
+
+    def write_report(self, output_dir, name='stage_timings'):
+        """
+        Writes the timings to <name>.csv and <name>.json in the output folder.
+        """
+        os.makedirs(str(output_dir), exist_ok=True)
+        rows = self.get_rows()
+        with open(os.path.join(str(output_dir), f'{name}.csv'), 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=self.REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        with open(os.path.join(str(output_dir), f'{name}.json'), 'w') as json_file:
+            json.dump({"num_frames": self.num_frames, "stages": rows}, json_file, indent=4)
+        print(f"Stage timings written to {os.path.join(str(output_dir), name)}.csv/.json")
+
+
+# Shared timer of the render loops.
+stage_timer = StageTimer()
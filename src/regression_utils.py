@@ -1,6 +1,7 @@
 #import modules
 import argparse
 import csv
+import functools
 import json
 import os
 import sys
@@ -15,8 +16,17 @@ import random
 
 
 # import custom modules
+from annotation_utils import get_annotation_store
 from blender_utils import Blender_helper
 from dataset_utils import Dataset_helper
+from io_utils import annotation_writer
+from journal_utils import get_render_journal
+from profiling_utils import stage_timer
+from render_plan import RenderPlan, build_render_plan
+from tar_utils import get_tar_writer
+import mesh_utils
+import texture_utils
+import trajectory_utils
 
 class RegressionDatasetGeneration():
 
@@ -24,7 +34,7 @@ class RegressionDatasetGeneration():
         pass
 
     def get_all_coordinates(self, mesh_name,mesh2class):
-        b_box = self.find_bounding_box(bpy.data.objects[mesh_name])
+        b_box = self.find_bounding_box(bpy.data.objects[mesh_name],camera=bpy.data.objects['Camera'])
 
         if b_box:
             return self.format_regression_coordinates(mesh2class[mesh_name], mesh_name)
@@ -36,71 +46,10 @@ class RegressionDatasetGeneration():
         """
         Returns camera space bounding box of the mesh object.
 
-        Gets the camera frame bounding box, which by default is returned without any transformations applied.
-        Create a new mesh object based on self.carre_bleu and undo any transformations so that it is in the same space as the
-        camera frame. Find the min/max vertex coordinates of the mesh visible in the frame, or None if the mesh is not in view.
+        The vertex coordinates are read with foreach_get and transformed into the camera frame with a single
+        matrix operation. Find the min/max vertex coordinates of the mesh visible in the frame, or None if the mesh is not in view.
         """
-
-        """ Get the inverse transformation matrix. """
-        matrix = camera.matrix_world.normalized().inverted()
-        """ Create a new mesh data block, using the inverse transform matrix to undo any transformations. """
-        mesh = obj.to_mesh(preserve_all_data_layers=True)
-        mesh.transform(obj.matrix_world)
-        mesh.transform(matrix)
-
-        """ Get the world coordinates for the camera frame bounding box, before any transformations. """
-        frame = [-v for v in camera.data.view_frame(scene=self.scene)[:3]]
-
-        lx = []
-        ly = []
-
-        for v in mesh.vertices:
-            co_local = v.co
-            z = -co_local.z
-
-            if z <= 0.0:
-                """ Vertex is behind the camera; ignore it. """
-                continue
-            else:
-                """ Perspective division """
-                frame = [(v / (v.z / z)) for v in frame]
-
-            min_x, max_x = frame[1].x, frame[2].x
-            min_y, max_y = frame[0].y, frame[1].y
-
-            x = (co_local.x - min_x) / (max_x - min_x)
-            y = (co_local.y - min_y) / (max_y - min_y)
-
-            lx.append(x)
-            ly.append(y)
-
-
-        """ Image is not in view if all the mesh verts were ignored """
-        if not lx or not ly:
-            return None
-
-        min_x = np.clip(min(lx), 0.0, 1.0)
-        min_y = np.clip(min(ly), 0.0, 1.0)
-        max_x = np.clip(max(lx), 0.0, 1.0)
-        max_y = np.clip(max(ly), 0.0, 1.0)
-
-        """ Image is not in view if both bounding points exist on the same side """
-        if min_x == max_x or min_y == max_y:
-            return None
-
-        """ Figure out the rendered image size """
-        render = self.scene.render
-        fac = render.resolution_percentage * 0.01
-        dim_x = render.resolution_x * fac
-        dim_y = render.resolution_y * fac
-        
-        ## Verify there's no coordinates equal to zero
-        coord_list = [min_x, min_y, max_x, max_y]
-        if min(coord_list) == 0.0:
-            indexmin = coord_list.index(min(coord_list))
-            coord_list[indexmin] = coord_list[indexmin] + 0.0000001
-
-        return (min_x, min_y), (max_x, max_y)
+        return mesh_utils.find_bounding_box(obj=obj, camera=camera, scene=bpy.context.scene)
 
     def format_coordinates(self,coordinates, mesh_name,mesh2class):
 
@@ -150,34 +99,45 @@ class RegressionDatasetGeneration():
 
         return eigen_vector_largest
 
-    def get_pca_direction_centroid_location(self, obj_name):
+    def get_pca_direction_centroid_location(self, obj_name, return_vertices=True):
         """
         Function returns    PCA data
                             Direction of longitudal axis
                             centroid of the pca
                             location of the object in blender scene.
+
+        The centroid and direction come from the principal axes cached at import, only deformed or
+        uncached objects fall back to the PCA over all the vertices.
+
+        Keyword arguments:
+            obj_name -- name of the object: str
+            return_vertices -- if False the camera frame vertices are not materialized and None is returned: bool
         """
         # Get the object
         obj = bpy.data.objects[obj_name]
         # Get the camera
         camera_object = bpy.data.objects['Camera']
+        location_object = obj.location
 
-        # Get the noramlized camera matrix
-        matrix = camera_object.matrix_world.normalized().inverted()
+        camera_axes = mesh_utils.pca_cache.get_camera_axes(obj, camera_object)
+        if camera_axes is not None and not return_vertices:
+            centroid, direction = camera_axes
+            return None, location_object, direction, centroid
 
-        # Get the mesh data of the object object and undo the transformations.
-        mesh = obj.to_mesh(preserve_all_data_layers=True)
-        mesh.transform(obj.matrix_world)
-        mesh.transform(matrix)
+        # Get the noramlized camera matrix
+        matrix = mesh_utils.get_world_to_camera_matrix(camera_object)
 
-        vertices_positions = []
-        for v in mesh.vertices:
-            vertices_positions.append(list((v.co.x, v.co.y, v.co.z)))
+        # Get the evaluated mesh data of the object and undo the transformations.
+        # The temporary mesh is released by the mesh cache.
+        world_vertices = mesh_utils.mesh_cache.get_world_vertices(obj)
+        vertices = mesh_utils.transform_vertices(world_vertices, matrix)
+        vertices_positions = vertices.tolist() if return_vertices else None
 
-        vertices = np.array(vertices_positions)
-        centroid = np.mean(vertices, axis=0)
-        direction = self.get_direction_pca(point_cloud=vertices)
-        location_object = obj.location
+        if camera_axes is not None:
+            centroid, direction = camera_axes
+        else:
+            centroid = np.mean(vertices, axis=0)
+            direction = self.get_direction_pca(point_cloud=vertices)
 
         return vertices_positions, location_object, direction, centroid
     
@@ -187,27 +147,17 @@ class RegressionDatasetGeneration():
             writer.writerows(vertices)
 
     def project_3d_to_2d(self, vector, view_matrix, projection_matrix):
+        """
+        Returns the normalized image coordinates of a 3D point, (0, 0) at the top left of the image.
 
-        x, y, z = vector[0], vector[1], vector[2]
-
-        view_matrix_np = np.array(view_matrix)
-
-        point_3d_homogeneous = np.array([x, y, z, 1])
-
-        # Transform the 3D point to the camera's view space
-        point_view = view_matrix_np @ point_3d_homogeneous
-
-        # Apply perspective projection to get 2D image coordinates
-        point_projected = projection_matrix @ point_view
-
-        # Convert to normalized device coordinates (NDC)
-        point_projected /= point_projected[3]
-
-        # Convert to pixel coordinates
-        x_pixel = (point_projected[0] + 1) / 2
-        y_pixel = (1 - point_projected[1]) / 2
-
-        return (x_pixel, y_pixel)
+        vector can also be a (N,3) array of points, the (N,2) coordinates are then returned, see
+        mesh_utils.project_points for the depth and the in-frustum mask.
+        """
+        points = np.asarray(vector, dtype=np.float64)
+        pixels, _, _ = mesh_utils.project_points(points[..., :3], view_matrix=view_matrix, projection_matrix=projection_matrix)
+        if points.ndim == 1:
+            return (pixels[0, 0], pixels[0, 1])
+        return pixels
 
     def get_regression_coordinates(self, mesh_name,camera_name):
         """
@@ -271,21 +221,39 @@ class RegressionDatasetGeneration():
                         "z":str(direction_vector[3]),
                         "distance": str(distance)
                         }
+        # Keypoints sampled once per model, projected with the camera of the frame.
+        keypoints = mesh_utils.get_keypoint_annotations(bpy.data.objects[mesh_name], bpy.data.objects['Camera'], scene)
+        if keypoints is not None:
+            txt_coordinates.update(keypoints)
         print("\nFinal coordinates are : ", txt_coordinates)
         return txt_coordinates
 
     def project_by_object_utils(self, cam, point):
-        point = Vector(point)
+        """
+        Returns the pixel coordinates of a world point, (0, 0) at the top left of the image.
+
+        point can also be a (N,3) array of points, the (N,2) pixel coordinates are then returned.
+        """
         scene = bpy.context.scene
-        co_2d = bpy_extras.object_utils.world_to_camera_view(scene, cam, point)
+        points = np.asarray(point, dtype=np.float64)
+        co_2d = mesh_utils.world_to_camera_view(points, cam, scene)
         render_scale = scene.render.resolution_percentage / 100
         render_size = (
             int(scene.render.resolution_x * render_scale),
             int(scene.render.resolution_y * render_scale),
         )
-        return Vector((co_2d.x * render_size[0], render_size[1] - co_2d.y * render_size[1]))
+        pixels = np.column_stack([co_2d[:, 0] * render_size[0], render_size[1] - co_2d[:, 1] * render_size[1]])
+        if points.ndim == 1:
+            return Vector(pixels[0])
+        return pixels
     
-    def get_blender_parameters(self,obj_name,obj_names):
+    def get_blender_parameters(self,obj_name,obj_names,camera_pose=None):
+        """
+        Returns the scene parameters of the rendered image.
+
+        camera_pose is the (location, rotation) of the camera trajectory of the render plan, the camera values
+        are then taken from it and cam_distance_3d is the distance between the camera and the object in meters.
+        """
 
         obj_to_render = bpy.data.objects[str(obj_name)]
         camera = bpy.data.objects['Camera']
@@ -312,11 +280,24 @@ class RegressionDatasetGeneration():
         parameters_dict['blur_value'] =camera.data.dof.focus_distance
         parameters_dict['cam_distance_3d'] = camera.constraints['Follow Path'].offset
 
+        if camera_pose is not None:
+            location, rotation = camera_pose
+            quaternion = trajectory_utils.rotation_to_quaternion(rotation)[0]
+            parameters_dict['cameras_location'] = dict(zip("xyz", np.asarray(location, dtype=float).tolist()))
+            parameters_dict['cameras_rotation'] = dict(zip("wxyz", quaternion.tolist()))
+            parameters_dict['cam_distance_3d'] = float(np.linalg.norm(np.asarray(location) - np.array(obj_to_render.location)))
+
         return parameters_dict
     
-    def write_regression_annotations(self, mesh_name,mesh2class,object_names, json_file_path):
+    def write_regression_annotations(self, mesh_name,mesh2class,object_names, json_file_path, annotation_store=None, on_written=None, camera_pose=None):
+        """
+        Writes the blender parameters and the annotations of the rendered image.
+
+        The json file is written by the background annotation writer, or added to the annotation store.
+        on_written is called once the annotations are on disk, camera_pose is the precomputed pose of the camera trajectory.
+        """
 
-        prameters_dict = self.get_blender_parameters(obj_name=mesh_name,obj_names=object_names)
+        prameters_dict = self.get_blender_parameters(obj_name=mesh_name,obj_names=object_names,camera_pose=camera_pose)
 
         print("Mesh name is : ",mesh_name)
         annotations = self.get_all_coordinates(mesh_name,mesh2class)
@@ -325,14 +306,19 @@ class RegressionDatasetGeneration():
         prameters_dict['annotations'] = annotations
 
         # Modify to store json files
-        with open(json_file_path, "w") as json_file:
-            json.dump(prameters_dict, json_file, indent=4)
+        self.save_annotations(json_file_path, prameters_dict, annotation_store=annotation_store, on_written=on_written)
         
         return None
     
-    def write_regression_trajectory_annotations(self, mesh_name,mesh2class,object_names, json_file_path,trajectory_num):
+    def write_regression_trajectory_annotations(self, mesh_name,mesh2class,object_names, json_file_path,trajectory_num, annotation_store=None, on_written=None, camera_pose=None):
+        """
+        Writes the blender parameters and the annotations of the rendered trajectory image.
+
+        The json file is written by the background annotation writer, or added to the annotation store.
+        on_written is called once the annotations are on disk, camera_pose is the precomputed pose of the camera trajectory.
+        """
 
-        prameters_dict = self.get_blender_parameters(obj_name=mesh_name,obj_names=object_names)
+        prameters_dict = self.get_blender_parameters(obj_name=mesh_name,obj_names=object_names,camera_pose=camera_pose)
 
         print("Mesh name is : ",mesh_name)
         annotations = self.get_all_coordinates(mesh_name,mesh2class)
@@ -342,13 +328,190 @@ class RegressionDatasetGeneration():
         prameters_dict['trajectory_num'] = trajectory_num
 
         # Modify to store json files
-        with open(json_file_path, "w") as json_file:
-            json.dump(prameters_dict, json_file, indent=4)
+        self.save_annotations(json_file_path, prameters_dict, annotation_store=annotation_store, on_written=on_written)
         
         return None
 
     
-    def generate_regression_dataset(self,json_object,models_dir,textures_dir,constraint_textures_dir,output_dir,dataset_name):
+    def save_annotations(self, json_file_path, parameters_dict, annotation_store=None, on_written=None):
+        """
+        Writes the annotations of an image to its json file, or to the annotation store (consolidated file or tar shard).
+        """
+        with stage_timer.stage('write'):
+            if annotation_store is not None:
+                annotation_store.add(json_file_path, parameters_dict, on_written=on_written)
+            else:
+                annotation_writer.write(json_file_path, parameters_dict, on_written=on_written)
+
+    def get_render_plan(self, json_object, obj_names, textures_dir, output_dir, seed=None, shard_index=0, num_trajectories=None):
+        """
+        Returns the render plan of the dataset.
+
+        The plan given by "render_plan" in the requirements file is loaded if it exists, otherwise the plan is drawn
+        from the seed. All the shards draw the same plan, the first one saves it as render_plan.npz in the output folder.
+        With "static_geometry" the rows are ordered by geometry group, so frames with the same geometry are rendered
+        one after another.
+        """
+        static_geometry = str(json_object.get('static_geometry', 'False')) == 'True'
+        plan_path = str(json_object.get('render_plan', ''))
+        if plan_path != '' and os.path.exists(plan_path):
+            plan = RenderPlan.load(plan_path)
+            missing_objects = set(np.unique(plan.columns['obj_name'])) - set(obj_names)
+            assert not missing_objects, f"Objects of the render plan are not in the scene : {missing_objects}"
+            print(f"Loaded the render plan {plan_path} with {len(plan)} rows")
+            return plan.group_by_geometry() if static_geometry else plan
+
+        num_textures = len(texture_utils.get_texture_index(textures_dir).texture_paths)
+        plan = build_render_plan(json_object, obj_names=obj_names, num_textures=num_textures,
+                                 seed=seed, num_trajectories=num_trajectories, group_geometry=static_geometry)
+        if shard_index == 0:
+            os.makedirs(str(output_dir), exist_ok=True)
+            plan.save(os.path.join(str(output_dir), 'render_plan.npz'))
+        return plan
+
+    def render_plan_rows(self, plan, rows, blender_helper, obj_names, class_to_idx, output_dir, dataset_name,
+                         textures_dir, background_plane, camera, journal=None, annotation_store=None):
+        """
+        Renders the rows of the render plan and writes the regression annotations.
+
+        The scene parameters of every frame come from the plan, the objects are only set up again when the
+        test case or the object of the rows changes.
+
+        Keyword arguments:
+            plan -- render_plan.RenderPlan
+            rows -- rows of the plan to render: range
+            blender_helper -- Blender_helper
+            obj_names -- names of the objects in the scene: list(str)
+            class_to_idx -- dict of object name to class index
+            output_dir -- output folder of the dataset: Path
+            dataset_name -- 'ycb' or 'robocup': str
+            textures_dir -- directory of the background textures: str
+            background_plane -- background plane object
+            camera -- camera object
+            journal -- journal_utils.RenderJournal, completed rows are skipped
+            annotation_store -- annotation_utils.AnnotationStore or tar_utils.TarShardWriter, None writes one json file per image
+        """
+        texture_paths = texture_utils.get_texture_index(textures_dir).texture_paths
+        obj_to_render = None
+        current_object = None
+        current_texture_id = None
+
+        # The rows completed in the journal are skipped before the start, so the progress and the estimated
+        # time only count the rows rendered by this run.
+        pending_rows = []
+        for row_idx in rows:
+            row = plan.get_row(row_idx)
+            trajectory = int(row['trajectory']) if plan.trajectories else None
+            if journal is None or not journal.is_completed(str(row['test_case']), str(row['obj_name']),
+                                                           int(row['index']), trajectory=trajectory):
+                pending_rows.append(row_idx)
+        if len(pending_rows) < len(rows):
+            print(f'Skipping {len(rows) - len(pending_rows)} renders completed in the journal')
+
+        # Create start index for the images and starting time
+        start_time = time.time()
+
+        for count, row_idx in enumerate(pending_rows):
+            row = plan.get_row(row_idx)
+            test_case, obj_name, i = str(row['test_case']), str(row['obj_name']), int(row['index'])
+            trajectory = int(row['trajectory']) if plan.trajectories else None
+
+            # The stages are timed per test case, see profiling_utils.
+            stage_timer.set_group(test_case)
+            stage_timer.start('scene')
+            if (test_case, obj_name) != current_object:
+                if obj_to_render is not None:
+                    # Hide the object again so that it will not appear in the next iteration.
+                    obj_to_render.hide_render = True
+                print(f'Starting object: {test_case}/{obj_name}')
+                print('--'*30)
+
+                # get the object and make it visible during rendering.
+                obj_to_render = blender_helper.get_object(obj_name=obj_name)
+                obj_to_render.hide_render = False
+
+                # Reset the location and rotation of the object
+                blender_helper.reset_obj_location_rotation(obj=obj_to_render)
+
+                # Adjust the position of the objects to be above the plane.
+                blender_helper.adjust_object_position(obj=obj_to_render,
+                                                      target_size=0.1,
+                                                      background_plane='Background_plane')
+
+                # Track the camera object
+                blender_helper.track_object(
+                    tracking_object_name='Camera', object_to_track=background_plane)
+
+                # Track the light to the object, or to the plane for the trajectories.
+                blender_helper.track_object(
+                    tracking_object_name='Sun', object_to_track=background_plane if plan.trajectories else obj_to_render)
+                current_object = (test_case, obj_name)
+
+            texture_path = None
+            if int(row['texture_id']) != current_texture_id:
+                current_texture_id = int(row['texture_id'])
+                texture_path = texture_paths[current_texture_id]
+            blender_helper.apply_render_plan_row(row, obj=obj_to_render, camera=camera,
+                                                 background_plane_name='Background_plane',
+                                                 texture_path=texture_path)
+            stage_timer.stop()
+
+            print(f'\nRendering image {count + 1} of {len(pending_rows)}')
+            seconds_per_render = (time.time() - start_time) / (count + 1)
+            print(f'Estimated time remaining: {time.strftime("%H:%M:%S", time.gmtime(seconds_per_render * (len(pending_rows) - count - 1)))}')
+
+            folder_name = str(dataset_name)+'_'+str(test_case)
+            file_name = f'{str(trajectory)}_{str(i)}' if plan.trajectories else str(i).zfill(6)
+
+            # Update file path and render
+            bpy.context.scene.render.filepath = str(output_dir / folder_name / obj_name / 'images' / f'{file_name}.png')
+            with stage_timer.stage('render'):
+                bpy.ops.render.render(write_still=True) # RENDER THE IMAGE
+
+            # The json folder is created by the annotation writer.
+            json_file_path = os.path.join(str(output_dir / folder_name / obj_name / f'json_files'), f'{file_name}.json')
+
+            # The render is recorded in the journal once its annotations are on disk.
+            on_written = None
+            if journal is not None:
+                paths = [bpy.context.scene.render.filepath, json_file_path]
+                if annotation_store is not None:
+                    paths = annotation_store.journal_paths(bpy.context.scene.render.filepath)
+                on_written = functools.partial(journal.record, test_case, obj_name, i, trajectory=trajectory,
+                                               paths=paths, seed=plan.seed)
+
+            # Save the blender parameters and write the regression annotations, the bbox/PCA annotations are
+            # timed as 'annotation' and the file writes as 'write'.
+            camera_pose = (row['camera_location'], row['camera_rotation']) if 'camera_location' in row else None
+            with stage_timer.stage('annotation'):
+                if plan.trajectories:
+                    self.write_regression_trajectory_annotations(mesh_name=obj_name,mesh2class=class_to_idx,
+                                                                 object_names=obj_names,
+                                                                 json_file_path=json_file_path,
+                                                                 trajectory_num=trajectory,
+                                                                 annotation_store=annotation_store,
+                                                                 on_written=on_written,
+                                                                 camera_pose=camera_pose)
+                else:
+                    self.write_regression_annotations(mesh_name=obj_name,mesh2class=class_to_idx,object_names=obj_names,
+                                                      json_file_path=json_file_path,annotation_store=annotation_store,
+                                                      on_written=on_written,camera_pose=camera_pose)
+            stage_timer.frame_done()
+
+        # Wait for the pending annotation files, write errors are raised here.
+        with stage_timer.stage('write'):
+            annotation_writer.flush()
+            if annotation_store is not None:
+                annotation_store.close()
+        stage_timer.print_summary()
+
+        if obj_to_render is not None:
+            obj_to_render.hide_render = True
+        # Set the blur value back to normal ie, turn off depth of field
+        camera.data.dof.use_dof = False
+        return None
+
+    def generate_regression_dataset(self,json_object,models_dir,textures_dir,output_dir,dataset_name,asset_cache_dir=None,shard_index=0,num_shards=1,seed=None):
 
         OUTPUT_PATH = output_dir
         
@@ -361,18 +524,14 @@ class RegressionDatasetGeneration():
         print("\n Parameters are : ", parameters)
         print("\n###############################################################################")
 
-        # Get the test cases list
-        test_cases = dataset_helper.get_test_cases(json_object=json_object)
-
-        
-
         # Clear the default scene
         blender_helper.clear_scene()
         # Import objects
         print("Models path inside the function is : ", models_dir)
         blender_helper.import_objects_obj_format(models_dir=models_dir, 
                                                  target_object_size=0.5, 
-                                                 dataset_name=dataset_name)
+                                                 dataset_name=dataset_name,
+                                                 asset_cache_dir=asset_cache_dir)
         
         background_plane, light_source, camera, camera_track, light_track = blender_helper.add_regression_scene()
 
@@ -383,12 +542,6 @@ class RegressionDatasetGeneration():
 
 
         print("Number of objects present in the scene are : ", len(obj_names))
-
-        parameters_dict = {}
-
-        num_objects = len(obj_names)
-        obj_renders_per_split = Dataset_helper().get_object_render_per_split(json_object)
-        total_render_count = sum([num_objects*r[1] for r in obj_renders_per_split])
         
         # Set render parameters:
         render_parameters = json_object.get('render_parameters',{})
@@ -396,148 +549,41 @@ class RegressionDatasetGeneration():
                                              render_engine=render_parameters.get("render_engine","CPU"),
                                              res_x=int(render_parameters.get("res_x","96")),
                                              res_y=int(render_parameters.get("res_y","96")) ,
-                                             num_samples=int(render_parameters.get("num_samples","100"))
+                                             num_samples=int(render_parameters.get("num_samples","100")),
+                                             persistent_data=str(json_object.get('static_geometry', 'False')) == 'True'
                                              )
-        # Set the material
-        material = None
+        # Background materials are pooled per texture folder.
+        texture_utils.material_pool.max_materials = int(json_object.get('texture_pool_size', 16))
         
         
         # Dictionary for class names to mesh
         class_to_idx = {value: key for key, value in enumerate(obj_names)}
         print("Class to index values : ", class_to_idx)
 
+        # The scene parameters of every frame are drawn up front, the shards render a row range of the same plan.
+        plan = self.get_render_plan(json_object, obj_names, textures_dir, OUTPUT_PATH, seed=seed, shard_index=shard_index)
+        rows = plan.get_shard_rows(shard_index, num_shards)
+        print(f"Rendering rows {rows.start} to {rows.stop} of the render plan with {len(plan)} rows")
+
+        # Renders completed by an earlier run are skipped.
+        journal = get_render_journal(json_object, OUTPUT_PATH, shard_index=shard_index, num_shards=num_shards)
+        # The images and annotations are packed into tar shards, or the annotations are consolidated per folder.
+        annotation_store = get_tar_writer(json_object, OUTPUT_PATH, dataset_name=dataset_name,
+                                          shard_index=shard_index, num_shards=num_shards)
+        if annotation_store is None:
+            annotation_store = get_annotation_store(json_object, shard_index=shard_index, num_shards=num_shards)
+
         
         print("***************************  Rendering the images  ***************************")
 
         # Set all objects to be hidden initially while rendering.
         blender_helper.hide_objects(obj_names=obj_names, hide=True)
-        
-        # Create start index for the images and starting time
-        start_time = time.time()
-
-        for test_case, renders_per_object in obj_renders_per_split:
-            print("\n\n Test case is : ", test_case)
-            print(f'Starting split: {test_case} | Total renders: {renders_per_object * num_objects}')
-            print('**'*30)
-
-            if test_case == 'lighting':
-                light_sequential_values = dataset_helper.get_sequential_step_values(test_case,num_elements=renders_per_object,json_object=json_object)
-            elif test_case == 'distance':
-                distance_sequential_values = dataset_helper.get_sequential_step_values(test_case,num_elements=renders_per_object,json_object=json_object)
-                
-            elif test_case == 'blur':
-                blur_sequential_values = dataset_helper.get_sequential_step_values(test_case,num_elements=renders_per_object,json_object=json_object)
-            else:
-                pass
-            
-            material = blender_helper.set_random_pbr_img_textures(textures_path=textures_dir, obj_name='Background_plane', scale=2.5)
-            
-
-            for obj_name in obj_names:
-                print(f'Starting object: {test_case}/{obj_name}')
-                print('--'*30)
-
-                # get the object and make it visible during rendering.
-                obj_to_render = blender_helper.get_object(obj_name=obj_name)
-                obj_to_render.hide_render = False
-
-                # Reset the location and rotation of the object
-                blender_helper.reset_obj_location_rotation(obj=obj_to_render)
-
-                # Adjust the position of the objects to be above the plane.
-                blender_helper.adjust_object_position(obj=obj_to_render,
-                                                      target_size=0.1,
-                                                      background_plane='Background_plane')
-                
-                # Track the camera object
-                blender_helper.track_object(
-                    tracking_object_name='Camera', object_to_track=background_plane) # spanch2s check later for random placement
 
-                # Track the light to the object
-                blender_helper.track_object(
-                    tracking_object_name='Sun', object_to_track=obj_to_render)
-
-                blender_helper.set_random_rotation(obj_to_change=obj_to_render)
-                
-                start_idx = 0
-                # Loop though number of images to render and render the images.
-                for i in range(start_idx, start_idx+renders_per_object):
-                    
-                    if str('random_rotation_object') in parameters:
-                        blender_helper.set_random_rotation(obj_to_change=obj_to_render)
-
-                    if str('random_placement_object') in parameters:
-                        blender_helper.random_placement(obj=obj_to_render,camera=camera,min_distance_factor=0.1)
-
-                    if str('random_color') in parameters:
-                        blender_helper.set_random_background_color(
-                            obj_name='Background_plane')
-                    elif str('random_textures') in parameters:
-                        material = blender_helper.set_random_pbr_img_textures(
-                            textures_path=textures_dir, obj_name='Background_plane', scale=2.5)
-
-                    if test_case == 'normal_training':
-                        if json_object['Test_cases'][str(test_case)]['light_parameters']['random_lighting']=='True':
-                            light_min,light_max = float(json_object['Test_cases'][str(test_case)]['light_parameters']['min_value']),float(json_object['Test_cases'][str(test_case)]['light_parameters']['min_value'])
-                            blender_helper.set_random_lighting(light_source_name='Sun', min_value=light_min, max_value=light_max)
-                        else:
-                            bpy.data.lights[str('Sun')].energy = 3.0
-
-                        if json_object['Test_cases'][str(test_case)]['distance_parameters']['random_distance']=='True':
-                            distance_min,distance_max = float(json_object['Test_cases'][str(test_case)]['distance_parameters']['min_value']),float(json_object['Test_cases'][str(test_case)]['distance_parameters']['min_value'])
-                            blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value = random.uniform(distance_min,distance_max)
-                                                                  )
-                        else:
-                            camera.constraints['Follow Path'].offset = -38
-                    
-                    elif test_case == 'lighting':
-                        bpy.data.lights['Sun'].energy = light_sequential_values[i]
-                        blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value=-38
-                                                                  )
-
-                    elif test_case == 'distance':
-                        blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value = distance_sequential_values[i]
-                                                                  )
-                        bpy.data.lights['Sun'].energy = 3.0
-
-                    elif test_case == 'blur':
-                        bpy.data.lights['Sun'].energy = 3.0
-                        blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value=-38
-                                                                  )
-                        blender_helper.add_blur_dof(blur_value=blur_sequential_values[i],focus_background_name='Background_plane')
-
-                    print(f'\nRendering image {i +1} of {total_render_count}')
-
-                    folder_name = str(dataset_name)+'_'+str(test_case)
-
-                    # Update file path and render
-                    bpy.context.scene.render.filepath = str(OUTPUT_PATH / folder_name / obj_name / 'images' / f'{str(i).zfill(6)}.png')
-                    bpy.ops.render.render(write_still=True) # RENDER THE IMAGE
-
-                    json_folder = str(OUTPUT_PATH / folder_name / obj_name / f'json_files')
-                    if not os.path.exists(json_folder):
-                        os.mkdir(json_folder)
-                    json_file_path = os.path.join(json_folder, str(f'{str(i).zfill(6)}.json'))    
-                    
-                    # Save the blender parameters and write the regression annotations
-                    self.write_regression_annotations(mesh_name=obj_name,mesh2class=class_to_idx,object_names=obj_names,json_file_path=json_file_path)
-
-                    if str('random_textures') in parameters:
-                        if material != None:
-                            bpy.data.materials.remove(material)
-                        else:
-                            pass
-
-                    # Set the blur value back to normal ie, turn off depth of field
-                    camera.data.dof.use_dof = False
-                # Hide the object again so that it will not appear in the next iteration.
-                obj_to_render.hide_render = True
-            # Update the starting index
-            start_idx += renders_per_object
+        self.render_plan_rows(plan, rows, blender_helper=blender_helper, obj_names=obj_names, class_to_idx=class_to_idx,
+                              output_dir=OUTPUT_PATH, dataset_name=dataset_name, textures_dir=textures_dir,
+                              background_plane=background_plane, camera=camera, journal=journal,
+                              annotation_store=annotation_store)
+        stage_timer.write_report(OUTPUT_PATH, name='stage_timings' if num_shards == 1 else f'stage_timings_shard_{shard_index}')
         
         return None
     
@@ -551,7 +597,7 @@ class RegressionDatasetGeneration():
                     count+=1
         return count
     
-    def generate_regression_dataset_trajectories(self,json_object,models_dir,textures_dir,num_trajectories,output_dir,dataset_name):
+    def generate_regression_dataset_trajectories(self,json_object,models_dir,textures_dir,num_trajectories,output_dir,dataset_name,asset_cache_dir=None,shard_index=0,num_shards=1,seed=None):
 
         OUTPUT_PATH = output_dir
         
@@ -564,17 +610,13 @@ class RegressionDatasetGeneration():
         print("\n Parameters are : ", parameters)
         print("\n###############################################################################")
 
-        # Get the test cases list
-        test_cases = dataset_helper.get_test_cases(json_object=json_object)
-
-        
-
         # Clear the default scene
         blender_helper.clear_scene()
         # Import objects
         blender_helper.import_objects_obj_format(models_dir=models_dir, 
                                                  target_object_size=0.5, 
-                                                 dataset_name=dataset_name)
+                                                 dataset_name=dataset_name,
+                                                 asset_cache_dir=asset_cache_dir)
         
         background_plane, light_source, camera, camera_track, light_track = blender_helper.add_regression_scene()
 
@@ -585,13 +627,6 @@ class RegressionDatasetGeneration():
 
 
         print("Number of objects present in the scene are : ", len(obj_names))
-
-        parameters_dict = {}
-
-        num_objects = len(obj_names)
-        obj_renders_per_split = Dataset_helper().get_object_render_per_split(json_object)
-        total_render_count = sum([num_objects*r[1] for r in obj_renders_per_split])
-        total_render_count = total_render_count*num_trajectories
         
         # Set render parameters:
         render_parameters = json_object.get('render_parameters',{})
@@ -599,179 +634,41 @@ class RegressionDatasetGeneration():
                                              render_engine=render_parameters.get("render_engine","CPU"),
                                              res_x=int(render_parameters.get("res_x","96")),
                                              res_y=int(render_parameters.get("res_y","96")) ,
-                                             num_samples=int(render_parameters.get("num_samples","100"))
+                                             num_samples=int(render_parameters.get("num_samples","100")),
+                                             persistent_data=str(json_object.get('static_geometry', 'False')) == 'True'
                                              )
-        # Set the material
-        material = None
+        # Background materials are pooled per texture folder.
+        texture_utils.material_pool.max_materials = int(json_object.get('texture_pool_size', 16))
         
         
         # Dictionary for class names to mesh
         class_to_idx = {value: key for key, value in enumerate(obj_names)}
         print("Class to index values : ", class_to_idx)
 
+        # The scene parameters of every frame are drawn up front, the shards render a row range of the same plan.
+        plan = self.get_render_plan(json_object, obj_names, textures_dir, OUTPUT_PATH, seed=seed, shard_index=shard_index,
+                                    num_trajectories=num_trajectories)
+        rows = plan.get_shard_rows(shard_index, num_shards)
+        print(f"Rendering rows {rows.start} to {rows.stop} of the render plan with {len(plan)} rows")
+
+        # Renders completed by an earlier run are skipped, every frame of a trajectory is stored in the plan.
+        journal = get_render_journal(json_object, OUTPUT_PATH, shard_index=shard_index, num_shards=num_shards)
+        # The images and annotations are packed into tar shards, or the annotations are consolidated per folder.
+        annotation_store = get_tar_writer(json_object, OUTPUT_PATH, dataset_name=dataset_name,
+                                          shard_index=shard_index, num_shards=num_shards)
+        if annotation_store is None:
+            annotation_store = get_annotation_store(json_object, shard_index=shard_index, num_shards=num_shards)
+
         
         print("***************************  Rendering the images  ***************************")
 
         # Set all objects to be hidden initially while rendering.
         blender_helper.hide_objects(obj_names=obj_names, hide=True)
-        
-        # Create start index for the images and starting time
-        start_time = time.time()
-
-        for test_case, renders_per_object in obj_renders_per_split:
-            print("\n\n Test case is : ", test_case)
-            print(f'Starting split: {test_case} | Total renders: {renders_per_object * num_objects}')
-            print('**'*30)
 
-            if test_case == 'lighting':
-                light_sequential_values = dataset_helper.get_sequential_step_values(test_case,num_elements=1000,json_object=json_object)
-            
-            elif test_case == 'distance':
-                distance_sequential_values = dataset_helper.get_sequential_step_values(test_case,num_elements=1000,json_object=json_object)
-
-                light_sequential_values = dataset_helper.get_sequential_step_values_limits(start_value=float(json_object['Test_cases']['distance']['light_parameters']['min_value'])
-                                                                                           ,stop_value=float(json_object['Test_cases']['distance']['light_parameters']['max_value']),
-                                                                                            num_elements=1000)
-                
-                blur_sequential_values = dataset_helper.get_sequential_step_values_limits(start_value=float(json_object['Test_cases']['distance']['blur_parameters']['min_value'])
-                                                                                          ,stop_value=float(json_object['Test_cases']['distance']['blur_parameters']['max_value'])
-                                                                                          , num_elements=1000)
-                
-            elif test_case == 'blur':
-                blur_sequential_values = dataset_helper.get_sequential_step_values(test_case,num_elements=1000,json_object=json_object)
-            else:
-                pass
-            
-            material = blender_helper.set_random_pbr_img_textures(textures_path=textures_dir, obj_name='Background_plane', scale=2.5)
-            
-
-            for obj_name in obj_names:
-                print(f'Starting object: {test_case}/{obj_name}')
-                print('--'*30)
-
-                # get the object and make it visible during rendering.
-                obj_to_render = blender_helper.get_object(obj_name=obj_name)
-                obj_to_render.hide_render = False
-
-                # Reset the location and rotation of the object
-                blender_helper.reset_obj_location_rotation(obj=obj_to_render)
-
-                # Adjust the position of the objects to be above the plane.
-                blender_helper.adjust_object_position(obj=obj_to_render,
-                                                      target_size=0.1,
-                                                      background_plane='Background_plane')
-                
-                # Track the camera object
-                blender_helper.track_object(
-                    tracking_object_name='Camera', object_to_track=background_plane) 
-
-                # Track the light to the object
-                blender_helper.track_object(
-                    tracking_object_name='Sun', object_to_track=background_plane)
-
-                
-                for idx in range(num_trajectories):
-                    
-                    # random rotation
-                    blender_helper.set_random_rotation(obj_to_change=obj_to_render)
-
-                    # random placement
-                    blender_helper.random_placement(obj=obj_to_render,camera=camera,min_distance_factor=0.1)
-
-                    # random background texture
-                    material = blender_helper.set_random_pbr_img_textures(
-                            textures_path=textures_dir, obj_name='Background_plane', scale=2.5)
-                    
-                    # get random sequential values based on the num trajectories
-                    if test_case == 'distance':
-                        new_distance_values = np.sort(np.random.choice(distance_sequential_values, size=renders_per_object, replace=False))
-                        
-                        new_blur_values = np.sort(np.random.choice(blur_sequential_values, size=renders_per_object, replace=False))
-                        
-                        new_light_values = np.sort(np.random.choice(light_sequential_values, size=renders_per_object, replace=False))
-                        
-                    elif test_case == 'blur':
-                        new_blur_values = np.sort(np.random.choice(blur_sequential_values, size=renders_per_object, replace=False))
-                    elif test_case == 'lighting':
-                        new_light_values = np.sort(np.random.choice(light_sequential_values, size=renders_per_object, replace=False))
-                
-                    start_idx = 0
-                    # Main rendering loop.
-                    for i in range(start_idx, start_idx+renders_per_object):
-                    
-                        if test_case == 'normal_training':
-                            if json_object['Test_cases'][str(test_case)]['light_parameters']['random_lighting']=='True':
-                                light_min = float(json_object['Test_cases'][str(test_case)]['light_parameters']['min_value'])
-                                light_max = float(json_object['Test_cases'][str(test_case)]['light_parameters']['max_value'])
-                                
-                                blender_helper.set_random_lighting(light_source_name='Sun', min_value=light_min, max_value=light_max)
-                            else:
-                                bpy.data.lights[str('Sun')].energy = 3.0
-
-                            if json_object['Test_cases'][str(test_case)]['distance_parameters']['random_distance']=='True':
-                                distance_min,distance_max = float(json_object['Test_cases'][str(test_case)]['distance_parameters']['min_value']),float(json_object['Test_cases'][str(test_case)]['distance_parameters']['min_value'])
-                                blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value = random.uniform(distance_min,distance_max)
-                                                                  )
-                            else:
-                                camera.constraints['Follow Path'].offset = -38
-                    
-                        elif test_case == 'lighting':
-                            bpy.data.lights['Sun'].energy = new_light_values[i]
-                            blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value=-38
-                                                                  )
-                        elif test_case == 'distance':
-                            blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value = new_distance_values[i]
-                                                                  )
-                            
-                            if json_object['Test_cases']['distance']['light_parameters']['condition'] == "True":
-                                bpy.data.lights['Sun'].energy = new_light_values[i]
-                            elif json_object['Test_cases']['distance']['light_parameters']['condition'] == "False":
-                                bpy.data.lights['Sun'].energy = 3.0
-                            
-                            if json_object['Test_cases']['distance']['blur_parameters']['condition'] == "True":
-                                blender_helper.add_blur_dof(blur_value=new_blur_values[i],focus_background_name='Background_plane')
-                            
-                        elif test_case == 'blur':
-                            bpy.data.lights['Sun'].energy = 3.0
-                            blender_helper.set_camera_postion_on_path(camera_name='Camera',
-                                                                  distance_value=-38
-                                                                  )
-                            blender_helper.add_blur_dof(blur_value=new_blur_values[i],focus_background_name='Background_plane')
-
-                        print(f'\nRendering image {idx+i +1} of {total_render_count}')
-
-                        folder_name = str(dataset_name)+'_'+str(test_case)
-
-                        # Update file path and render
-                        bpy.context.scene.render.filepath = str(OUTPUT_PATH / folder_name / obj_name / 'images' / f'{str(idx)}_{str(i)}.png')
-                        bpy.ops.render.render(write_still=True) # RENDER THE IMAGE
-
-                        json_folder = str(OUTPUT_PATH / folder_name / obj_name / f'json_files')
-                        if not os.path.exists(json_folder):
-                            os.mkdir(json_folder)
-                        json_file_path = os.path.join(json_folder, str(f'{str(idx)}_{str(i)}.json'))    
-                    
-                        # Save the blender parameters and write the regression annotations
-                        self.write_regression_trajectory_annotations(mesh_name=obj_name,mesh2class=class_to_idx,
-                                                                     object_names=obj_names,
-                                                                     json_file_path=json_file_path,
-                                                                     trajectory_num=idx)
-
-                        if str('random_textures') in parameters:
-                            if material != None:
-                                bpy.data.materials.remove(material)
-                            else:
-                                pass
-
-                    # Set the blur value back to normal ie, turn off depth of field
-                    camera.data.dof.use_dof = False
-                # Hide the object again so that it will not appear in the next iteration.
-                obj_to_render.hide_render = True
-                # Update the starting index
-                start_idx += renders_per_object
+        self.render_plan_rows(plan, rows, blender_helper=blender_helper, obj_names=obj_names, class_to_idx=class_to_idx,
+                              output_dir=OUTPUT_PATH, dataset_name=dataset_name, textures_dir=textures_dir,
+                              background_plane=background_plane, camera=camera, journal=journal,
+                              annotation_store=annotation_store)
+        stage_timer.write_report(OUTPUT_PATH, name='stage_timings' if num_shards == 1 else f'stage_timings_shard_{shard_index}')
         
         return None
-    
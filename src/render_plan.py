@@ -0,0 +1,304 @@
+# import modules
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# import custom modules
+from dataset_utils import Dataset_helper
+import trajectory_utils
+
+# Scene values used by the test cases which do not vary them.
+DEFAULT_LIGHT_ENERGY = 3.0
+DEFAULT_PATH_OFFSET = -38.0
+# Number of sequential values the trajectories are drawn from.
+NUM_TRAJECTORY_STEPS = 1000
+
+
+class RenderPlan:
+
+    def __init__(self, columns, seed=None, trajectories=False):
+        """
+        Columnar plan of the scene parameters of every frame of a regression dataset.
+
+        One row per rendered image. The render loop only applies the rows, so a plan can be inspected
+        without rendering (dry-run), saved for reproducing a dataset and split by row range between shards.
+
+        Columns:
+            test_case, obj_name -- str
+            trajectory -- trajectory index, -1 for the datasets without trajectories: int
+            index -- image index in the test case/trajectory: int
+            light_energy -- energy of the sun: float
+            path_offset -- follow path offset of the camera: float
+            dof_distance -- focus distance of the camera, NaN if depth of field is off: float
+            rotation_euler -- XYZ euler angles of the object: (3,) float
+            placement -- (distance fraction, angle) for Blender_helper.random_placement, NaN to keep the object centered: (2,) float
+            texture_id -- index of the background texture in the texture index: int
+            background_hue -- hue of the background color, NaN if the texture is used: float
+            geometry_group -- frames with the same object, pose and background, see get_geometry_groups: int
+            camera_location, camera_rotation -- camera pose which replaces the path offset, only present with a
+                                                "camera_trajectory" other than "path": (3,) and (3,3) float
+
+        Keyword arguments:
+            columns -- dict of column name to np.ndarray
+            seed -- seed the plan was drawn with: int
+            trajectories -- True for the plans of the trajectory datasets: bool
+        """
+        self.columns = columns
+        self.seed = seed
+        self.trajectories = bool(trajectories)
+
+    def __len__(self):
+        return len(self.columns['index'])
+
+    def get_row(self, row):
+        return {name: values[row] for name, values in self.columns.items()}
+
+    def get_shard_rows(self, shard_index, num_shards):
+        """
+        Returns the contiguous range of rows rendered by a shard.
+
+        The bounds are moved to the start of the next run of geometry group, so consecutive frames with the
+        same geometry are rendered by the same shard.
+        """
+        assert 0 <= shard_index < num_shards, "Shard index should be in the range [0, num_shards)"
+        bounds = np.linspace(0, len(self), num_shards + 1).astype(int)
+        if 'geometry_group' in self.columns and len(self) > 0:
+            run_starts = np.append(np.flatnonzero(np.diff(self.columns['geometry_group'])) + 1, len(self))
+            bounds[1:-1] = run_starts[np.searchsorted(run_starts, bounds[1:-1])]
+        return range(bounds[shard_index], bounds[shard_index + 1])
+
+    def group_by_geometry(self):
+        """
+        Returns the plan with the rows of every geometry group next to each other, the groups keep the order of
+        their first row. Only the light, the camera offset and the depth of field change within a run of rows.
+        """
+        order = np.argsort(self.columns['geometry_group'], kind='stable')
+        columns = {name: values[order] for name, values in self.columns.items()}
+        return RenderPlan(columns, seed=self.seed, trajectories=self.trajectories)
+
+    def save(self, plan_path):
+        seed = -1 if self.seed is None else self.seed
+        np.savez(plan_path, seed=np.array(seed), trajectories=np.array(self.trajectories), **self.columns)
+
+    @classmethod
+    def load(cls, plan_path):
+        with np.load(plan_path) as data:
+            columns = {name: data[name] for name in data.files if name not in ('seed', 'trajectories')}
+            seed = int(data['seed'])
+            trajectories = bool(data['trajectories'])
+        if 'geometry_group' not in columns:
+            # Plans saved before the geometry groups were added.
+            columns['geometry_group'] = get_geometry_groups(columns)
+        return cls(columns, seed=None if seed == -1 else seed, trajectories=trajectories)
+
+    def summary(self):
+        """
+        Returns the number of rows and the parameter ranges per test case.
+        """
+        summary = {}
+        for test_case in np.unique(self.columns['test_case']):
+            mask = self.columns['test_case'] == test_case
+            summary[str(test_case)] = {
+                "rows": int(mask.sum()),
+                "light_energy": [float(self.columns['light_energy'][mask].min()),
+                                 float(self.columns['light_energy'][mask].max())],
+                "path_offset": [float(self.columns['path_offset'][mask].min()),
+                                float(self.columns['path_offset'][mask].max())],
+                "dof_frames": int((~np.isnan(self.columns['dof_distance'][mask])).sum()),
+                "geometry_groups": int(len(np.unique(self.columns['geometry_group'][mask]))),
+            }
+            if 'camera_location' in self.columns:
+                distances = np.linalg.norm(self.columns['camera_location'][mask], axis=1)
+                summary[str(test_case)]["camera_distance"] = [float(distances.min()), float(distances.max())]
+        return summary
+
+
+def get_geometry_groups(columns):
+    """
+    Returns the geometry group of every row, numbered in the order of their first row.
+
+    Rows with the same object, rotation, placement, texture and background color only differ in the light, the
+    camera offset on the path and the depth of field, so they can be rendered with persistent data without
+    rebuilding the BVH or reloading the textures.
+
+    returns: (N,) int array
+    """
+    if len(columns['index']) == 0:
+        return np.zeros(0, dtype=int)
+    _, obj_ids = np.unique(columns['obj_name'], return_inverse=True)
+    keys = np.column_stack([obj_ids, columns['texture_id'], columns['background_hue'],
+                            columns['rotation_euler'], columns['placement']]).astype(float)
+    # NaN marks unused values, the used values are never negative.
+    keys[np.isnan(keys)] = -1.0
+    _, first_rows, groups = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    # Renumber the groups in the order of their first row.
+    ranks = np.empty(len(first_rows), dtype=int)
+    ranks[np.argsort(first_rows)] = np.arange(len(first_rows))
+    return ranks[groups.ravel()]
+
+
+def sample_sorted_without_replacement(rng, values, num_groups, size):
+    """
+    Draws size values without replacement for every group and sorts them, as np.random.choice(replace=False)
+    followed by np.sort does for a single trajectory.
+
+    returns: (num_groups*size,) array
+    """
+    assert size <= len(values), f"Cannot draw {size} values from {len(values)} sequential values"
+    picks = np.argsort(rng.random((num_groups, len(values))), axis=1)[:, :size]
+    return np.sort(values[picks], axis=1).ravel()
+
+
+def get_random_values(rng, parameters, random_key, default_value, size):
+    """
+    Returns uniform values between min_value and max_value if parameters[random_key] is "True", else the default.
+    """
+    if parameters[random_key] == 'True':
+        # Same as random.uniform, the limits may be given in decreasing order.
+        min_value, max_value = float(parameters['min_value']), float(parameters['max_value'])
+        return min_value + (max_value - min_value) * rng.random(size)
+    return np.full(size, default_value)
+
+
+def build_render_plan(json_object, obj_names, num_textures, seed=None, num_trajectories=None, group_geometry=False):
+    """
+    Draws the scene parameters of every frame of the regression dataset in one vectorized pass.
+
+    Keyword arguments:
+        json_object -- json object which contains the data from requirements file: dict
+        obj_names -- names of the objects in the scene: list(str)
+        num_textures -- number of background textures in the texture index: int
+        seed -- seed of the random generator: int
+        num_trajectories -- number of trajectories per object, None for the dataset without trajectories: int
+        group_geometry -- order the rows by geometry group, for rendering with persistent data: bool
+
+    returns: RenderPlan
+    """
+    dataset_helper = Dataset_helper()
+    rng = np.random.default_rng(seed)
+    parameters = dataset_helper.get_parameters(json_object=json_object)
+    trajectories = num_trajectories is not None
+    camera_trajectory = json_object.get('camera_trajectory', {"type": "path"})
+
+    blocks = []
+    for test_case, renders_per_object in dataset_helper.get_object_render_per_split(json_object):
+        test_case_parameters = json_object['Test_cases'][str(test_case)]
+        # Number of object setups in the test case, one per object or one per trajectory of an object.
+        num_groups = len(obj_names) * (int(num_trajectories) if trajectories else 1)
+        num_rows = num_groups * renders_per_object
+        index = np.tile(np.arange(renders_per_object), num_groups)
+
+        block = {
+            "test_case": np.full(num_rows, str(test_case)),
+            "obj_name": np.repeat(np.asarray(obj_names, dtype=str), num_rows // len(obj_names)),
+            "index": index,
+            "trajectory": (np.tile(np.repeat(np.arange(int(num_trajectories)), renders_per_object), len(obj_names))
+                           if trajectories else np.full(num_rows, -1)),
+            "light_energy": np.full(num_rows, DEFAULT_LIGHT_ENERGY),
+            "path_offset": np.full(num_rows, DEFAULT_PATH_OFFSET),
+            "dof_distance": np.full(num_rows, np.nan),
+            "background_hue": np.full(num_rows, np.nan),
+        }
+
+        if trajectories:
+            # Rotation, placement and texture are drawn once per trajectory.
+            block["rotation_euler"] = np.repeat(rng.random((num_groups, 3)) * 2 * np.pi, renders_per_object, axis=0)
+            placement = np.stack([rng.random(num_groups), rng.random(num_groups) * 2 * np.pi], axis=1)
+            block["placement"] = np.repeat(placement, renders_per_object, axis=0)
+            block["texture_id"] = np.repeat(rng.integers(num_textures, size=num_groups), renders_per_object)
+        else:
+            block["rotation_euler"] = np.repeat(rng.random((num_groups, 3)) * 2 * np.pi, renders_per_object, axis=0)
+            if 'random_rotation_object' in parameters:
+                block["rotation_euler"] = rng.random((num_rows, 3)) * 2 * np.pi
+            block["placement"] = np.full((num_rows, 2), np.nan)
+            if 'random_placement_object' in parameters:
+                block["placement"] = np.stack([rng.random(num_rows), rng.random(num_rows) * 2 * np.pi], axis=1)
+            # One texture per test case, or one per frame with random_textures.
+            block["texture_id"] = np.full(num_rows, rng.integers(num_textures))
+            if 'random_color' in parameters:
+                block["background_hue"] = rng.random(num_rows)
+            elif 'random_textures' in parameters:
+                block["texture_id"] = rng.integers(num_textures, size=num_rows)
+
+        if test_case == 'normal_training':
+            block["light_energy"] = get_random_values(rng, test_case_parameters['light_parameters'],
+                                                      'random_lighting', DEFAULT_LIGHT_ENERGY, num_rows)
+            block["path_offset"] = get_random_values(rng, test_case_parameters['distance_parameters'],
+                                                     'random_distance', DEFAULT_PATH_OFFSET, num_rows)
+        elif trajectories:
+            num_steps = NUM_TRAJECTORY_STEPS
+            if test_case == 'lighting':
+                light_values = dataset_helper.get_sequential_step_values(test_case, num_elements=num_steps, json_object=json_object)
+                block["light_energy"] = sample_sorted_without_replacement(rng, light_values, num_groups, renders_per_object)
+            elif test_case == 'distance':
+                distance_values = dataset_helper.get_sequential_step_values(test_case, num_elements=num_steps, json_object=json_object)
+                block["path_offset"] = sample_sorted_without_replacement(rng, distance_values, num_groups, renders_per_object)
+                light_parameters = test_case_parameters['light_parameters']
+                if light_parameters['condition'] == 'True':
+                    light_values = dataset_helper.get_sequential_step_values_limits(start_value=float(light_parameters['min_value']),
+                                                                                    stop_value=float(light_parameters['max_value']),
+                                                                                    num_elements=num_steps)
+                    block["light_energy"] = sample_sorted_without_replacement(rng, light_values, num_groups, renders_per_object)
+                blur_parameters = test_case_parameters['blur_parameters']
+                if blur_parameters['condition'] == 'True':
+                    blur_values = dataset_helper.get_sequential_step_values_limits(start_value=float(blur_parameters['min_value']),
+                                                                                   stop_value=float(blur_parameters['max_value']),
+                                                                                   num_elements=num_steps)
+                    block["dof_distance"] = sample_sorted_without_replacement(rng, blur_values, num_groups, renders_per_object)
+            elif test_case == 'blur':
+                blur_values = dataset_helper.get_sequential_step_values(test_case, num_elements=num_steps, json_object=json_object)
+                block["dof_distance"] = sample_sorted_without_replacement(rng, blur_values, num_groups, renders_per_object)
+        else:
+            if test_case in ('lighting', 'distance', 'blur'):
+                sequential_values = dataset_helper.get_sequential_step_values(test_case, num_elements=renders_per_object,
+                                                                              json_object=json_object)[index]
+            if test_case == 'lighting':
+                block["light_energy"] = sequential_values
+            elif test_case == 'distance':
+                block["path_offset"] = sequential_values
+            elif test_case == 'blur':
+                block["dof_distance"] = sequential_values
+
+        if str(camera_trajectory.get('type', 'path')) != 'path':
+            # The same poses for every object (and trajectory), the random hemisphere poses are drawn per frame.
+            if str(camera_trajectory['type']) == 'hemisphere':
+                poses = trajectory_utils.get_camera_poses(camera_trajectory, num_points=num_rows, rng=rng)
+            else:
+                poses = trajectory_utils.get_camera_poses(camera_trajectory, num_points=renders_per_object, rng=rng)[index]
+            block["camera_location"] = poses.locations
+            block["camera_rotation"] = poses.rotations
+
+        blocks.append(block)
+
+    columns = {name: np.concatenate([block[name] for block in blocks]) for name in blocks[0]} if blocks else {}
+    if columns:
+        columns['geometry_group'] = get_geometry_groups(columns)
+    plan = RenderPlan(columns, seed=seed, trajectories=trajectories)
+    return plan.group_by_geometry() if group_geometry and columns else plan
+
+
+if __name__ == '__main__':
+    # Dry-run: draw the plan without blender and print its summary.
+    parser = argparse.ArgumentParser(description="Build the render plan of a regression dataset without rendering.")
+    parser.add_argument('--arguments_file', default='../argument_files/requirements_regression.json')
+    parser.add_argument('--obj_names', nargs='+', required=True)
+    parser.add_argument('--num_textures', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help="path of the .npz file for saving the plan")
+    parser.add_argument('--static_geometry', action='store_true', help="order the rows by geometry group")
+    args = parser.parse_args(sys.argv[1:])
+
+    with open(args.arguments_file, 'r') as json_file:
+        json_object = json.load(json_file)
+
+    num_trajectories = None
+    if json_object["Trajectories"]["condition"] == "True":
+        num_trajectories = int(json_object["Trajectories"]["num_traj"])
+
+    plan = build_render_plan(json_object, obj_names=args.obj_names, num_textures=args.num_textures,
+                             seed=args.seed, num_trajectories=num_trajectories, group_geometry=args.static_geometry)
+    print(json.dumps(plan.summary(), indent=4))
+    if args.output is not None:
+        plan.save(args.output)
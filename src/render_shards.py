@@ -0,0 +1,107 @@
+# import modules
+import argparse
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# import custom modules
+from journal_utils import RenderJournal
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, os.pardir))
+RENDER_SCRIPT = os.path.join(SCRIPT_DIR, 'generate_regression_dataset.py')
+
+
+def run_shard(command, log_path):
+    with open(log_path, 'w') as log_file:
+        # generate_regression_dataset.py resolves the blender_files folder from the working directory.
+        return subprocess.run(command, cwd=SCRIPT_DIR, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def render_shards(arguments_file, num_shards, blender_path, threads_per_shard=None, seed=0):
+    """
+    Renders the regression dataset with num_shards headless blender workers.
+
+    Every worker draws the same render plan from the seed and renders a contiguous row range of it into the
+    <dataset>_<test_case>/<obj>/images|json_files layout of the output folder, the file names of the shards
+    never overlap so the outputs are merged in place.
+
+    Keyword arguments:
+        arguments_file -- path of requirements_regression.json: str
+        num_shards -- number of blender processes: int
+        blender_path -- blender executable: str
+        threads_per_shard -- render threads of every blender process, defaults to cpu count / num_shards: int
+        seed -- seed of the render plan, the dataset does not depend on the number of shards: int
+
+    returns: list of shard summary dicts
+    """
+    with open(arguments_file, 'r') as json_file:
+        json_object = json.load(json_file)
+
+    if str(json_object['output_path']) == "":
+        output_dir = os.path.join(PARENT_DIR, 'results/')
+    else:
+        output_dir = str(json_object['output_path'])
+    log_dir = os.path.join(output_dir, 'shard_logs')
+    os.makedirs(log_dir, exist_ok=True)
+
+    # The journals of all the shards are verified once, before any shard appends to them.
+    if str(json_object.get('resume', 'True')) == 'True' and str(json_object.get('verify_journal', 'False')) == 'True':
+        RenderJournal(output_dir).verify()
+
+    if threads_per_shard is None:
+        threads_per_shard = max(1, (os.cpu_count() or 1) // num_shards)
+
+    shards = []
+    for shard_index in range(num_shards):
+        command = [blender_path, '-b', '-t', str(threads_per_shard), '-P', RENDER_SCRIPT, '--',
+                   '--shard_index', str(shard_index),
+                   '--num_shards', str(num_shards),
+                   '--seed', str(seed),
+                   '--arguments_file', os.path.abspath(arguments_file),
+                   '--yes']
+        shards.append({'shard_index': shard_index,
+                       'command': command,
+                       'log_path': os.path.join(log_dir, f'shard_{shard_index}.log')})
+
+    print(f"Rendering {num_shards} shards with {threads_per_shard} threads each, logs in {log_dir}")
+
+    # Every thread waits on one blender process.
+    with ThreadPoolExecutor(max_workers=num_shards) as executor:
+        processes = list(executor.map(run_shard,
+                                      [shard['command'] for shard in shards],
+                                      [shard['log_path'] for shard in shards]))
+
+    for shard, process in zip(shards, processes):
+        shard['returncode'] = process.returncode
+
+    with open(os.path.join(output_dir, 'render_shards.json'), 'w') as json_file:
+        json.dump({'num_shards': num_shards,
+                   'threads_per_shard': threads_per_shard,
+                   'seed': seed,
+                   'shards': shards}, json_file, indent=4)
+
+    failed = [shard['shard_index'] for shard in shards if shard['returncode'] != 0]
+    if failed:
+        raise RuntimeError(f"Shards {failed} failed, check the logs in {log_dir}")
+
+    return shards
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render the regression dataset with several blender processes.")
+    parser.add_argument('--arguments_file', default=os.path.join(PARENT_DIR, 'argument_files/requirements_regression.json'))
+    parser.add_argument('--num_shards', type=int, default=os.cpu_count())
+    parser.add_argument('--threads_per_shard', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--blender', default='blender', help="blender executable")
+    args = parser.parse_args(sys.argv[1:])
+
+    shards = render_shards(arguments_file=args.arguments_file,
+                           num_shards=args.num_shards,
+                           blender_path=args.blender,
+                           threads_per_shard=args.threads_per_shard,
+                           seed=args.seed)
+    print(f"Rendered {len(shards)} shards")
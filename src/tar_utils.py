@@ -0,0 +1,156 @@
+# import modules
+import glob
+import io
+import json
+import os
+import tarfile
+import time
+
+
+class TarShardWriter:
+
+    def __init__(self, output_dir, prefix='dataset', max_shard_size_mb=1024, shard_index=None, keep_files=False):
+        """
+        Packs the rendered images and their labels into sequential WebDataset style tar shards.
+
+        The files of a sample are stored next to each other as <key>.<extension>, eg: ycb_distance/crackerbox/000123.png
+        and ycb_distance/crackerbox/000123.json. A shard is written to a .tmp file and renamed to
+        <prefix>-000000.tar once it reaches max_shard_size_mb, the unfinished shard of a stopped run is removed
+        on restart. <prefix>_index.json lists the keys, sizes and number of samples of every finished shard.
+
+        Keyword arguments:
+            output_dir -- folder of the tar shards: str
+            prefix -- name of the shard files: str
+            max_shard_size_mb -- size of a shard in MB: float
+            shard_index -- every render shard writes its own tar shards: int
+            keep_files -- keep the rendered images after packing them: bool
+        """
+        self.output_dir = str(output_dir)
+        self.prefix = prefix if shard_index is None else f'{prefix}_shard_{shard_index}'
+        self.max_shard_size = float(max_shard_size_mb) * 1024 * 1024
+        self.keep_files = keep_files
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.index_path = os.path.join(self.output_dir, f'{self.prefix}_index.json')
+        self.index = {"shards": []}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                self.index = json.load(index_file)
+        for temp_path in glob.glob(os.path.join(self.output_dir, f'{self.prefix}-*.tar.tmp')):
+            os.remove(temp_path)
+
+        self.tar = None
+        self.keys = []
+        # Journal records of the samples in the unfinished shard.
+        self.pending = []
+
+    def get_shard_path(self):
+        """
+        Returns the final path of the shard which receives the next sample.
+        """
+        return os.path.join(self.output_dir, f'{self.prefix}-{len(self.index["shards"]):06d}.tar')
+
+    def open_shard(self):
+        self.tar = tarfile.open(self.get_shard_path() + '.tmp', 'w')
+        self.keys = []
+
+    def add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write_sample(self, key, files=None, data=None, on_written=None):
+        """
+        Adds a sample to the current shard.
+
+        Keyword arguments:
+            key -- key of the sample, must not contain dots: str
+            files -- dict of extension to the path of a rendered file, eg: {'png': image_path}
+            data -- dict of extension to a json serializable object, eg: {'json': annotations}
+            on_written -- function called once the shard of the sample is finished, eg: recording the render in the journal
+        """
+        if self.tar is None:
+            self.open_shard()
+
+        for extension, file_path in (files or {}).items():
+            with open(file_path, 'rb') as file:
+                self.add_member(f'{key}.{extension}', file.read())
+        for extension, value in (data or {}).items():
+            self.add_member(f'{key}.{extension}', json.dumps(value).encode('utf-8'))
+        self.keys.append(key)
+        if on_written is not None:
+            self.pending.append(on_written)
+
+        if not self.keep_files:
+            for file_path in (files or {}).values():
+                os.remove(file_path)
+
+        if self.tar.fileobj.tell() >= self.max_shard_size:
+            self.close_shard()
+
+    def add(self, json_file_path, record, on_written=None):
+        """
+        Same interface as annotation_utils.AnnotationStore, packs the image of the record with its annotations.
+
+        The key is the image path relative to the output folder without the images/ folder and the extension.
+        """
+        image_path = str(record['image_path'])
+        relative_path = os.path.relpath(os.path.splitext(image_path)[0], self.output_dir)
+        folder, file_name = os.path.split(relative_path)
+        if os.path.basename(folder) == 'images':
+            folder = os.path.dirname(folder)
+        self.write_sample(os.path.join(folder, file_name).replace(os.sep, '/'),
+                          files={'png': image_path}, data={'json': record}, on_written=on_written)
+
+    def journal_paths(self, image_path):
+        """
+        Returns the paths recorded in the journal for a render, the image is only kept in the tar shard.
+        """
+        return [self.get_shard_path()]
+
+    def close_shard(self):
+        if self.tar is None:
+            return
+        self.tar.close()
+        self.tar = None
+
+        shard_path = self.get_shard_path()
+        with open(shard_path + '.tmp', 'rb') as shard_file:
+            os.fsync(shard_file.fileno())
+        os.replace(shard_path + '.tmp', shard_path)
+        self.index["shards"].append({"path": os.path.basename(shard_path),
+                                     "num_samples": len(self.keys),
+                                     "size": os.path.getsize(shard_path),
+                                     "keys": self.keys})
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self.index, index_file, indent=4)
+        os.replace(temp_path, self.index_path)
+        print(f"Wrote the tar shard {shard_path} with {len(self.keys)} samples")
+
+        pending, self.pending = self.pending, []
+        for on_written in pending:
+            on_written()
+
+    def close(self):
+        self.close_shard()
+
+
+def get_tar_writer(json_object, output_dir, dataset_name='dataset', shard_index=0, num_shards=1):
+    """
+    Returns the tar shard writer if "output_format" is "tar" in the requirements file, else None.
+
+    Keyword arguments:
+        json_object -- json object which contains the data from requirements file: dict
+        output_dir -- output folder of the dataset: str
+        dataset_name -- prefix of the shard files: str
+        shard_index -- index of the render shard: int
+        num_shards -- number of shards rendering the dataset: int
+    """
+    if str(json_object.get('output_format', 'files')) != 'tar':
+        return None
+    return TarShardWriter(output_dir, prefix=dataset_name,
+                          max_shard_size_mb=float(json_object.get('tar_shard_size_mb', 1024)),
+                          shard_index=shard_index if num_shards > 1 else None,
+                          keep_files=str(json_object.get('keep_rendered_files', 'False')) == 'True')
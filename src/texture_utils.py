@@ -0,0 +1,315 @@
+# import modules
+import json
+import os
+import random
+import re
+from collections import OrderedDict
+
+import bpy
+
+
+# Patterns for classifying the image files of a texture folder into the PBR maps.
+TEXTURE_MAP_PATTERNS = {
+    "normal_map": re.compile(r'\w(?:normal|NRM|nor)'),
+    "base_color": re.compile(r'\w(?:basecolor|COL_VAR1|diff|col)'),
+    "disp_map": re.compile(r'\w(?:DISP_4K|height|displacement|disp)'),
+    "metal_map": re.compile(r'\w(?:metallic|REFL|metal)'),
+    "roughness_map": re.compile(r'\w(?:roughness|GLOSS|rough)'),
+}
+
+
+def classify_texture_maps(file_names):
+    """
+    Returns the file name used for every map type, None if the folder has no such map.
+
+    Keyword arguments:
+        file_names -- names of the files in a texture folder: list(str)
+    """
+    texture_maps = {map_type: None for map_type in TEXTURE_MAP_PATTERNS}
+    for file in file_names:
+        for map_type, pattern in TEXTURE_MAP_PATTERNS.items():
+            if pattern.search(file):
+                texture_maps[map_type] = file
+    return texture_maps
+
+
+def get_texture_map_paths(texture_folder):
+    """
+    Returns paths for the images which can be used for image textures.
+
+    The folder is looked up in the texture index of its parent directory.
+
+    Keyword arguments:
+        texture_folder-- Path for the folder containing the images.
+    """
+    texture_dir = os.path.dirname(os.path.normpath(texture_folder))
+    return get_texture_index(texture_dir).get_texture_map_paths(texture_folder)
+
+
+class TextureIndex:
+
+    MANIFEST_NAME = '.texture_manifest.json'
+
+    def __init__(self, texture_dir, manifest_path=None):
+        """
+        Index of the texture folders in a textures directory and their classified PBR maps.
+
+        The classification is persisted as a json manifest next to the textures. On the next
+        start only the folders whose modification time changed are classified again.
+
+        Keyword arguments:
+            texture_dir -- directory containing one folder per texture: str
+            manifest_path -- path of the json manifest, defaults to texture_dir/.texture_manifest.json
+        """
+        self.texture_dir = os.path.normpath(texture_dir)
+        if manifest_path is None:
+            manifest_path = os.path.join(self.texture_dir, self.MANIFEST_NAME)
+        self.manifest_path = manifest_path
+
+        # folder name -> {"mtime": float, "maps": {map type: file name}}
+        self.folders = {}
+        self.texture_paths = []
+        self.update()
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r') as json_file:
+                manifest = json.load(json_file)
+        except (OSError, ValueError):
+            return {}
+        return manifest.get('folders', {})
+
+    def save_manifest(self):
+        manifest = {'texture_dir': self.texture_dir, 'folders': self.folders}
+        # Parallel shards may write the manifest at the same time, each one writes its own temporary file
+        # and replaces the manifest, so readers never see a partial file.
+        temp_path = self.manifest_path + f'.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w') as json_file:
+                json.dump(manifest, json_file, indent=4)
+            os.replace(temp_path, self.manifest_path)
+        except OSError as error:
+            print(f"Could not write the texture manifest {self.manifest_path} : {error}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def update(self):
+        """
+        Scans the textures directory, classifying only new or modified folders.
+        """
+        cached_folders = self.load_manifest()
+        folders = {}
+        changed = False
+
+        with os.scandir(self.texture_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                mtime = entry.stat().st_mtime
+                cached = cached_folders.get(entry.name)
+                if cached is not None and cached.get('mtime') == mtime:
+                    folders[entry.name] = cached
+                else:
+                    maps = classify_texture_maps(os.listdir(entry.path))
+                    folders[entry.name] = {'mtime': mtime, 'maps': maps}
+                    changed = True
+
+        self.folders = folders
+        if changed or set(folders) != set(cached_folders):
+            self.save_manifest()
+        self.texture_paths = [os.path.join(self.texture_dir, name + '/') for name in sorted(folders)]
+
+    def random_texture_path(self):
+        """
+        Returns the path of a random texture folder.
+        """
+        return random.choice(self.texture_paths)
+
+    def get_texture_map_paths(self, texture_folder):
+        """
+        Returns the dict of map type to image path for a texture folder of the index.
+
+        Keyword arguments:
+            texture_folder -- path of the texture folder: str
+        """
+        folder_name = os.path.basename(os.path.normpath(texture_folder))
+        maps = self.folders[folder_name]['maps']
+        folder_path = os.path.join(self.texture_dir, folder_name)
+        return {map_type: (os.path.join(folder_path, file) if file is not None else None)
+                for map_type, file in maps.items()}
+
+
+_texture_indices = {}
+
+
+def get_texture_index(texture_dir):
+    """
+    Returns the texture index of the directory, scanning it on first use.
+
+    Keyword arguments:
+        texture_dir -- directory containing one folder per texture: str
+    """
+    texture_dir = os.path.normpath(texture_dir)
+    if texture_dir not in _texture_indices:
+        _texture_indices[texture_dir] = TextureIndex(texture_dir)
+    return _texture_indices[texture_dir]
+
+
+def build_pbr_material(material_name, texture_dict, scale):
+    """
+    Creates a new material with the PBR image texture node tree.
+
+    Keyword arguments:
+        material_name -- name for the material: str
+        texture_dict -- dict of map type to image path, see get_texture_map_paths
+        scale -- scale of the texture mapping: float
+    """
+    # create a new material with the name.
+    material = bpy.data.materials.new(name=material_name)
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+
+    # Nodes for controlling the texture
+    texture_coordinate = nodes.new(type="ShaderNodeTexCoord")
+    mapping_node = nodes.new(type="ShaderNodeMapping")
+    mapping_node.inputs['Scale'].default_value = (scale, scale, scale)  # Control the scale of the texture
+
+    # Create vector nodes
+    normal_map = nodes.new(type="ShaderNodeNormalMap")
+    displacement_map = nodes.new(type="ShaderNodeDisplacement")
+    invert_node = nodes.new(type="ShaderNodeInvert")
+
+    # Nodes for principled bsdf and output
+    principled_bsdf = nodes['Principled BSDF']
+    material_output = nodes['Material Output']
+
+    # Connect the nodes
+    links.new(texture_coordinate.outputs['UV'], mapping_node.inputs['Vector'])
+
+    def add_image_node(image_path):
+        image_node = nodes.new(type="ShaderNodeTexImage")
+        # Images shared between materials are only loaded once.
+        image_node.image = bpy.data.images.load(image_path, check_existing=True)
+        links.new(mapping_node.outputs['Vector'], image_node.inputs['Vector'])
+        return image_node
+
+    # Base color
+    if texture_dict['base_color'] != None:
+        base_color_img = add_image_node(texture_dict['base_color'])
+        links.new(base_color_img.outputs['Color'], principled_bsdf.inputs['Base Color'])
+
+    # Normal map
+    if texture_dict['normal_map'] != None:
+        normal_img = add_image_node(texture_dict['normal_map'])
+        links.new(normal_img.outputs['Color'], normal_map.inputs['Color'])
+        links.new(normal_map.outputs['Normal'], principled_bsdf.inputs['Normal'])
+
+    # Displacement map
+    if texture_dict['disp_map'] != None:
+        displacement_img = add_image_node(texture_dict['disp_map'])
+        links.new(displacement_img.outputs['Color'], displacement_map.inputs['Height'])
+        links.new(displacement_map.outputs['Displacement'], material_output.inputs['Displacement'])
+
+    # Roughness map
+    if texture_dict['roughness_map'] != None:
+        roughness_img = add_image_node(texture_dict['roughness_map'])
+        links.new(roughness_img.outputs['Color'], invert_node.inputs['Color'])
+        links.new(invert_node.outputs['Color'], principled_bsdf.inputs['Roughness'])
+
+    # Metal map
+    if texture_dict['metal_map'] != None:
+        metallic_img = add_image_node(texture_dict['metal_map'])
+        links.new(metallic_img.outputs['Color'], principled_bsdf.inputs['Metallic'])
+
+    # Set material final output
+    links.new(principled_bsdf.outputs['BSDF'], material_output.inputs['Surface'])
+
+    return material
+
+
+def remove_material(material):
+    """
+    Removes the material along with the images which are not used anywhere else.
+    """
+    images = [node.image for node in material.node_tree.nodes
+              if node.type == 'TEX_IMAGE' and node.image is not None]
+    bpy.data.materials.remove(material)
+    for image in images:
+        if image.users == 0:
+            bpy.data.images.remove(image)
+
+
+def assign_material(obj, material):
+    """
+    Sets the material in the active slot of the object, a slot is only added if there is none.
+    """
+    if len(obj.material_slots) == 0:
+        obj.data.materials.append(material)
+    obj.active_material = material
+
+
+class MaterialPool:
+
+    def __init__(self, max_materials=16):
+        """
+        Pool of PBR materials, one per texture folder.
+
+        A material is built the first time its folder is drawn and reused afterwards, only the
+        texture scale is updated. The least recently used material is removed together with its
+        images once the pool holds more than max_materials.
+
+        Keyword arguments:
+            max_materials -- maximum number of materials kept in the pool: int
+        """
+        self.max_materials = int(max_materials)
+        # texture folder -> material name, the materials are looked up again since
+        # clearing the scene may have removed them.
+        self.materials = OrderedDict()
+
+    def get_material(self, texture_path, scale):
+        """
+        Returns the material for the texture folder, building it on first use.
+
+        Keyword arguments:
+            texture_path -- path of the texture folder: str
+            scale -- scale of the texture mapping: float
+        """
+        material = None
+        if texture_path in self.materials:
+            material = bpy.data.materials.get(self.materials[texture_path])
+
+        if material is None:
+            material_name = str(texture_path.split('/')[-2])
+            texture_dict = get_texture_map_paths(texture_folder=texture_path)
+            material = build_pbr_material(material_name, texture_dict, scale)
+            self.materials[texture_path] = material.name
+            self.evict()
+        else:
+            material.node_tree.nodes['Mapping'].inputs['Scale'].default_value = (scale, scale, scale)
+
+        self.materials.move_to_end(texture_path)
+        return material
+
+    def evict(self):
+        """
+        Removes the least recently used materials above the pool size.
+        """
+        while len(self.materials) > self.max_materials:
+            _, material_name = self.materials.popitem(last=False)
+            material = bpy.data.materials.get(material_name)
+            if material is not None:
+                remove_material(material)
+
+    def clear(self):
+        while self.materials:
+            _, material_name = self.materials.popitem(last=False)
+            material = bpy.data.materials.get(material_name)
+            if material is not None:
+                remove_material(material)
+
+
+# Shared material pool for the background textures.
+material_pool = MaterialPool()
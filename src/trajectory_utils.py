@@ -0,0 +1,286 @@
+# import modules
+import numpy as np
+
+# Camera trajectory types of the requirements file, "path" keeps the Follow Path constraint of the camera.
+TRAJECTORY_TYPES = ('path', 'rings', 'fibonacci', 'hemisphere', 'spline')
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+
+class CameraPoses:
+
+    def __init__(self, locations, rotations):
+        """
+        Batch of camera poses as numpy arrays.
+
+        The rotations are camera to world rotations in the blender convention, the camera looks down its local
+        -Z axis with Y up, so the pose of frame i is the matrix_world [[R, t], [0, 1]] of the camera.
+
+        Keyword arguments:
+            locations -- camera locations in world space: np.ndarray (N,3)
+            rotations -- camera to world rotations: np.ndarray (N,3,3)
+        """
+        self.locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        self.rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __getitem__(self, index):
+        return CameraPoses(self.locations[index], self.rotations[index])
+
+    def get_matrices_world(self):
+        """
+        Returns the camera to world matrices: np.ndarray (N,4,4)
+        """
+        matrices = np.tile(np.eye(4), (len(self), 1, 1))
+        matrices[:, :3, :3] = self.rotations
+        matrices[:, :3, 3] = self.locations
+        return matrices
+
+    def get_world_to_camera(self):
+        """
+        Returns the world to camera matrices of the blender camera frame: np.ndarray (N,4,4)
+        """
+        matrices = np.tile(np.eye(4), (len(self), 1, 1))
+        rotations_t = self.rotations.transpose(0, 2, 1)
+        matrices[:, :3, :3] = rotations_t
+        matrices[:, :3, 3] = -(rotations_t @ self.locations[:, :, None])[:, :, 0]
+        return matrices
+
+    def get_quaternions(self):
+        """
+        Returns the rotations as (w, x, y, z) quaternions, as matrix_world.decompose() does: np.ndarray (N,4)
+        """
+        return rotation_to_quaternion(self.rotations)
+
+    def get_distances(self, target=(0.0, 0.0, 0.0)):
+        """
+        Returns the distance of every camera to the target point: np.ndarray (N,)
+        """
+        return np.linalg.norm(self.locations - np.asarray(target, dtype=np.float64), axis=1)
+
+
+def look_at_rotations(locations, targets, up=(0.0, 0.0, 1.0)):
+    """
+    Returns the camera to world rotations of cameras at locations looking at the targets, the vectorized
+    equivalent of direction.to_track_quat('-Z', 'Y').
+
+    A camera looking straight along the up axis gets its image Y axis from the world Y axis instead.
+
+    Keyword arguments:
+        locations -- camera locations: np.ndarray (N,3)
+        targets -- points the cameras look at: np.ndarray (N,3) or (3,)
+        up -- world up axis: tuple
+
+    returns: np.ndarray (N,3,3)
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    z_axes = locations - np.asarray(targets, dtype=np.float64)
+    z_axes /= np.linalg.norm(z_axes, axis=1, keepdims=True)
+
+    up_axes = np.broadcast_to(np.asarray(up, dtype=np.float64), z_axes.shape).copy()
+    parallel = np.linalg.norm(np.cross(up_axes, z_axes), axis=1) < 1e-6
+    up_axes[parallel] = (0.0, 1.0, 0.0)
+
+    x_axes = np.cross(up_axes, z_axes)
+    x_axes /= np.linalg.norm(x_axes, axis=1, keepdims=True)
+    y_axes = np.cross(z_axes, x_axes)
+    return np.stack([x_axes, y_axes, z_axes], axis=2)
+
+
+def rotation_to_quaternion(rotations):
+    """
+    Returns the (w, x, y, z) quaternions of the rotation matrices with a positive w: np.ndarray (N,4)
+    """
+    R = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    trace = np.trace(R, axis1=1, axis2=2)
+    # Squared magnitudes of the components, the largest one is the most accurate to divide by.
+    squares = np.stack([1 + trace,
+                        1 + R[:, 0, 0] - R[:, 1, 1] - R[:, 2, 2],
+                        1 - R[:, 0, 0] + R[:, 1, 1] - R[:, 2, 2],
+                        1 - R[:, 0, 0] - R[:, 1, 1] + R[:, 2, 2]], axis=1)
+    largest = squares.argmax(axis=1)
+    rows = np.arange(len(R))
+    scale = 2 * np.sqrt(np.maximum(squares[rows, largest], 1e-12))
+
+    # Sums and differences of the off diagonal elements give the products of two components.
+    w_x, w_y, w_z = R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]
+    x_y, x_z, y_z = R[:, 0, 1] + R[:, 1, 0], R[:, 0, 2] + R[:, 2, 0], R[:, 1, 2] + R[:, 2, 1]
+    products = np.stack([np.stack([squares[:, 0], w_x, w_y, w_z], axis=1),
+                         np.stack([w_x, squares[:, 1], x_y, x_z], axis=1),
+                         np.stack([w_y, x_y, squares[:, 2], y_z], axis=1),
+                         np.stack([w_z, x_z, y_z, squares[:, 3]], axis=1)], axis=1)
+    quaternions = products[rows, largest] / scale[:, None]
+    return quaternions * np.where(quaternions[:, :1] < 0, -1.0, 1.0)
+
+
+def get_ring_poses(num_points, radius, heights, target=(0.0, 0.0, 0.0), center=(0.0, 0.0, 0.0)):
+    """
+    Returns poses on horizontal rings around the center, the points are split evenly between the rings.
+
+    Keyword arguments:
+        num_points -- total number of poses: int
+        radius -- radius of the rings, one value or one per ring: float or list(float)
+        heights -- z coordinate of every ring above the center: list(float)
+        target -- point the cameras look at: tuple
+        center -- center of the rings: tuple
+
+    returns: CameraPoses
+    """
+    heights = np.atleast_1d(np.asarray(heights, dtype=np.float64))
+    radii = np.broadcast_to(np.asarray(radius, dtype=np.float64), heights.shape)
+    ring_sizes = [len(ring) for ring in np.array_split(np.arange(int(num_points)), len(heights))]
+
+    locations = []
+    for ring_radius, height, ring_size in zip(radii, heights, ring_sizes):
+        # The last point does not repeat the first one.
+        theta = np.linspace(0, 2 * np.pi, ring_size, endpoint=False)
+        locations.append(np.column_stack([ring_radius * np.cos(theta), ring_radius * np.sin(theta), np.full(ring_size, height)]))
+    locations = np.concatenate(locations) + np.asarray(center, dtype=np.float64)
+    return CameraPoses(locations, look_at_rotations(locations, target))
+
+
+def get_fibonacci_poses(num_points, radius, min_elevation=-90.0, target=(0.0, 0.0, 0.0), center=(0.0, 0.0, 0.0)):
+    """
+    Returns evenly spread poses on spherical shells (Fibonacci lattice), the points are split evenly between the shells.
+
+    Keyword arguments:
+        num_points -- total number of poses: int
+        radius -- radius of the shells: float or list(float)
+        min_elevation -- lowest elevation in degrees, eg: 0 for the upper hemisphere: float
+        target -- point the cameras look at: tuple
+        center -- center of the shells: tuple
+
+    returns: CameraPoses
+    """
+    radii = np.atleast_1d(np.asarray(radius, dtype=np.float64))
+    z_min = np.sin(np.radians(min_elevation))
+
+    locations = []
+    for shell_radius, shell in zip(radii, np.array_split(np.arange(int(num_points)), len(radii))):
+        # Equal area steps in z between z_min and the pole.
+        steps = np.arange(len(shell))
+        z = 1 - (steps + 0.5) / max(len(shell), 1) * (1 - z_min)
+        phi = steps * GOLDEN_ANGLE
+        ring = np.sqrt(1 - z ** 2)
+        locations.append(shell_radius * np.column_stack([ring * np.cos(phi), ring * np.sin(phi), z]))
+    locations = np.concatenate(locations) + np.asarray(center, dtype=np.float64)
+    return CameraPoses(locations, look_at_rotations(locations, target))
+
+
+def get_hemisphere_poses(num_points, min_radius, max_radius, min_elevation=0.0, target=(0.0, 0.0, 0.0),
+                         center=(0.0, 0.0, 0.0), rng=None):
+    """
+    Returns random poses uniformly distributed over the directions above min_elevation.
+
+    Keyword arguments:
+        num_points -- number of poses: int
+        min_radius, max_radius -- range of the distance to the center: float
+        min_elevation -- lowest elevation in degrees: float
+        target -- point the cameras look at: tuple
+        center -- center of the hemisphere: tuple
+        rng -- np.random.Generator, a new one if None
+
+    returns: CameraPoses
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    num_points = int(num_points)
+    z = rng.uniform(np.sin(np.radians(min_elevation)), 1.0, num_points)
+    phi = rng.uniform(0, 2 * np.pi, num_points)
+    radii = rng.uniform(float(min_radius), float(max_radius), num_points)
+    ring = np.sqrt(1 - z ** 2)
+    directions = np.column_stack([ring * np.cos(phi), ring * np.sin(phi), z])
+
+    locations = radii[:, None] * directions + np.asarray(center, dtype=np.float64)
+    return CameraPoses(locations, look_at_rotations(locations, target))
+
+
+def get_spline_points(control_points, num_points, closed=False, samples_per_segment=64):
+    """
+    Returns num_points points at equal arc length steps along the Catmull-Rom spline through the control points.
+
+    returns: np.ndarray (num_points,3)
+    """
+    control_points = np.asarray(control_points, dtype=np.float64).reshape(-1, 3)
+    assert len(control_points) >= 2, "The spline needs at least two control points"
+    if closed:
+        padded = np.concatenate([control_points[-1:], control_points, control_points[:2]])
+    else:
+        # The end points are repeated, so the spline starts and ends at the first and last control point.
+        padded = np.concatenate([control_points[:1], control_points, control_points[-1:]])
+    num_segments = len(padded) - 3
+
+    # Dense samples of every segment, p1 + t*(..) in the uniform Catmull-Rom form.
+    t = np.linspace(0, 1, samples_per_segment, endpoint=False)[None, :, None]
+    p0, p1, p2, p3 = (padded[i:i + num_segments, None, :] for i in range(4))
+    dense = 0.5 * (2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2 + (3 * p1 - p0 - 3 * p2 + p3) * t ** 3)
+    dense = np.concatenate([dense.reshape(-1, 3), padded[-2:-1]])
+
+    arc_length = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(dense, axis=0), axis=1))])
+    steps = np.linspace(0, arc_length[-1], int(num_points), endpoint=not closed)
+    return np.column_stack([np.interp(steps, arc_length, dense[:, axis]) for axis in range(3)])
+
+
+def get_spline_poses(num_points, control_points, closed=False, target=(0.0, 0.0, 0.0), center=(0.0, 0.0, 0.0)):
+    """
+    Returns poses along the spline through the control points, looking at the target.
+
+    Keyword arguments:
+        num_points -- number of poses: int
+        control_points -- control points of the spline relative to the center: np.ndarray (M,3)
+        closed -- the spline is a loop through the last and the first control point: bool
+        target -- point the cameras look at: tuple
+        center -- offset of the control points: tuple
+
+    returns: CameraPoses
+    """
+    locations = get_spline_points(control_points, num_points, closed=closed) + np.asarray(center, dtype=np.float64)
+    return CameraPoses(locations, look_at_rotations(locations, target))
+
+
+def get_camera_poses(parameters, num_points, rng=None):
+    """
+    Returns the camera poses of the "camera_trajectory" parameters of the requirements file, None for "path".
+
+    Keyword arguments:
+        parameters -- dict with "type" and the parameters of the trajectory, eg: {"type": "rings", "radius": 1.5, "heights": [1.0, 1.6]}
+        num_points -- number of poses: int
+        rng -- np.random.Generator for "hemisphere"
+
+    returns: CameraPoses
+    """
+    trajectory_type = str(parameters.get('type', 'path'))
+    assert trajectory_type in TRAJECTORY_TYPES, f"camera_trajectory type should be one of {TRAJECTORY_TYPES}"
+    target = [float(value) for value in parameters.get('target', [0.0, 0.0, 0.0])]
+    center = [float(value) for value in parameters.get('center', [0.0, 0.0, 0.0])]
+
+    if trajectory_type == 'rings':
+        return get_ring_poses(num_points, radius=parameters.get('radius', 1.5), heights=parameters.get('heights', [1.6]),
+                              target=target, center=center)
+    if trajectory_type == 'fibonacci':
+        return get_fibonacci_poses(num_points, radius=parameters.get('radius', 1.5),
+                                   min_elevation=float(parameters.get('min_elevation', 10.0)), target=target, center=center)
+    if trajectory_type == 'hemisphere':
+        return get_hemisphere_poses(num_points, min_radius=float(parameters.get('min_radius', 1.0)),
+                                    max_radius=float(parameters.get('max_radius', 2.0)),
+                                    min_elevation=float(parameters.get('min_elevation', 10.0)),
+                                    target=target, center=center, rng=rng)
+    if trajectory_type == 'spline':
+        return get_spline_poses(num_points, control_points=parameters['control_points'],
+                                closed=str(parameters.get('closed', 'False')) == 'True', target=target, center=center)
+    return None
+
+
+def set_camera_pose(camera, location, rotation):
+    """
+    Sets the matrix_world of the camera to a pose of CameraPoses, the camera constraints are muted so that the
+    pose is used as it is. The matrix is set directly, no depsgraph update is needed before reading it back.
+    """
+    from mathutils import Matrix
+
+    for constraint in camera.constraints:
+        constraint.mute = True
+    matrix_world = np.eye(4)
+    matrix_world[:3, :3] = rotation
+    matrix_world[:3, 3] = location
+    camera.matrix_world = Matrix(matrix_world.tolist())
@@ -0,0 +1,206 @@
+# import modules
+import numpy as np
+import skfuzzy
+from skfuzzy import control as ctrl
+
+
+def build_distance_control_system():
+    """
+    Fuzzy rule set mapping the camera focal length (distance) to an uncertainty value.
+
+    returns: (ControlSystem, antecedent label, antecedent universe)
+    """
+    # Range of the domains
+    distance = ctrl.Antecedent(np.arange(40, 110, 1), 'distance')
+    uncertainty = ctrl.Consequent(np.arange(0, 2.7, 0.01), 'uncertainty')
+
+    # Membership function for distance
+    distance['far'] = skfuzzy.trimf(distance.universe, [40, 40, 55])
+    distance['little_far'] = skfuzzy.trimf(distance.universe, [50, 55, 60])
+    distance['normal'] = skfuzzy.trimf(distance.universe, [58, 65, 72])
+    distance['little_near'] = skfuzzy.trimf(distance.universe, [70, 80, 90])
+    distance['near'] = skfuzzy.trimf(distance.universe, [80, 110, 110])
+
+    # Membership function for Uncertainty
+    uncertainty['Low'] = skfuzzy.zmf(uncertainty.universe, 0, 0.3)
+    uncertainty['Little_high'] = skfuzzy.gaussmf(uncertainty.universe, 0.8, 0.05)
+    uncertainty['High'] = skfuzzy.smf(uncertainty.universe, 1.0, 2.7)
+    uncertainty['Medium'] = skfuzzy.gaussmf(uncertainty.universe, 0.5, 0.05)
+
+    # Defining the fuzzy rules
+    rule1 = ctrl.Rule(distance['far'], uncertainty['High'])
+    rule2 = ctrl.Rule(distance['normal'], uncertainty['Low'])
+    rule3 = ctrl.Rule(distance['little_far'], uncertainty['Little_high'])
+    rule4 = ctrl.Rule(distance['near'], uncertainty['High'])
+    rule5 = ctrl.Rule(distance['little_near'], uncertainty['Little_high'])
+
+    control_system = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5])
+    return control_system, 'distance', distance.universe
+
+
+def build_lighting_control_system():
+    """
+    Fuzzy rule set mapping the light energy to an uncertainty value.
+
+    returns: (ControlSystem, antecedent label, antecedent universe)
+    """
+    # Range of the domains
+    light = ctrl.Antecedent(np.arange(0, 25, 0.1), 'light')
+    uncertainty = ctrl.Consequent(np.arange(0, 1.0, 0.01), 'uncertainty')
+
+    # Membership function for Light
+    light['dark'] = skfuzzy.trimf(light.universe, [0, 0, 2])
+    light['little_dark'] = skfuzzy.trimf(light.universe, [1.5, 2.5, 3.5])
+    light['normal'] = skfuzzy.trimf(light.universe, [2.8, 6, 8])
+    light['little_bright'] = skfuzzy.trimf(light.universe, [7.5, 11, 16])
+    light['bright'] = skfuzzy.trimf(light.universe, [15, 19, 25])
+
+    # Membership function for Uncertainty
+    uncertainty['Low'] = skfuzzy.trimf(uncertainty.universe, [0, 0, 0.5])
+    uncertainty['High'] = skfuzzy.trimf(uncertainty.universe, [0.6, 1, 1])
+
+    # Defining the fuzzy rules
+    rule1 = ctrl.Rule(light['bright'], uncertainty['High'])
+    rule2 = ctrl.Rule(light['normal'], uncertainty['Low'])
+    rule3 = ctrl.Rule(light['little_bright'], uncertainty['High'])
+    rule4 = ctrl.Rule(light['dark'], uncertainty['High'])
+    rule5 = ctrl.Rule(light['little_dark'], uncertainty['High'])
+
+    control_system = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5])
+    return control_system, 'light', light.universe
+
+
+RULE_SETS = {
+    'distance': build_distance_control_system,
+    'lighting': build_lighting_control_system,
+}
+
+
+class FuzzyUncertaintyTable:
+
+    def __init__(self, rule_set_builder, tolerance=1e-3, max_refinements=8):
+        """
+        Compiles a single input fuzzy rule set into an interpolated lookup table.
+
+        The table starts from the antecedent universe and intervals are bisected until linear
+        interpolation matches the skfuzzy centroid output within the tolerance, afterwards
+        evaluation is a single np.interp call.
+
+        Keyword arguments:
+            rule_set_builder -- function returning (ControlSystem, antecedent label, universe)
+            tolerance -- maximum absolute error at the interval midpoints: float
+            max_refinements -- maximum number of bisections per interval: int
+        """
+        self.rule_set_builder = rule_set_builder
+        self.tolerance = float(tolerance)
+        self.max_refinements = int(max_refinements)
+
+        self.control_system, self.antecedent_label, universe = rule_set_builder()
+        self.min_value = float(np.min(universe))
+        self.max_value = float(np.max(universe))
+
+        self.grid, self.table = self.compile(np.asarray(universe, dtype=np.float64))
+
+    def simulate(self, value):
+        """
+        Returns the skfuzzy centroid output for a single input value.
+        """
+        simulation = ctrl.ControlSystemSimulation(self.control_system)
+        simulation.input[self.antecedent_label] = value
+        simulation.compute()
+        return simulation.output['uncertainty']
+
+    def compile(self, universe):
+        """
+        Runs the control system over the universe and refines the grid where needed.
+
+        returns: (grid, table) arrays
+        """
+        simulation = ctrl.ControlSystemSimulation(self.control_system, cache=False)
+
+        def simulate_all(values):
+            outputs = np.empty_like(values)
+            for idx, value in enumerate(values):
+                simulation.input[self.antecedent_label] = value
+                simulation.compute()
+                outputs[idx] = simulation.output['uncertainty']
+            return outputs
+
+        grid = universe
+        table = simulate_all(grid)
+        # Only intervals which failed the previous check are bisected again.
+        to_refine = np.ones(len(grid) - 1, dtype=bool)
+
+        for _ in range(self.max_refinements):
+            if not to_refine.any():
+                break
+            left = np.flatnonzero(to_refine)
+            midpoints = (grid[left] + grid[left + 1]) / 2
+            outputs = simulate_all(midpoints)
+            interpolated = (table[left] + table[left + 1]) / 2
+            failed = np.abs(outputs - interpolated) > self.tolerance
+
+            grid = np.insert(grid, left + 1, midpoints)
+            table = np.insert(table, left + 1, outputs)
+
+            # Both halves of a failed interval are checked in the next pass.
+            to_refine = np.zeros(len(grid) - 1, dtype=bool)
+            new_left = left + np.arange(len(left))
+            to_refine[new_left[failed]] = True
+            to_refine[new_left[failed] + 1] = True
+
+        return grid, table
+
+    def evaluate(self, values):
+        """
+        Returns the uncertainty values for the given inputs.
+
+        Inputs outside the antecedent universe are clipped to its bounds, as skfuzzy does.
+
+        Keyword arguments:
+            values -- input values: float or np.ndarray
+        """
+        return np.interp(values, self.grid, self.table)
+
+    def verify(self, num_samples=500, tolerance=None, seed=0):
+        """
+        Compares the table against the skfuzzy simulation on random inputs, raises a RuntimeError when the
+        error exceeds the tolerance.
+
+        Keyword arguments:
+            num_samples -- number of random inputs to check: int
+            tolerance -- maximum allowed absolute error, defaults to the compile tolerance: float
+            seed -- seed for the random inputs: int
+
+        returns: maximum absolute error
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+        rng = np.random.default_rng(seed)
+        values = rng.uniform(self.min_value, self.max_value, size=int(num_samples))
+        expected = np.array([self.simulate(value) for value in values])
+        max_error = float(np.max(np.abs(self.evaluate(values) - expected)))
+        if max_error > tolerance:
+            raise RuntimeError(f"Lookup table error {max_error} exceeds tolerance {tolerance}")
+        return max_error
+
+
+_uncertainty_tables = {}
+
+
+def get_uncertainty_table(name):
+    """
+    Returns the compiled lookup table for the rule set, compiling it on first use.
+
+    Keyword arguments:
+        name -- name of the rule set, 'distance' or 'lighting': str
+    """
+    if name not in _uncertainty_tables:
+        _uncertainty_tables[name] = FuzzyUncertaintyTable(RULE_SETS[name])
+    return _uncertainty_tables[name]
+
+
+if __name__ == '__main__':
+    for rule_set_name in RULE_SETS:
+        max_error = get_uncertainty_table(rule_set_name).verify()
+        print(f"{rule_set_name} lookup table max error : {max_error}")
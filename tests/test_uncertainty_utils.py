@@ -0,0 +1,49 @@
+# import modules
+import os
+import sys
+
+import numpy as np
+import pytest
+from skfuzzy import control as ctrl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from uncertainty_utils import RULE_SETS, get_uncertainty_table
+
+TOLERANCE = 1e-3
+NUM_SAMPLES = 2000
+
+
+def simulate(control_system, antecedent_label, values):
+    """
+    Returns the skfuzzy centroid output of a fresh ControlSystemSimulation for every input value.
+    """
+    simulation = ctrl.ControlSystemSimulation(control_system)
+    outputs = []
+    for value in values:
+        simulation.input[antecedent_label] = value
+        simulation.compute()
+        outputs.append(simulation.output['uncertainty'])
+    return np.array(outputs)
+
+
+@pytest.mark.parametrize('name', sorted(RULE_SETS))
+def test_table_matches_skfuzzy(name):
+    table = get_uncertainty_table(name)
+    control_system, antecedent_label, universe = RULE_SETS[name]()
+
+    # Dense grid over the whole universe, the endpoints included.
+    values = np.linspace(np.min(universe), np.max(universe), NUM_SAMPLES)
+    assert values[0] == np.min(universe) and values[-1] == np.max(universe)
+
+    expected = simulate(control_system, antecedent_label, values)
+    errors = np.abs(table.evaluate(values) - expected)
+    assert errors.max() <= TOLERANCE, f"{name} table error {errors.max()} at input {values[errors.argmax()]}"
+
+
+@pytest.mark.parametrize('name', sorted(RULE_SETS))
+def test_verify_raises_above_tolerance(name):
+    table = get_uncertainty_table(name)
+    assert table.verify(num_samples=50) <= TOLERANCE
+    with pytest.raises(RuntimeError):
+        table.verify(num_samples=50, tolerance=-1.0)